@@ -0,0 +1,232 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import mmap
+import glob
+import argparse
+
+# The artifact cache is shared with the ROM generator
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rom"))
+from artifact_cache import Artifact_Cache, DEFAULT_CACHE_FOLDER, DEFAULT_MAX_SIZE, source_version
+
+
+# Number of bytes in an EDID block
+EDID_BLOCK_SIZE = 128
+
+# The ROM of the EDID in the FPGA always holds 256 bytes, the unused bytes are filled with zeros
+EDID_ROM_SIZE = 256
+
+# Every EDID starts with this header
+EDID_HEADER = bytes([0x00, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0x00])
+
+# Output formats, mapped to the extension of the file
+# hex is read by the ISE design, data by the Digilent IP in Vivado and mem by $readmemh in i2c_edid.v
+FORMATS = {
+    "hex": ".hex",
+    "data": ".data",
+    "mem": ".mem"
+}
+
+# Number of bytes on each line of the mem format
+MEM_BYTES_PER_LINE = 16
+
+# Text of every byte value, so each byte is only looked up once
+HEX_TABLE = [f"{byte:02x}" for byte in range(256)]
+BIN_TABLE = [f"{byte:08b}" for byte in range(256)]
+
+
+# Get the byte that makes the sum of the block a multiple of 256
+def Checksum(block : bytes) -> int:
+    return -sum(block[:EDID_BLOCK_SIZE - 1]) & 0xff
+
+
+# Check that every 128 byte block of the EDID sums up to a multiple of 256
+def ValidateEDID(edid : bytes) -> bool:
+    if len(edid) == 0 or len(edid) % EDID_BLOCK_SIZE:
+        return False
+    if edid[:len(EDID_HEADER)] != EDID_HEADER:
+        return False
+
+    return all(sum(edid[idx:idx + EDID_BLOCK_SIZE]) & 0xff == 0 for idx in range(0, len(edid), EDID_BLOCK_SIZE))
+
+
+# Convert the EDID to the text of every format, padded to the size of the ROM, in a single pass over the bytes
+def ConvertBytes(edid : bytes, formats : list, source : str = "") -> dict:
+    if len(edid) > EDID_ROM_SIZE:
+        raise ValueError(f"{len(edid)} bytes does not fit the {EDID_ROM_SIZE} byte EDID ROM")
+
+    hex_lines = [] if "hex" in formats else None
+    data_lines = [] if "data" in formats else None
+    mem_lines = [f"// EDID {source}", "@00"] if "mem" in formats else None
+    mem_row = []
+
+    for idx in range(EDID_ROM_SIZE):
+        byte = edid[idx] if idx < len(edid) else 0
+
+        if hex_lines is not None:
+            hex_lines.append(HEX_TABLE[byte])
+        if data_lines is not None:
+            data_lines.append(BIN_TABLE[byte])
+        if mem_lines is not None:
+            mem_row.append(HEX_TABLE[byte])
+            if len(mem_row) == MEM_BYTES_PER_LINE:
+                mem_lines.append(" ".join(mem_row))
+                mem_row = []
+
+    text = {}
+    if hex_lines is not None:
+        text["hex"] = "".join(line + "\n" for line in hex_lines)
+    # The data file has no newline after the last byte
+    if data_lines is not None:
+        text["data"] = "\n".join(data_lines)
+    if mem_lines is not None:
+        text["mem"] = "".join(line + "\n" for line in mem_lines)
+
+    return text
+
+
+# Write the EDID in every format, to the name followed by the extension of the format
+def WriteFormats(edid : bytes, name : str, formats : list, source : str = "") -> list:
+    files = []
+
+    for fmt, text in ConvertBytes(edid, formats, source).items():
+        filename = name + FORMATS[fmt]
+        with open(filename, "w") as f:
+            f.write(text)
+        files.append(filename)
+
+    return files
+
+
+# Convert a single EDID binary, memory mapping the file instead of reading it
+# With a cache, the files are copied from it when the same EDID was converted to the same formats before
+def ConvertFile(filename : str, name : str, formats : list, cache : Artifact_Cache = None) -> list:
+    with open(filename, "rb") as f:
+        # An empty file can not be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("the file is empty")
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as edid:
+            if not ValidateEDID(edid):
+                print(f"Warning: {filename} is not a valid EDID, the header or a checksum is wrong")
+            if cache is None:
+                return WriteFormats(edid, name, formats, os.path.basename(filename))
+
+            # The name of the source ends up in the mem file, so it is part of the key
+            formats = sorted(set(formats))
+            key = cache.key("edid_convert", source_version(os.path.abspath(__file__)), bytes(edid), formats, os.path.basename(filename))
+            targets = {fmt: name + FORMATS[fmt] for fmt in formats}
+            if cache.fetch(key, targets) is None:
+                WriteFormats(edid, name, formats, os.path.basename(filename))
+                cache.store(key, targets)
+            return list(targets.values())
+
+
+# Expand the files and directories into a list of (input, output name) pairs
+# Directories are searched recursively for .bin files, keeping the folder structure below the directory
+def CollectInputs(paths : list, output : str = None) -> list:
+    inputs = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(glob.glob(os.path.join(path, "**", "*.bin"), recursive=True))
+            names = [os.path.relpath(match, path) for match in matches]
+        else:
+            matches = [path]
+            names = [os.path.basename(path)]
+
+        for match, name in zip(matches, names):
+            name = os.path.splitext(name)[0]
+            # Without an output folder, the files are written next to the input
+            if output is None:
+                inputs.append((match, os.path.join(os.path.dirname(match), os.path.basename(name))))
+            else:
+                inputs.append((match, os.path.join(output, name)))
+
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="edid_convert",
+        description="Convert EDID binaries to the files used by the ISE and Vivado designs."
+    )
+
+    parser.add_argument(
+        "inputs",
+        type=str,
+        nargs="+",
+        help="EDID binaries, or directories searched for .bin files."
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        action="append",
+        choices=sorted(FORMATS),
+        help="A format to write, can be given several times. Writes every format by default.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The output folder, the files are written next to the inputs by default.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--cache",
+        type=str,
+        nargs="?",
+        const=DEFAULT_CACHE_FOLDER,
+        help=f"Copy the files from a cache when the same EDID was converted before. Defaults to {DEFAULT_CACHE_FOLDER}.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        help=f"The size of the cache in MB, the least recently used files are removed past it. Defaults to {DEFAULT_MAX_SIZE >> 20} MB.",
+        required=False,
+        default=DEFAULT_MAX_SIZE >> 20
+    )
+
+    args = parser.parse_args()
+    formats = args.format or list(FORMATS)
+    cache = Artifact_Cache(args.cache, int(args.cache_size * (1 << 20))) if args.cache else None
+
+    inputs = CollectInputs(args.inputs, args.output)
+    if not inputs:
+        print("Error: no EDID files found")
+        sys.exit(1)
+
+    failed = 0
+    for filename, name in inputs:
+        folder = os.path.dirname(name)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        try:
+            files = ConvertFile(filename, name, formats, cache)
+        except (OSError, ValueError) as error:
+            print(f"Error: {filename}: {error}")
+            failed += 1
+            continue
+        print(f"{filename}: {', '.join(files)}")
+
+    if cache:
+        print(cache.report())
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,47 @@
 #! /usr/bin/env python3
 
+import os
 import sys
+import shlex
+import argparse
+
+from edid_convert import EDID_BLOCK_SIZE, EDID_ROM_SIZE, EDID_HEADER, FORMATS, Checksum, ValidateEDID, WriteFormats
+
+
+# Number of detailed timing descriptors the base block holds, the last descriptor is kept for the display name
+BASE_TIMINGS = 3
+
+# Number of detailed timing descriptors a CTA-861 extension block holds, after its 4 byte header
+EXTENSION_TIMINGS = (EDID_BLOCK_SIZE - 5) // 18
+
+# Number of standard timings in the base block
+STANDARD_TIMINGS = 8
+
+# Aspect ratios of a standard timing in EDID 1.3, as the width and height for each code
+STANDARD_ASPECTS = {0: (16, 10), 1: (4, 3), 2: (5, 4), 3: (16, 9)}
+
+# The porch and sync limits of the panel, named as in the PanelLimits of the timing solver
+PANEL_LIMITS = ["h_front_porch", "h_sync_width", "h_back_porch", "v_front_porch", "v_sync_width", "v_back_porch"]
 
 
 class ModelineObject:
     modeline_str    = ""
     resolution      = ""
+    pixel_clock     = 0.0
     refresh_rate    = 0.0
     h_active        = 0
-    h_porch         = 0
-    h_sync          = 0
+    h_porch         = 0     # Start of the horizontal sync
+    h_sync          = 0     # End of the horizontal sync
     h_total         = 0
     v_active        = 0
-    v_porch         = 0
-    v_sync          = 0
-    v_total         = 0    
+    v_porch         = 0     # Start of the vertical sync
+    v_sync          = 0     # End of the vertical sync
+    v_total         = 0
 
     def ArgToModeline(self, args : list):
         self.modeline_str = args[0]
         self.resolution = args[1]
-        self.refresh_rate = float(args[2])
+        self.pixel_clock = float(args[2])
         self.h_active = int(args[3])
         self.h_porch = int(args[4])
         self.h_sync = int(args[5])
@@ -28,6 +50,14 @@ class ModelineObject:
         self.v_porch = int(args[8])
         self.v_sync = int(args[9])
         self.v_total = int(args[10])
+        # The pixel clock is given in MHz
+        self.refresh_rate = self.pixel_clock * 1e6 / (self.h_total * self.v_total)
+
+    # Format the modeline the same way the modeline generator does
+    def ToString(self) -> str:
+        return (f"{self.modeline_str} \"{self.resolution}\" {self.pixel_clock:.2f} "
+                f"{self.h_active} {self.h_porch} {self.h_sync} {self.h_total} "
+                f"{self.v_active} {self.v_porch} {self.v_sync} {self.v_total}")
 
 
 class EDIDObject:
@@ -47,8 +77,27 @@ class EDIDObject:
     v_image_size    = 0
     v_border        = 0
 
+    # Fields of the base block, matching the binaries in the bin folder
+    manufacturer    = "CUP"
+    product_code    = 0x0069
+    serial_number   = 0x000001a4
+    week            = 0xff      # The year is the model year
+    year            = 2024
+    screen_width    = 0         # In cm, 0 if unknown
+    screen_height   = 0         # In cm, 0 if unknown
+    display_name    = "Cuprum"
+    display_text    = "Pure Copium"
+    # Digital separate sync with both sync signals negative
+    sync_flags      = 0x18
+    # Red, green, blue and white points of the display, taken from the binaries in the bin folder
+    chromaticity    = bytes([0x6e, 0xa5, 0xa3, 0x54, 0x4f, 0x9f, 0x26, 0x11, 0x50, 0x54])
+    # The detailed timings after the preferred one, each an EDIDObject of its own
+    extra_timings   = ()
+    # The standard timings, as the active pixels, active lines and refresh rate of each
+    standard_timings = ()
+
     def ModelineToEDID(self, modeline : ModelineObject):
-        self.pxclk = modeline.refresh_rate
+        self.pxclk = modeline.pixel_clock
         self.h_active = modeline.h_active
         self.h_front_porch = modeline.h_porch - modeline.h_active
         self.h_back_porch = modeline.h_total - modeline.h_sync
@@ -58,33 +107,373 @@ class EDIDObject:
         self.h_border = 0
         self.v_active = modeline.v_active
         self.v_front_porch = modeline.v_porch - modeline.v_active
-        self.back_porch = modeline.v_total - modeline.v_sync
+        self.v_back_porch = modeline.v_total - modeline.v_sync
         self.v_sync_width = modeline.v_sync - modeline.v_porch
-        self.v_blank = self.h_front_porch + self.v_back_porch + self.v_sync_width
+        self.v_blank = self.v_front_porch + self.v_back_porch + self.v_sync_width
         self.v_image_size = modeline.v_total
         self.v_border = 0
 
+    # Fill in every modeline, the first as the preferred timing and the rest as extra detailed timings
+    # Each modeline is also listed as a standard timing, when its resolution and refresh rate can be written as one
+    def ModelinesToEDID(self, modelines : list):
+        self.ModelineToEDID(modelines[0])
+
+        self.extra_timings = []
+        for modeline in modelines[1:]:
+            timing = EDIDObject()
+            timing.sync_flags = self.sync_flags
+            timing.ModelineToEDID(modeline)
+            self.extra_timings.append(timing)
+
+        self.standard_timings = []
+        for modeline in modelines:
+            timing = (modeline.h_active, modeline.v_active, round(modeline.refresh_rate))
+            if StandardTiming(*timing) is not None and timing not in self.standard_timings:
+                self.standard_timings.append(timing)
+        self.standard_timings = self.standard_timings[:STANDARD_TIMINGS]
+
+    # Pack the timing into an 18 byte detailed timing descriptor
+    def ToDescriptor(self) -> bytes:
+        # The pixel clock is stored in units of 10 kHz
+        pxclk = round(self.pxclk * 100)
+
+        # Make sure every field fits the bits it is given in the descriptor
+        limits = [
+            ("Pixel clock", pxclk, 0xffff),
+            ("H. Active", self.h_active, 0xfff),
+            ("H. Blank", self.h_blank, 0xfff),
+            ("V. Active", self.v_active, 0xfff),
+            ("V. Blank", self.v_blank, 0xfff),
+            ("H. Front Porch", self.h_front_porch, 0x3ff),
+            ("H. Sync Width", self.h_sync_width, 0x3ff),
+            ("V. Front Porch", self.v_front_porch, 0x3f),
+            ("V. Sync Width", self.v_sync_width, 0x3f),
+            ("H. Image Size", self.h_image_size, 0xfff),
+            ("V. Image Size", self.v_image_size, 0xfff),
+            ("H. Border", self.h_border, 0xff),
+            ("V. Border", self.v_border, 0xff)
+        ]
+        for name, value, limit in limits:
+            if not 0 <= value <= limit:
+                raise ValueError(f"{name} of {value} does not fit the detailed timing descriptor (0 to {limit})")
+        # A pixel clock of zero marks the descriptor as a display descriptor
+        if pxclk == 0:
+            raise ValueError("Pixel clock can not be 0")
+
+        return bytes([
+            pxclk & 0xff,
+            pxclk >> 8,
+            self.h_active & 0xff,
+            self.h_blank & 0xff,
+            (self.h_active >> 8) << 4 | self.h_blank >> 8,
+            self.v_active & 0xff,
+            self.v_blank & 0xff,
+            (self.v_active >> 8) << 4 | self.v_blank >> 8,
+            self.h_front_porch & 0xff,
+            self.h_sync_width & 0xff,
+            (self.v_front_porch & 0xf) << 4 | self.v_sync_width & 0xf,
+            (self.h_front_porch >> 8) << 6 | (self.h_sync_width >> 8) << 4 | (self.v_front_porch >> 4) << 2 | self.v_sync_width >> 4,
+            self.h_image_size & 0xff,
+            self.v_image_size & 0xff,
+            (self.h_image_size >> 8) << 4 | self.v_image_size >> 8,
+            self.h_border,
+            self.v_border,
+            self.sync_flags
+        ])
+
+    # Serialize into a 128 byte base block, followed by a CTA-861 extension block for the timings that do not fit it
+    # Every block ends with its checksum
+    def ToBytes(self) -> bytes:
+        timings = [self.ToDescriptor()] + [timing.ToDescriptor() for timing in self.extra_timings]
+        if len(timings) > BASE_TIMINGS + EXTENSION_TIMINGS:
+            raise ValueError(f"{len(timings)} detailed timings do not fit the {EDID_ROM_SIZE} byte EDID ROM (at most {BASE_TIMINGS + EXTENSION_TIMINGS})")
+        extension = timings[BASE_TIMINGS:]
+        timings = timings[:BASE_TIMINGS]
+
+        # The manufacturer is three letters, packed as 5 bits each with A as 1
+        letters = [ord(letter) - ord("A") + 1 for letter in self.manufacturer.upper()]
+        manufacturer = letters[0] << 10 | letters[1] << 5 | letters[2]
+
+        block = bytearray()
+        block += EDID_HEADER
+        block += manufacturer.to_bytes(2, "big")
+        block += self.product_code.to_bytes(2, "little")
+        block += self.serial_number.to_bytes(4, "little")
+        block += bytes([self.week, self.year - 1990])
+        # EDID version 1.3
+        block += bytes([1, 3])
+        # Digital input, the screen size, a gamma of 2.2 and RGB color with the first timing preferred
+        block += bytes([0x80, self.screen_width, self.screen_height, 0x78, 0x0a])
+        block += self.chromaticity
+        # No established timings, and the standard timings followed by the unused ones
+        block += bytes(3)
+        for timing in self.standard_timings:
+            block += StandardTiming(*timing)
+        block += bytes([0x01, 0x01] * (STANDARD_TIMINGS - len(self.standard_timings)))
+        # The detailed timings, followed by the display descriptors in the descriptors left
+        for timing in timings:
+            block += timing
+        displays = [
+            DisplayDescriptor(0xfe, self.display_text),
+            DisplayDescriptor(0xfc, self.display_name),
+            DisplayDescriptor(0x10, "")
+        ]
+        # With a single descriptor left the text is dropped, the name is always kept
+        left = 4 - len(timings)
+        block += b"".join(displays[:left] if left > 1 else displays[1:2])
+        # The number of extension blocks
+        block += bytes([1 if extension else 0])
+        block += bytes([Checksum(block)])
+
+        if extension:
+            block += ExtensionBlock(extension)
+
+        # Never hand out an EDID the GPU would throw away
+        if not ValidateEDID(block):
+            raise ValueError("the EDID has a wrong header or checksum")
+
+        return bytes(block)
+
+
+# Build an 18 byte display descriptor holding up to 13 characters of text
+def DisplayDescriptor(tag : int, text : str) -> bytes:
+    # The dummy descriptor is all zeros
+    if tag == 0x10:
+        return bytes([0, 0, 0, 0x10]) + bytes(14)
+
+    if len(text) > 13:
+        raise ValueError(f"\"{text}\" is longer than the 13 characters a display descriptor holds")
+
+    # The text ends with a newline and is padded with spaces
+    data = text.encode("ascii")
+    if len(data) < 13:
+        data += b"\n"
+    data = data.ljust(13, b" ")
+
+    return bytes([0, 0, 0, tag, 0]) + data
+
+
+# Build the 2 bytes of a standard timing, None if the resolution or refresh rate can not be written as one
+# The height is not stored, it follows from the width and one of the aspect ratios
+def StandardTiming(h_active : int, v_active : int, refresh_rate : int):
+    if h_active % 8 or not 256 <= h_active <= 2288 or not 60 <= refresh_rate <= 123:
+        return None
+
+    for code, (width, height) in STANDARD_ASPECTS.items():
+        if h_active * height == v_active * width:
+            return bytes([h_active // 8 - 31, code << 6 | refresh_rate - 60])
+
+    return None
+
+
+# Build a CTA-861 extension block holding the detailed timings, without any data blocks
+def ExtensionBlock(timings : list) -> bytes:
+    # Tag, revision 3, the offset of the first detailed timing and no native formats or audio
+    block = bytearray([0x02, 0x03, 0x04, 0x00])
+    for timing in timings:
+        block += timing
+    block += bytes(EDID_BLOCK_SIZE - 1 - len(block))
+    block += bytes([Checksum(block)])
+
+    return bytes(block)
+
+
+# Write the EDID as a binary, followed by every format of the edid_convert.py
+def WriteEDID(edid : bytes, name : str) -> list:
+    with open(name + ".bin", "wb") as f:
+        f.write(edid)
+
+    return [name + ".bin"] + WriteFormats(edid, name, list(FORMATS), os.path.basename(name))
+
+
+# Parse a modeline from a line of text, such as the output of the modeline generator
+def ParseModeline(line : str) -> ModelineObject:
+    args = shlex.split(line)
+    if len(args) != 11:
+        raise ValueError("11 arguments required")
+
+    modeline = ModelineObject()
+    modeline.ArgToModeline(args)
+
+    return modeline
+
+
+# Solve the timing with the least blanking at every refresh rate, for the resolution of the modeline
+# The modeline comes first as the preferred timing, and the rates it already runs at are skipped
+# Timings that are no lower in pixel clock than a faster one are returned apart, as they save no bandwidth
+def RefreshLadder(modeline : ModelineObject, refresh_rates : list, panel_limits : dict = None, min_pxclk : float = None) -> tuple:
+    if not refresh_rates:
+        return [modeline], []
+    # The solver needs NumPy, which is only needed for the ladder
+    from timing_solver import SolveTimings, PanelLimits, GPULimits
+
+    # Solve with the porch and sync limits of the panel, instead of the widest the EDID holds
+    panel = PanelLimits()
+    for name, limits in (panel_limits or {}).items():
+        setattr(panel, name, tuple(limits))
+    gpu = GPULimits()
+    if min_pxclk is not None:
+        gpu.min_pxclk = min_pxclk
+
+    modelines = [modeline]
+    for refresh_rate in refresh_rates:
+        if any(abs(other.refresh_rate - refresh_rate) <= refresh_rate * gpu.tolerance / 100 for other in modelines):
+            continue
+        solved = SolveTimings(modeline.h_active, modeline.v_active, refresh_rate, panel, gpu, 1)
+        if not solved:
+            raise ValueError(f"no timing within the limits reaches {refresh_rate:g} Hz")
+        modelines.append(solved[0])
+
+    # A rung only saves bandwidth when its pixel clock is below that of every faster timing
+    # The lowest clock of the GPU pads the slow rungs with blanking until they run at the same clock as a faster one, those are dropped
+    ladder = [modeline]
+    dropped = []
+    for rung in modelines[1:]:
+        if any(other.refresh_rate > rung.refresh_rate and other.pixel_clock <= rung.pixel_clock for other in modelines):
+            dropped.append(rung)
+        else:
+            ladder.append(rung)
+
+    return ladder, dropped
+
+
+# Convert every modeline in the file to EDID files in the output folder, named after the resolution of the modeline
+# With refresh rates, every EDID holds the timings of the modeline at each of them
+def ConvertBatch(filename : str, output : str, refresh_rates : list = (), panel_limits : dict = None, min_pxclk : float = None) -> int:
+    os.makedirs(output, exist_ok=True)
+    converted = 0
+
+    with open(filename) as f:
+        for line_number, line in enumerate(f, 1):
+            # Skip empty lines and comments
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            try:
+                modeline = ParseModeline(line)
+                modelines, dropped = RefreshLadder(modeline, refresh_rates, panel_limits, min_pxclk)
+                edid = EDIDObject()
+                edid.ModelinesToEDID(modelines)
+                data = edid.ToBytes()
+            except ValueError as error:
+                print(f"Error on line {line_number}: {error}")
+                continue
+
+            files = WriteEDID(data, os.path.join(output, modeline.resolution))
+            converted += 1
+            print(f"{modeline.resolution}: {', '.join(files)}")
+            if len(modelines) > 1:
+                print(f"  {len(modelines)} timings at {', '.join(f'{timing.refresh_rate:.2f}' for timing in modelines)} Hz, "
+                      f"{len(edid.standard_timings)} standard timings, {len(data) // EDID_BLOCK_SIZE} blocks")
+            for rung in dropped:
+                print(f"  Skipped {rung.refresh_rate:.2f} Hz, its pixel clock of {rung.pixel_clock:.2f} MHz is no lower than that of a faster timing")
+
+    return converted
+
 
 def main():
-    # Get every argument after the script name
-    args = sys.argv[1:]
+    parser = argparse.ArgumentParser(
+        prog="modeline_to_edid",
+        description="Convert a modeline to the EDID timing, and optionally to EDID files."
+    )
+
+    parser.add_argument(
+        "modeline",
+        type=str,
+        nargs="*",
+        help="The modeline, such as: Modeline \"400x960@60\" 36.48 400 432 568 600 960 979 989 1009"
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        help="A file with a modeline on every line, each is converted to a .bin, .hex, .data and .mem file.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "-r",
+        "--refresh",
+        type=float,
+        nargs="+",
+        help="Add a detailed timing at each of these refresh rates in Hz, solved for the least blanking at the resolution of the modeline. "
+             "The modeline stays the preferred timing.",
+        required=False,
+        default=[]
+    )
+
+    # The porch and sync limits from the datasheet of the panel, the rungs of the ladder are solved within them
+    for name, help_text in (
+        ("h-front-porch", "horizontal front porch"),
+        ("h-sync-width", "horizontal sync width"),
+        ("h-back-porch", "horizontal back porch"),
+        ("v-front-porch", "vertical front porch"),
+        ("v-sync-width", "vertical sync width"),
+        ("v-back-porch", "vertical back porch")
+    ):
+        parser.add_argument(
+            f"--{name}",
+            type=int,
+            nargs=2,
+            metavar=("MIN", "MAX"),
+            help=f"The minimum and maximum {help_text} of the panel for the timings added with -r.",
+            required=False,
+            default=None
+        )
+
+    parser.add_argument(
+        "--min-pxclk",
+        type=float,
+        help="The lowest pixel clock the GPU outputs in MHz, for the timings added with -r. Defaults to the 25 MHz of the timing solver.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The output folder of the EDID files. A single modeline is only written to files when this is given.",
+        required=False,
+        default=None
+    )
+
+    args = parser.parse_args()
+
+    panel_limits = {name: getattr(args, name) for name in PANEL_LIMITS if getattr(args, name) is not None}
+
+    # Convert every modeline in the file
+    if args.batch:
+        ConvertBatch(args.batch, args.output or "output", args.refresh, panel_limits, args.min_pxclk)
+        return
+
     # If there are no arguments, print the usage
-    if not args:
+    if not args.modeline:
         print("Usage: modeline_to_edid.py [modeline]")
         sys.exit(1)
     # Check if there are 11 arguments
-    if len(args) != 11:
+    if len(args.modeline) != 11:
         print("Error: 11 arguments required")
         sys.exit(1)
 
     # Create a modeline object
     modeline = ModelineObject()
     # Convert the arguments to a modeline object
-    modeline.ArgToModeline(args)
+    modeline.ArgToModeline(args.modeline)
+
+    # Add the timings at the other refresh rates
+    try:
+        modelines, dropped = RefreshLadder(modeline, args.refresh, panel_limits, args.min_pxclk)
+    except ValueError as error:
+        print(f"Error: {error}")
+        sys.exit(1)
 
     # Convert to the correct format
-    edid = EDIDObject()    
-    edid.ModelineToEDID(modeline)
+    edid = EDIDObject()
+    edid.ModelinesToEDID(modelines)
 
     # Print the EDID object
     print(f"""
@@ -95,14 +484,31 @@ H. Blank:       {edid.h_blank}
 H. Front Porch: {edid.h_front_porch}
 H. Sync Width:  {edid.h_sync_width}
 H. Image Size:  {edid.h_image_size}
-          
+
 V. Active:      {edid.v_active}
 V. Blank:       {edid.v_blank}
 V. Front Porch: {edid.v_front_porch}
 V. Sync Width:  {edid.v_sync_width}
 V. Image Size:  {edid.v_image_size}
-""")   
+""")
+
+    # List the timings that were added for the other refresh rates
+    for timing in modelines[1:]:
+        print(f"{timing.refresh_rate:>6.2f} Hz: {timing.ToString()}")
+    for timing in dropped:
+        print(f"{timing.refresh_rate:>6.2f} Hz: skipped, its pixel clock of {timing.pixel_clock:.2f} MHz is no lower than that of a faster timing")
+
+    # Write the EDID files if an output folder was given
+    if args.output:
+        try:
+            data = edid.ToBytes()
+        except ValueError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        os.makedirs(args.output, exist_ok=True)
+        files = WriteEDID(data, os.path.join(args.output, modeline.resolution))
+        print(f"EDID written to {', '.join(files)}")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
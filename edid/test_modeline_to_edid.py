@@ -0,0 +1,52 @@
+#! /usr/bin/env python3
+
+import unittest
+
+from edid_convert import ValidateEDID
+from modeline_to_edid import EDIDObject, ParseModeline, RefreshLadder
+
+
+MODELINE = "Modeline \"400x960@60\" 36.48 400 432 568 600 960 979 989 1009"
+
+# The porch limits of the 400x960 panel from its datasheet
+PANEL = {"h_front_porch": (8, 64), "v_front_porch": (2, 40), "v_back_porch": (2, 40)}
+
+
+class TestRefreshLadder(unittest.TestCase):
+    def check_ladder(self, ladder):
+        # Every rung runs at a lower pixel clock than the faster timings
+        for rung in ladder:
+            for other in ladder:
+                if other.refresh_rate > rung.refresh_rate:
+                    self.assertLess(rung.pixel_clock, other.pixel_clock)
+
+        edid = EDIDObject()
+        edid.ModelinesToEDID(ladder)
+        self.assertTrue(ValidateEDID(edid.ToBytes()))
+
+    def test_gpu_floor(self):
+        # The 30 Hz rung is padded up to the 25 MHz floor of the GPU, the same clock as the 50 Hz rung
+        ladder, dropped = RefreshLadder(ParseModeline(MODELINE), [30, 50, 60])
+        self.assertEqual([round(timing.refresh_rate) for timing in ladder], [60, 50])
+        self.assertEqual([round(timing.refresh_rate) for timing in dropped], [30])
+        self.assertEqual(dropped[0].pixel_clock, ladder[1].pixel_clock)
+        self.check_ladder(ladder)
+
+    def test_panel_limits(self):
+        # With a GPU that goes lower, every rung is solved within the limits of the panel and lowers the clock
+        ladder, dropped = RefreshLadder(ParseModeline(MODELINE), [30, 50, 60], PANEL, 10.0)
+        self.assertEqual([round(timing.refresh_rate) for timing in ladder], [60, 30, 50])
+        self.assertEqual(dropped, [])
+        for timing in ladder[1:]:
+            self.assertGreaterEqual(timing.v_porch - timing.v_active, 2)
+            self.assertGreaterEqual(timing.v_total - timing.v_sync, 2)
+            self.assertGreaterEqual(timing.h_porch - timing.h_active, 8)
+        self.check_ladder(ladder)
+
+    def test_no_refresh_rates(self):
+        modeline = ParseModeline(MODELINE)
+        self.assertEqual(RefreshLadder(modeline, []), ([modeline], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,39 @@
+#! /usr/bin/env python3
+
+import unittest
+
+from vesa_timings import CalculateTimings
+
+
+# Known modelines from the VESA CVT 1.2 spreadsheet, as the pixel clock in MHz followed by the horizontal and vertical timings
+KNOWN_TIMINGS = [
+    ("cvt", 1920, 1080, 60, (173.00, 1920, 2048, 2248, 2576, 1080, 1083, 1088, 1120)),
+    ("cvt", 1280, 720, 60, (74.50, 1280, 1344, 1472, 1664, 720, 723, 728, 748)),
+    ("cvt", 1024, 768, 60, (63.50, 1024, 1072, 1176, 1328, 768, 771, 775, 798)),
+    ("cvt-rb", 1920, 1080, 60, (138.50, 1920, 1968, 2000, 2080, 1080, 1083, 1088, 1111)),
+    ("cvt-rb2", 1920, 1080, 60, (133.32, 1920, 1928, 1960, 2000, 1080, 1097, 1105, 1111)),
+    ("cvt-rb2", 3840, 2160, 60, (522.614, 3840, 3848, 3880, 3920, 2160, 2208, 2216, 2222)),
+    # Reduced blanking version 2 keeps a width that is not a multiple of 8
+    ("cvt-rb2", 1366, 768, 60, (68.54, 1366, 1374, 1406, 1446, 768, 776, 784, 790))
+]
+
+PARTS = ["h_active", "h_sync_start", "h_sync_end", "h_total", "v_active", "v_sync_start", "v_sync_end", "v_total"]
+
+
+class TestVESATimings(unittest.TestCase):
+    def test_known_timings(self):
+        for method, width, height, refresh_rate, expected in KNOWN_TIMINGS:
+            with self.subTest(method=method, resolution=f"{width}x{height}@{refresh_rate}"):
+                timings = CalculateTimings(method, width, height, refresh_rate)
+                self.assertAlmostEqual(float(timings["pxclk"]), expected[0], places=3)
+                self.assertEqual([int(timings[part]) for part in PARTS], list(expected[1:]))
+
+    def test_rb2_back_porch(self):
+        # The back porch of version 2 is always 6 lines, the front porch takes the rest
+        timings = CalculateTimings("cvt-rb2", [400, 480, 1920], [960, 480, 1080], [30, 50, 60])
+        self.assertTrue((timings["v_total"] - timings["v_sync_end"] == 6).all())
+        self.assertTrue((timings["v_sync_start"] - timings["v_active"] >= 1).all())
+
+
+if __name__ == "__main__":
+    unittest.main()
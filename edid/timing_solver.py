@@ -0,0 +1,238 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from modeline_to_edid import ModelineObject, EDIDObject, WriteEDID
+
+
+# Bits sent per pixel on each TMDS channel, 8 bits of color coded as 10 bits
+TMDS_BITS_PER_CHANNEL = 10
+
+# Number of TMDS data channels, one for each color
+TMDS_CHANNELS = 3
+
+
+class PanelLimits:
+    # Minimum and maximum of every porch and sync from the datasheet of the panel, in pixels and lines
+    # The defaults are the widest the detailed timing descriptor of an EDID can hold
+    h_front_porch   = (1, 1023)
+    h_sync_width    = (1, 1023)
+    h_back_porch    = (1, 1023)
+    v_front_porch   = (1, 63)
+    v_sync_width    = (1, 63)
+    v_back_porch    = (1, 255)
+
+
+class GPULimits:
+    # Most GPUs refuse a pixel clock below 25 MHz, the lowest clock of DVI and HDMI
+    min_pxclk       = 25.0      # In MHz
+    # The highest pixel clock the dvi2rgb receiver locks on to
+    max_pxclk       = 165.0     # In MHz
+    # Horizontal timings must be a multiple of this many pixels
+    granularity     = 8
+    # How far off the target the refresh rate may be after rounding the pixel clock to 10 kHz, in percent
+    tolerance       = 0.5
+
+
+# The TMDS bandwidth of a pixel clock in Gbit/s
+def TMDSBandwidth(pxclk):
+    return pxclk * TMDS_BITS_PER_CHANNEL * TMDS_CHANNELS / 1e3
+
+
+# Find every total of active + front porch + sync + back porch within the limits
+# Returns the totals, and for each total the split with the smallest front porch and sync,
+# which leaves the rest of the blanking to the back porch
+def SolveTotals(active : int, front_porch : tuple, sync_width : tuple, back_porch : tuple, step : int = 1):
+    # Round the limits to the step, so every edge of the timing lands on a multiple of it
+    (fp_min, fp_max), (sw_min, sw_max), (bp_min, bp_max) = [
+        (-(-low // step) * step, high // step * step) for low, high in (front_porch, sync_width, back_porch)
+    ]
+
+    # Every blanking between the smallest and largest sum can be split over the three, in steps
+    blanking = np.arange(fp_min + sw_min + bp_min, fp_max + sw_max + bp_max + 1, step)
+    # The front porch and then the sync only grow when the back porch is full
+    fp = np.maximum(fp_min, blanking - sw_max - bp_max)
+    sw = np.maximum(sw_min, blanking - fp - bp_max)
+    bp = blanking - fp - sw
+
+    return active + blanking, fp, sw, bp
+
+
+# Search every horizontal and vertical total for the timings that hit the refresh rate within the limits
+# Returns the valid modelines, lowest pixel clock first
+def SolveTimings(h_active : int, v_active : int, refresh_rate : float, panel : PanelLimits = None, gpu : GPULimits = None, count : int = 10) -> list:
+    panel = panel or PanelLimits()
+    gpu = gpu or GPULimits()
+
+    # The pixel clock only depends on the totals, so each axis is reduced to its unique totals first
+    h_totals, h_fp, h_sw, h_bp = SolveTotals(h_active, panel.h_front_porch, panel.h_sync_width, panel.h_back_porch, gpu.granularity)
+    v_totals, v_fp, v_sw, v_bp = SolveTotals(v_active, panel.v_front_porch, panel.v_sync_width, panel.v_back_porch)
+
+    # Every pair of totals, with the pixel clock rounded to the 10 kHz steps of the EDID
+    h_idx, v_idx = [axis.ravel() for axis in np.meshgrid(np.arange(len(h_totals)), np.arange(len(v_totals)), indexing="ij")]
+    pixels = h_totals[h_idx].astype(np.int64) * v_totals[v_idx]
+    pxclk = np.round(refresh_rate * pixels / 1e4) / 100
+    actual = pxclk * 1e6 / pixels
+
+    valid = (pxclk >= gpu.min_pxclk) & (pxclk <= gpu.max_pxclk)
+    valid &= np.abs(actual - refresh_rate) <= refresh_rate * gpu.tolerance / 100
+    h_idx = h_idx[valid]
+    v_idx = v_idx[valid]
+    pxclk = pxclk[valid]
+
+    # Lowest pixel clock first, then the least blanking
+    order = np.lexsort((v_totals[v_idx], h_totals[h_idx], pxclk))[:count]
+
+    modelines = []
+    for idx in order:
+        h = h_idx[idx]
+        v = v_idx[idx]
+        modeline = ModelineObject()
+        modeline.ArgToModeline([
+            "Modeline",
+            f"{h_active}x{v_active}@{refresh_rate:g}",
+            f"{pxclk[idx]:.2f}",
+            h_active,
+            h_active + h_fp[h],
+            h_active + h_fp[h] + h_sw[h],
+            h_totals[h],
+            v_active,
+            v_active + v_fp[v],
+            v_active + v_fp[v] + v_sw[v],
+            v_totals[v]
+        ])
+        modelines.append(modeline)
+
+    return modelines
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="timing_solver",
+        description="Find the modelines with the lowest pixel clock for a panel that a GPU accepts."
+    )
+
+    parser.add_argument("width", type=int, help="The number of active pixels on each line.")
+    parser.add_argument("height", type=int, help="The number of active lines.")
+    parser.add_argument("refresh", type=float, help="The target refresh rate in Hz.")
+
+    # The porch and sync limits from the datasheet of the panel
+    for name, help_text in (
+        ("h-front-porch", "horizontal front porch"),
+        ("h-sync-width", "horizontal sync width"),
+        ("h-back-porch", "horizontal back porch"),
+        ("v-front-porch", "vertical front porch"),
+        ("v-sync-width", "vertical sync width"),
+        ("v-back-porch", "vertical back porch")
+    ):
+        parser.add_argument(
+            f"--{name}",
+            type=int,
+            nargs=2,
+            metavar=("MIN", "MAX"),
+            help=f"The minimum and maximum {help_text} of the panel. Defaults to {getattr(PanelLimits, name.replace('-', '_'))}.",
+            required=False,
+            default=None
+        )
+
+    parser.add_argument(
+        "--min-pxclk",
+        type=float,
+        help=f"The lowest pixel clock the GPU outputs in MHz. Defaults to {GPULimits.min_pxclk} MHz.",
+        required=False,
+        default=GPULimits.min_pxclk
+    )
+
+    parser.add_argument(
+        "--max-pxclk",
+        type=float,
+        help=f"The highest pixel clock the receiver accepts in MHz. Defaults to {GPULimits.max_pxclk} MHz.",
+        required=False,
+        default=GPULimits.max_pxclk
+    )
+
+    parser.add_argument(
+        "-g",
+        "--granularity",
+        type=int,
+        help=f"The horizontal timings are a multiple of this many pixels. Defaults to {GPULimits.granularity}.",
+        required=False,
+        default=GPULimits.granularity
+    )
+
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        help=f"How far off the refresh rate may be in percent. Defaults to {GPULimits.tolerance}%%.",
+        required=False,
+        default=GPULimits.tolerance
+    )
+
+    parser.add_argument(
+        "-n",
+        "--count",
+        type=int,
+        help="The number of modelines to list.",
+        required=False,
+        default=10
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Write the EDID of the best modeline to this folder.",
+        required=False,
+        default=None
+    )
+
+    args = parser.parse_args()
+
+    panel = PanelLimits()
+    for name in ("h_front_porch", "h_sync_width", "h_back_porch", "v_front_porch", "v_sync_width", "v_back_porch"):
+        if getattr(args, name) is not None:
+            setattr(panel, name, tuple(getattr(args, name)))
+
+    gpu = GPULimits()
+    gpu.min_pxclk = args.min_pxclk
+    gpu.max_pxclk = args.max_pxclk
+    gpu.granularity = args.granularity
+    gpu.tolerance = args.tolerance
+
+    if args.width % gpu.granularity:
+        print(f"Warning: {args.width} pixels is not a multiple of the granularity of {gpu.granularity}")
+
+    start = time.perf_counter()
+    modelines = SolveTimings(args.width, args.height, args.refresh, panel, gpu, args.count)
+    elapsed = time.perf_counter() - start
+
+    if not modelines:
+        print(f"Error: no timing within the limits reaches {args.refresh} Hz")
+        sys.exit(1)
+
+    print(f"{'Pixel clock':>12}  {'TMDS':>11}  {'Refresh':>9}  Modeline")
+    for modeline in modelines:
+        print(f"{modeline.pixel_clock:>8.2f} MHz  {TMDSBandwidth(modeline.pixel_clock):>6.3f} Gb/s  {modeline.refresh_rate:>6.2f} Hz  {modeline.ToString()}")
+    print(f"\nSolved in {elapsed * 1000:.2f} ms")
+
+    # Write the EDID of the modeline with the lowest pixel clock
+    if args.output:
+        edid = EDIDObject()
+        edid.ModelineToEDID(modelines[0])
+        try:
+            data = edid.ToBytes()
+        except ValueError as error:
+            print(f"Error: {error}")
+            sys.exit(1)
+        os.makedirs(args.output, exist_ok=True)
+        files = WriteEDID(data, os.path.join(args.output, modelines[0].resolution))
+        print(f"EDID written to {', '.join(files)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#! /usr/bin/env python3
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+from modeline_to_edid import ModelineObject, EDIDObject, WriteEDID
+
+
+# Constants of the VESA Coordinated Video Timings (CVT 1.2) and Generalized Timing Formula (GTF)
+CELL_GRAN       = 8         # Horizontal timings are a multiple of this many pixels
+MIN_VSYNC_BP    = 550       # Minimum time of the vertical sync and back porch in us
+MIN_V_PORCH     = 3         # Vertical front porch in lines
+MIN_V_BPORCH    = 6         # Minimum vertical back porch in lines
+H_SYNC_PER      = 8         # Horizontal sync as a percentage of the line
+CLOCK_STEP      = 0.25      # The pixel clock is rounded down to this many MHz
+
+# The blanking formula, C' and M' are derived from C, J, K and M
+GTF_C           = 40
+GTF_J           = 20
+GTF_K           = 128
+GTF_M           = 600
+C_PRIME         = (GTF_C - GTF_J) * GTF_K / 256 + GTF_J
+M_PRIME         = GTF_K / 256 * GTF_M
+
+# GTF uses a shorter front porch and vertical sync
+GTF_V_PORCH     = 1
+GTF_V_SYNC      = 3
+
+# Reduced blanking, version 1 and 2
+RB_MIN_V_BLANK  = 460       # Minimum vertical blanking in us
+RB_H_BLANK      = 160
+RB_H_SYNC       = 32
+RB_V_FPORCH     = 3
+RB2_H_BLANK     = 80
+RB2_H_FPORCH    = 8
+RB2_H_SYNC      = 32
+RB2_V_FPORCH    = 1         # Minimum vertical front porch in lines, the front porch takes the rest of the blanking
+RB2_V_SYNC      = 8
+RB2_V_BPORCH    = 6         # The vertical back porch is fixed at this many lines
+RB2_CLOCK_STEP  = 0.001
+
+# Timing methods, as they are selected on the command line
+METHODS = ["cvt", "cvt-rb", "cvt-rb2", "gtf"]
+
+
+# The vertical sync of CVT tells the aspect ratio of the resolution, 10 lines if it is none of the standard ones
+def CVTSyncWidth(h_active, v_active):
+    return np.select(
+        [
+            v_active * 4 // 3 == h_active,
+            v_active * 16 // 9 == h_active,
+            v_active * 16 // 10 == h_active,
+            (v_active * 5 // 4 == h_active) | (v_active * 15 // 9 == h_active)
+        ],
+        [4, 5, 6, 7],
+        10
+    )
+
+
+# Calculate the CVT timings, with reduced blanking when reduced is 1 or 2
+# Every argument can be an array, the result holds an array for each part of the timing
+def CVT(h_active, v_active, refresh_rate, reduced : int = 0) -> dict:
+    h_active, v_active, refresh_rate = np.broadcast_arrays(
+        np.asarray(h_active, dtype=np.int64), np.asarray(v_active, dtype=np.int64), np.asarray(refresh_rate, dtype=np.float64)
+    )
+    # Only whole character cells are displayed, reduced blanking version 2 has a granularity of a single pixel
+    if reduced != 2:
+        h_active = h_active // CELL_GRAN * CELL_GRAN
+
+    if reduced == 0:
+        v_sync = CVTSyncWidth(h_active, v_active)
+        # Estimate the line period from the time left after the minimum vertical sync and back porch
+        h_period = (1e6 / refresh_rate - MIN_VSYNC_BP) / (v_active + MIN_V_PORCH)
+        v_sync_bp = np.maximum(np.floor(MIN_VSYNC_BP / h_period).astype(np.int64) + 1, v_sync + MIN_V_BPORCH)
+        v_front_porch = np.full_like(v_active, MIN_V_PORCH)
+        v_total = v_active + v_sync_bp + MIN_V_PORCH
+
+        # The blanking is a share of the line that shrinks as the line gets shorter, but never below 20 %
+        duty = np.maximum(C_PRIME - M_PRIME * h_period / 1000, 20)
+        h_blank = np.floor(h_active * duty / (100 - duty) / (2 * CELL_GRAN)).astype(np.int64) * 2 * CELL_GRAN
+        h_total = h_active + h_blank
+        pxclk = CLOCK_STEP * np.floor(h_total / h_period / CLOCK_STEP)
+        h_sync = np.floor(H_SYNC_PER / 100 * h_total / CELL_GRAN).astype(np.int64) * CELL_GRAN
+        h_front_porch = h_blank // 2 - h_sync
+    else:
+        if reduced == 1:
+            v_sync = CVTSyncWidth(h_active, v_active)
+            v_front_porch = np.full_like(v_active, RB_V_FPORCH)
+            h_blank, h_sync, h_fp, clock_step = RB_H_BLANK, RB_H_SYNC, RB_H_BLANK // 2 - RB_H_SYNC, CLOCK_STEP
+        else:
+            v_sync = np.full_like(v_active, RB2_V_SYNC)
+            v_front_porch = np.full_like(v_active, RB2_V_FPORCH)
+            h_blank, h_sync, h_fp, clock_step = RB2_H_BLANK, RB2_H_SYNC, RB2_H_FPORCH, RB2_CLOCK_STEP
+
+        # The vertical blanking is the fewest lines that last the minimum blanking time
+        h_period = (1e6 / refresh_rate - RB_MIN_V_BLANK) / v_active
+        v_blank = np.maximum(np.floor(RB_MIN_V_BLANK / h_period).astype(np.int64) + 1, v_front_porch + v_sync + MIN_V_BPORCH)
+        v_total = v_active + v_blank
+        # Version 2 fixes the back porch, and leaves the rest of the blanking to the front porch
+        if reduced == 2:
+            v_front_porch = v_blank - RB2_V_SYNC - RB2_V_BPORCH
+
+        h_total = h_active + h_blank
+        pxclk = clock_step * np.floor(np.round(refresh_rate * v_total * h_total / 1e6 / clock_step, 6))
+        h_sync = np.full_like(h_active, h_sync)
+        h_front_porch = np.full_like(h_active, h_fp)
+
+    return {
+        "pxclk": pxclk,
+        "h_active": h_active,
+        "h_sync_start": h_active + h_front_porch,
+        "h_sync_end": h_active + h_front_porch + h_sync,
+        "h_total": h_total,
+        "v_active": v_active,
+        "v_sync_start": v_active + v_front_porch,
+        "v_sync_end": v_active + v_front_porch + v_sync,
+        "v_total": v_total,
+        "refresh_rate": refresh_rate
+    }
+
+
+# Calculate the GTF timings, every argument can be an array
+def GTF(h_active, v_active, refresh_rate) -> dict:
+    h_active, v_active, refresh_rate = np.broadcast_arrays(
+        np.asarray(h_active, dtype=np.int64), np.asarray(v_active, dtype=np.int64), np.asarray(refresh_rate, dtype=np.float64)
+    )
+    h_active = np.round(h_active / CELL_GRAN).astype(np.int64) * CELL_GRAN
+
+    # Estimate the line period, then correct it by how far the estimate is off the refresh rate
+    h_period_est = (1e6 / refresh_rate - MIN_VSYNC_BP) / (v_active + GTF_V_PORCH)
+    v_sync_bp = np.round(MIN_VSYNC_BP / h_period_est).astype(np.int64)
+    v_total = v_active + v_sync_bp + GTF_V_PORCH
+    h_period = h_period_est / (refresh_rate / (1e6 / h_period_est / v_total))
+
+    duty = C_PRIME - M_PRIME * h_period / 1000
+    h_blank = np.round(h_active * duty / (100 - duty) / (2 * CELL_GRAN)).astype(np.int64) * 2 * CELL_GRAN
+    h_total = h_active + h_blank
+    pxclk = h_total / h_period
+    h_sync = np.round(H_SYNC_PER / 100 * h_total / CELL_GRAN).astype(np.int64) * CELL_GRAN
+    h_front_porch = h_blank // 2 - h_sync
+
+    return {
+        "pxclk": pxclk,
+        "h_active": h_active,
+        "h_sync_start": h_active + h_front_porch,
+        "h_sync_end": h_active + h_front_porch + h_sync,
+        "h_total": h_total,
+        "v_active": v_active,
+        "v_sync_start": v_active + GTF_V_PORCH,
+        "v_sync_end": v_active + GTF_V_PORCH + GTF_V_SYNC,
+        "v_total": v_total,
+        "refresh_rate": refresh_rate
+    }
+
+
+# Calculate the timings with the method, see METHODS
+def CalculateTimings(method : str, h_active, v_active, refresh_rate) -> dict:
+    if method == "gtf":
+        return GTF(h_active, v_active, refresh_rate)
+    return CVT(h_active, v_active, refresh_rate, {"cvt": 0, "cvt-rb": 1, "cvt-rb2": 2}[method])
+
+
+# Turn every timing into a modeline object
+def ToModelines(timings : dict) -> list:
+    modelines = []
+
+    for idx in range(timings["pxclk"].size):
+        values = {name: array.flat[idx] for name, array in timings.items()}
+        modeline = ModelineObject()
+        modeline.ArgToModeline([
+            "Modeline",
+            f"{values['h_active']}x{values['v_active']}@{values['refresh_rate']:g}",
+            f"{values['pxclk']:.2f}",
+            values["h_active"],
+            values["h_sync_start"],
+            values["h_sync_end"],
+            values["h_total"],
+            values["v_active"],
+            values["v_sync_start"],
+            values["v_sync_end"],
+            values["v_total"]
+        ])
+        modelines.append(modeline)
+
+    return modelines
+
+
+# Parse a resolution such as 400x960
+def ParseResolution(text : str) -> tuple:
+    try:
+        width, height = text.lower().split("x")
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"\"{text}\" is not a resolution such as 400x960")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="vesa_timings",
+        description="Generate CVT, CVT reduced blanking and GTF modelines for every resolution and refresh rate."
+    )
+
+    parser.add_argument(
+        "resolutions",
+        type=ParseResolution,
+        nargs="+",
+        help="The resolutions, such as 400x960."
+    )
+
+    parser.add_argument(
+        "-r",
+        "--refresh",
+        type=float,
+        nargs="+",
+        help="The refresh rates in Hz, every resolution is calculated for each of them.",
+        required=False,
+        default=[60.0]
+    )
+
+    parser.add_argument(
+        "-m",
+        "--method",
+        type=str,
+        choices=METHODS,
+        help="The timing formula, cvt-rb and cvt-rb2 are reduced blanking version 1 and 2. Defaults to cvt.",
+        required=False,
+        default="cvt"
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Write the EDID of every modeline to this folder.",
+        required=False,
+        default=None
+    )
+
+    args = parser.parse_args()
+
+    # Every resolution at every refresh rate, calculated in one go
+    widths = np.array([width for width, _ in args.resolutions])
+    heights = np.array([height for _, height in args.resolutions])
+    refresh_rates = np.array(args.refresh)
+    timings = CalculateTimings(args.method, widths[:, None], heights[:, None], refresh_rates[None, :])
+    modelines = ToModelines(timings)
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    failed = 0
+    for modeline in modelines:
+        print(modeline.ToString())
+        if not args.output:
+            continue
+
+        edid = EDIDObject()
+        edid.ModelineToEDID(modeline)
+        try:
+            data = edid.ToBytes()
+        except ValueError as error:
+            print(f"Error: {modeline.resolution}: {error}")
+            failed += 1
+            continue
+        WriteEDID(data, os.path.join(args.output, modeline.resolution))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
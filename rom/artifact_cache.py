@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+
+# The cache is shared by every checkout and worker on the machine, unless another folder is given
+DEFAULT_CACHE_FOLDER = os.environ.get("LCD_DRIVER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "lcd_driver"))
+
+# The cache evicts the least recently used entries when it grows past this many bytes
+DEFAULT_MAX_SIZE = 256 << 20
+
+# Size of the blocks files are hashed and compared in
+BLOCK_SIZE = 1 << 16
+
+# Name of the file holding the metadata of an entry
+META_FILE = "meta.json"
+
+
+# Function that checks if two files hold the same bytes, a missing file never matches
+def same_content(first, second):
+    try:
+        if os.path.getsize(first) != os.path.getsize(second):
+            return False
+        with open(first, 'rb') as a, open(second, 'rb') as b:
+            while True:
+                block_a = a.read(BLOCK_SIZE)
+                if block_a != b.read(BLOCK_SIZE):
+                    return False
+                if not block_a:
+                    return True
+    except OSError:
+        return False
+
+
+# Function that copies the file in a single step, leaving the target alone if it already holds the same bytes
+# Returns True if the target was replaced
+def copy_if_changed(source, target):
+    if same_content(source, target):
+        return False
+
+    folder = os.path.dirname(target)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=folder or ".", prefix="." + os.path.basename(target), suffix=".tmp")
+    os.close(handle)
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, target)
+    except OSError:
+        os.remove(temporary)
+        raise
+
+    return True
+
+
+# Function that hashes the content of a file, None if it can not be read
+def hash_file(path):
+    digest = hashlib.sha256()
+
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                digest.update(block)
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+
+# Function that gives the version of a generator as the hash of its source files
+# Any change to the code of the generator gives it a new version, and with that new cache keys
+def source_version(*paths):
+    digest = hashlib.sha256()
+
+    for path in paths:
+        digest.update((hash_file(path) or "").encode())
+
+    return digest.hexdigest()
+
+
+class Artifact_Cache:
+    # Content addressed cache of generated files
+    # Every entry is a folder named after its key, holding the files and the metadata of the entry
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, max_size=DEFAULT_MAX_SIZE):
+        self.folder = folder
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+
+    # Build the key of an entry from its parts, such as the generator, its version, the input and the options
+    def key(self, *parts):
+        digest = hashlib.sha256()
+
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            elif not isinstance(part, (bytes, bytearray, memoryview)):
+                # Sort the keys so the same options always give the same key
+                part = json.dumps(part, sort_keys=True).encode()
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+
+        return digest.hexdigest()
+
+
+    # The folder of an entry, split on the first two characters to keep the folders small
+    def entry_folder(self, key):
+        return os.path.join(self.folder, key[:2], key)
+
+
+    # Copy the files of the entry to the targets, a name -> path dictionary
+    # Returns the metadata of the entry on a hit, or None if the entry is missing, incomplete or out of date
+    def fetch(self, key, targets):
+        folder = self.entry_folder(key)
+
+        try:
+            with open(os.path.join(folder, META_FILE)) as f:
+                meta = json.load(f)
+            # Entries can depend on files found while generating them, which must still hold the same content
+            for path, digest in meta.get("sources", {}).items():
+                if hash_file(path) != digest:
+                    raise OSError(f"{path} changed")
+            # Keep track of the targets that were replaced, the rest already held the same bytes
+            meta["changed"] = [name for name, target in targets.items() if copy_if_changed(os.path.join(folder, name), target)]
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # Mark the entry as used, the least recently used entries are evicted first
+        os.utime(folder)
+        self.hits += 1
+        return meta
+
+
+    # Store the files, a name -> path dictionary, under the key
+    # The sources are hashed and checked again on every fetch
+    def store(self, key, files, sources=(), meta=None):
+        folder = self.entry_folder(key)
+        os.makedirs(os.path.dirname(folder), exist_ok=True)
+
+        meta = dict(meta or {})
+        meta["sources"] = {path: hash_file(path) for path in sources}
+        meta["created"] = time.time()
+
+        # Build the entry next to its place and move it in, so a reader never sees half an entry
+        temporary = tempfile.mkdtemp(dir=os.path.dirname(folder), prefix="." + key[:8])
+        try:
+            for name, path in files.items():
+                shutil.copyfile(path, os.path.join(temporary, name))
+            with open(os.path.join(temporary, META_FILE), 'w') as f:
+                json.dump(meta, f)
+            # Replace an entry that was out of date
+            if os.path.isdir(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            os.rename(temporary, folder)
+        except OSError:
+            # Another process stored the same entry first, or the cache is not writable
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+
+        self.evict()
+
+
+    # Get every entry as (last used, size, folder), oldest first
+    def entries(self):
+        entries = []
+
+        if not os.path.isdir(self.folder):
+            return entries
+
+        for prefix in os.listdir(self.folder):
+            prefix_folder = os.path.join(self.folder, prefix)
+            if not os.path.isdir(prefix_folder):
+                continue
+            for name in os.listdir(prefix_folder):
+                # Skip the entries that are still being built
+                if name.startswith("."):
+                    continue
+                folder = os.path.join(prefix_folder, name)
+                try:
+                    size = sum(entry.stat().st_size for entry in os.scandir(folder))
+                    entries.append((os.stat(folder).st_mtime, size, folder))
+                except OSError:
+                    continue
+
+        return sorted(entries)
+
+
+    # Remove the least recently used entries until the cache fits its size
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, folder in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(folder, ignore_errors=True)
+            total -= size
+
+
+    # Remove every entry
+    def clear(self):
+        for _, _, folder in self.entries():
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+    # Describe the hits and misses since the cache was opened
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0
+        return f"Cache: {self.hits} hit{'s' if self.hits != 1 else ''}, {self.misses} miss{'es' if self.misses != 1 else ''} ({rate:.1f}% hit rate)"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="artifact_cache",
+        description="Show or clear the cache of the ROM and EDID generators."
+    )
+
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        help=f"The folder of the cache. Defaults to {DEFAULT_CACHE_FOLDER}, or the LCD_DRIVER_CACHE environment variable.",
+        required=False,
+        default=DEFAULT_CACHE_FOLDER
+    )
+
+    parser.add_argument(
+        "--clear",
+        action="store_true",
+        help="Remove every entry from the cache.",
+        required=False,
+        default=False
+    )
+
+    args = parser.parse_args()
+    cache = Artifact_Cache(args.cache_dir)
+
+    if args.clear:
+        cache.clear()
+
+    entries = cache.entries()
+    print(f"{len(entries)} entries, {sum(size for _, size, _ in entries) / (1 << 20):.2f} MB in {cache.folder}")
+
+
+if __name__ == "__main__":
+    main()
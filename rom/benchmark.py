@@ -0,0 +1,85 @@
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from rom_generator import ROM_Program, ROM_Generator, WRITE_BUFFER_SIZE, emit_vhdl
+
+
+# Function that builds a random program with the given number of entries
+def random_program(depth, seed=0):
+    rng = random.Random(seed)
+    opcodes = list(ROM_Generator.instruction_opcodes.values())
+    program = ROM_Program("benchmark")
+
+    for idx in range(depth):
+        program.append(rng.choice(opcodes), rng.getrandbits(32), idx + 1)
+
+    return program
+
+
+# Function that times how long it takes to emit the program to a file
+def time_emit(program, path, repeats):
+    best = float("inf")
+
+    # Keep the best run to filter out noise from the rest of the system
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with open(path, 'w', buffering=WRITE_BUFFER_SIZE) as f:
+            emit_vhdl(program, f)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Benchmark the VHDL emitter of the ROM generator against the depth of the ROM."
+    )
+
+    parser.add_argument(
+        "-s",
+        "--start",
+        type=int,
+        help="The smallest ROM depth to emit.",
+        required=False,
+        default=1 << 10
+    )
+
+    parser.add_argument(
+        "-n",
+        "--steps",
+        type=int,
+        help="The number of times the ROM depth is doubled.",
+        required=False,
+        default=10
+    )
+
+    parser.add_argument(
+        "-r",
+        "--repeats",
+        type=int,
+        help="The number of runs per ROM depth, the fastest one is kept.",
+        required=False,
+        default=3
+    )
+
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "rom.vhd")
+
+        print(f"{'Depth':>10}  {'Time (ms)':>10}  {'ns/entry':>10}  {'Size (kB)':>10}")
+        for step in range(args.steps):
+            depth = args.start << step
+            program = random_program(depth)
+            elapsed = time_emit(program, path, args.repeats)
+            size = os.path.getsize(path)
+            # A linear emitter keeps the time per entry flat as the depth doubles
+            print(f"{depth:>10}  {elapsed * 1000:>10.2f}  {elapsed * 1e9 / depth:>10.1f}  {size / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
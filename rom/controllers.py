@@ -0,0 +1,41 @@
+# Minimum delays the display controllers need after a command before the next command can be sent
+# Each command maps to the delay in seconds before any next command, and the delays before specific next commands
+# The values are taken from the command descriptions in the datasheets of the controllers
+CONTROLLERS = {
+    "st7701s": {
+        # Software reset, 5 ms before the next command and 120 ms before a sleep out
+        0x01: (5e-3, {0x11: 120e-3}),
+        # Sleep in, 120 ms before a sleep out
+        0x10: (5e-3, {0x11: 120e-3}),
+        # Sleep out, 120 ms for the supply voltages and clock circuits to settle
+        0x11: (120e-3, {})
+    },
+    "st7789v": {
+        # Software reset, 5 ms before the next command and 120 ms before a sleep out
+        0x01: (5e-3, {0x11: 120e-3}),
+        # Sleep in, 5 ms before the next command and 120 ms before a sleep out
+        0x10: (5e-3, {0x11: 120e-3}),
+        # Sleep out, 5 ms before the next command and 120 ms before a sleep in
+        0x11: (5e-3, {0x10: 120e-3})
+    }
+}
+
+
+# The data words each controller reads as whole parameter bytes, in bits
+# Over the 4-line serial interface the controllers read the parameters a byte at a time for as long as the chip select is low,
+# so a word of 2, 3 or 4 bytes sends the same parameters as the bytes on their own
+DEFAULT_WIDE_WORDS = (16, 24, 32)
+WIDE_WORDS = {
+    "st7701s": (16, 24, 32),
+    "st7789v": (16, 24, 32)
+}
+
+
+# Get the minimum delay in seconds between the command and the next command, 0 if there is none
+def required_delay(controller, command, next_command):
+    delays = CONTROLLERS[controller]
+    if command not in delays:
+        return 0
+
+    delay, next_delays = delays[command]
+    return next_delays.get(next_command, delay)
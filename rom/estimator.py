@@ -0,0 +1,343 @@
+from array import array
+
+
+# Opcodes understood by the sequencer.vhd
+COMMAND = 0x10
+SIZE = 0x20
+DATA = 0x21
+WAIT = 0x30
+DELAY = 0x31
+REPEAT = 0x28
+
+# Opcodes of packed data, mapped to the number of bytes packed in the payload
+PACKED = {
+    0x22: 2,
+    0x23: 3,
+    0x24: 4
+}
+
+# The number of times a repeat sends its byte is kept in the upper 24 bits of the payload
+MAX_REPEAT = 2 ** 24 - 1
+
+# Names of the opcodes in the psuedo-assembly code
+OPCODE_NAMES = {
+    COMMAND: "cmd",
+    SIZE: "size",
+    DATA: "data",
+    WAIT: "wait",
+    DELAY: "delay",
+    0x22: "data2",
+    0x23: "data3",
+    0x24: "data4",
+    REPEAT: "repeat"
+}
+
+# Word sizes selected by the payload of a size instruction, see set_length_state in the sequencer.vhd
+WIDTH_CODES = {
+    0: 8,
+    1: 16,
+    2: 18,
+    3: 24,
+    4: 32
+}
+
+# The sequencer runs on the 200 MHz clock through the signal_divider with div => 4, which divides by 2 ** 4
+DEFAULT_CLOCK = 200e6 / 2 ** 4
+
+# The sequencer multiplies the payload of a wait instruction by this many clock cycles
+WAIT_MULTIPLIER = 100_000
+
+# Default delay_10ms from the c_spi_settings in the driver_top_pkg.vhd
+DEFAULT_DELAY_10MS = 0x16
+
+# Clock cycles spent fetching an instruction from the ROM: fetch_rom_data, wait_for_rom and process_instruction
+FETCH_CYCLES = 3
+
+# Clock cycles spent moving on to the next instruction: verify_pointer
+VERIFY_CYCLES = 1
+
+# Clock cycles spent before each byte of packed or repeated data: packed_data
+PACKED_CYCLES = 1
+
+
+# Number of bytes sent by a packed data or repeat entry, 0 for any other entry
+def packed_bytes(opcode, payload):
+    if opcode == REPEAT:
+        return payload >> 8
+    return PACKED.get(opcode, 0)
+
+
+# The bytes sent by a packed data or repeat entry, in order
+def unpack_bytes(opcode, payload):
+    if opcode == REPEAT:
+        return [payload & 0xff] * (payload >> 8)
+    # Packed data is sent from the most significant byte
+    return [(payload >> (24 - 8 * idx)) & 0xff for idx in range(PACKED.get(opcode, 0))]
+
+
+class Boot_Estimate:
+    # The result of an estimate, the cycles of every entry in the program and of the display reset
+    def __init__(self, program, clock, reset_cycles, entry_cycles, warnings):
+        self.program = program
+        self.clock = clock
+        self.reset_cycles = reset_cycles
+        self.entry_cycles = entry_cycles
+        self.warnings = warnings
+
+
+    # Total clock cycles from the end of the FPGA configuration until the sequencer is done
+    def total_cycles(self):
+        # The idle state takes one more cycle before done is raised
+        return self.reset_cycles + sum(self.entry_cycles) + 1
+
+
+    # Convert clock cycles to milliseconds
+    def to_ms(self, cycles):
+        return cycles * 1000 / self.clock
+
+
+    # Sum up the cycles of every instruction in each source line, slowest first
+    def slowest_lines(self):
+        lines = {}
+
+        for idx, cycles in enumerate(self.entry_cycles):
+            key = (self.program.lines[idx], self.program.opcodes[idx])
+            if key not in lines:
+                lines[key] = [cycles, [idx]]
+            else:
+                lines[key][0] += cycles
+                lines[key][1].append(idx)
+
+        return sorted(lines.items(), key=lambda item: item[1][0], reverse=True)
+
+
+    # Sum up the cycles of every opcode
+    def cycles_by_opcode(self):
+        totals = {}
+
+        for idx, cycles in enumerate(self.entry_cycles):
+            opcode = self.program.opcodes[idx]
+            totals[opcode] = totals.get(opcode, 0) + cycles
+
+        return totals
+
+
+    # Describe the entries of a line the way they were written
+    def describe(self, indices):
+        opcode = self.program.opcodes[indices[0]]
+        name = OPCODE_NAMES.get(opcode, "???")
+        # Packed data and repeats hold several bytes, so the whole payload is shown
+        digits = 8 if opcode in PACKED or opcode == REPEAT else 2
+        payloads = " ".join(f"0x{self.program.payloads[idx]:0{digits}x}" for idx in indices)
+        text = f"{name} {payloads}"
+
+        return text if len(text) <= 32 else text[:29] + "..."
+
+
+    # Print the estimate to the console
+    def print_report(self, top=10):
+        total = self.total_cycles()
+
+        print(f"Boot time estimate for \"{self.program.source}\" at {self.clock / 1e6:.2f} MHz")
+        print(f"  Display reset: {self.to_ms(self.reset_cycles):>12.3f} ms")
+        for opcode, cycles in sorted(self.cycles_by_opcode().items()):
+            print(f"  {OPCODE_NAMES.get(opcode, '???').capitalize() + ':':<14} {self.to_ms(cycles):>12.3f} ms")
+        print(f"  Total:         {self.to_ms(total):>12.3f} ms ({total} cycles, {len(self.entry_cycles)} ROM entries)")
+
+        # Rank the lines so its obvious which waits and transfers to cut
+        print(f"\nSlowest {top} lines:")
+        print(f"  {'Line':>5}  {'Instruction':<32}  {'Entries':>7}  {'Time (ms)':>12}  {'Share':>6}")
+        for (line, _), (cycles, indices) in self.slowest_lines()[:top]:
+            print(f"  {line:>5}  {self.describe(indices):<32}  {len(indices):>7}  {self.to_ms(cycles):>12.3f}  {100 * cycles / total:>5.1f}%")
+
+        for warning in self.warnings:
+            print(f"WARNING: {warning}")
+
+
+class Boot_Time_Estimator:
+    # The settings match the t_spi_settings record in the driver_top_pkg.vhd
+    def __init__(self, clock=DEFAULT_CLOCK, delay_10ms=DEFAULT_DELAY_10MS, alt_spi_dc=True, resetter_en=True, invert_dc=True):
+        self.clock = clock
+        self.delay_10ms = delay_10ms
+        self.alt_spi_dc = alt_spi_dc
+        self.resetter_en = resetter_en
+        self.invert_dc = invert_dc
+        # A transfer only depends on the word size, so it is simulated once per size
+        self.__traces = {}
+
+
+    # Clock cycles spent by the resetter.vhd before the sequencer starts fetching instructions
+    def reset_cycles(self):
+        # Without the resetter, the sequencer only spends the reset state
+        if not self.resetter_en:
+            return 1
+
+        # Each reset state counts until the bit at delay_10ms (or delay_10ms + 2) is set, plus the cycle that sees it
+        first = 2 ** self.delay_10ms + 1
+        second = 2 ** (self.delay_10ms + 2) + 1
+        third = 2 ** self.delay_10ms + 1
+
+        # The idle and done states of the resetter, and the reset state of the sequencer
+        return 1 + first + second + third + 1 + 1
+
+
+    # Clock cycles spent by the sequencer from start_transmission until the SPI is done with a word
+    def transfer_cycles(self, bits):
+        return len(self.trace_transfer(bits))
+
+
+    # The outputs of the SPI after every clock cycle of a transfer, see __simulate_transfer
+    def trace_transfer(self, bits):
+        if bits not in self.__traces:
+            self.__traces[bits] = self.__simulate_transfer(bits)
+
+        return self.__traces[bits]
+
+
+    # Step the sequencer.vhd and spi.vhd state machines through a single transfer, a clock cycle at a time
+    # Returns the (sda, scl, cs) outputs of the SPI after every cycle, where sda is the bit of the
+    # word that is shifted out, or -1 when SDA is held low
+    def __simulate_transfer(self, bits):
+        # The SPI counts down to zero, one bit more when the DC bit is sent in front of the word
+        bit_count = bits if self.alt_spi_dc else bits - 1
+
+        # Registers of the sequencer
+        sequencer_state = "start_transmission"
+        send = 0
+        # Registers of the SPI, sitting in idle since the last transfer
+        spi_state = "idle"
+        delay_cnt = 0
+        bit_cnt = bit_count
+        spi_done = 1
+        spi_sda = -1
+        spi_scl = 0
+        spi_cs = 1
+
+        trace = []
+        while True:
+            # The delay is half as long while shifting and clocking the bits
+            if spi_state == "shiftout" or spi_state == "clk":
+                delay_done = delay_cnt & 1
+            else:
+                delay_done = (delay_cnt >> 2) & 1
+
+            # Next state of the sequencer
+            next_send = send
+            next_sequencer_state = sequencer_state
+            if sequencer_state == "start_transmission":
+                next_send = 1
+                next_sequencer_state = "end_transmission"
+            elif sequencer_state == "end_transmission":
+                next_send = 0
+                next_sequencer_state = "give_spi_time_1"
+            elif sequencer_state == "give_spi_time_1":
+                next_sequencer_state = "give_spi_time_2"
+            elif sequencer_state == "give_spi_time_2":
+                next_sequencer_state = "wait_for_spi"
+            elif spi_done:
+                # The sequencer moves on to verify_pointer after this cycle
+                trace.append((spi_sda, spi_scl, spi_cs))
+                return trace
+
+            # Next value of the delay counter
+            if delay_done or spi_state == "idle":
+                next_delay_cnt = 0
+            else:
+                next_delay_cnt = delay_cnt + 1
+
+            # Next value of the bit counter
+            next_bit_cnt = bit_cnt
+            if spi_state == "idle":
+                next_bit_cnt = bit_count
+            elif spi_state == "clk" and delay_done and bit_cnt > 0:
+                next_bit_cnt = bit_cnt - 1
+
+            # Next state and outputs of the SPI
+            next_spi_state = spi_state
+            next_spi_done = spi_done
+            next_spi_sda = spi_sda
+            next_spi_scl = spi_scl
+            next_spi_cs = spi_cs
+            if spi_state == "idle":
+                next_spi_sda = -1
+                next_spi_scl = 0
+                next_spi_cs = 1
+                next_spi_done = 1
+                if send:
+                    next_spi_state = "start"
+            elif spi_state == "start":
+                next_spi_scl = 0
+                next_spi_cs = 0
+                next_spi_done = 0
+                if delay_done:
+                    next_spi_state = "shiftout"
+            elif spi_state == "shiftout":
+                next_spi_sda = bit_cnt
+                next_spi_scl = 0
+                if delay_done:
+                    next_spi_state = "clk"
+            elif spi_state == "clk":
+                next_spi_scl = 1
+                if delay_done:
+                    next_spi_state = "stop" if bit_cnt == 0 else "shiftout"
+            elif spi_state == "stop":
+                next_spi_sda = -1
+                next_spi_scl = 0
+                if delay_done:
+                    next_spi_state = "idle"
+
+            # Clock edge
+            sequencer_state = next_sequencer_state
+            send = next_send
+            spi_state = next_spi_state
+            delay_cnt = next_delay_cnt
+            bit_cnt = next_bit_cnt
+            spi_done = next_spi_done
+            spi_sda = next_spi_sda
+            spi_scl = next_spi_scl
+            spi_cs = next_spi_cs
+            trace.append((spi_sda, spi_scl, spi_cs))
+
+
+    # Estimate how long the sequencer takes to run through the program
+    def estimate(self, program):
+        entry_cycles = array('Q')
+        warnings = []
+        word_size = 8
+
+        for idx in range(len(program)):
+            opcode = program.opcodes[idx]
+            payload = program.payloads[idx]
+            cycles = FETCH_CYCLES + VERIFY_CYCLES
+
+            # A command is always sent as an 8 bit word
+            if opcode == COMMAND:
+                word_size = 8
+                cycles += self.transfer_cycles(word_size)
+            elif opcode == DATA:
+                cycles += self.transfer_cycles(word_size)
+            # set_length_state
+            elif opcode == SIZE:
+                cycles += 1
+                # The sequencer keeps the current word size if it does not understand the payload
+                if payload in WIDTH_CODES:
+                    word_size = WIDTH_CODES[payload]
+                else:
+                    warnings.append(f"the sequencer does not understand \"size {payload}\" on line {program.lines[idx]}, the word size stays at {word_size} bits")
+            # wait_init_state, wait_calculate_state and counting down to zero in wait_state
+            elif opcode == WAIT:
+                cycles += 2 + payload * WAIT_MULTIPLIER + 1
+            # Counting down to zero in wait_state
+            elif opcode == DELAY:
+                cycles += payload + 1
+            # packed_data_state and an 8 bit transfer for every byte
+            elif opcode in PACKED or opcode == REPEAT:
+                word_size = 8
+                cycles += packed_bytes(opcode, payload) * (PACKED_CYCLES + self.transfer_cycles(word_size))
+            else:
+                warnings.append(f"the sequencer stops at the unknown opcode 0x{opcode:02x} on line {program.lines[idx]}")
+                break
+
+            entry_cycles.append(cycles)
+
+        return Boot_Estimate(program, self.clock, self.reset_cycles(), entry_cycles, warnings)
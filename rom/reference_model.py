@@ -0,0 +1,229 @@
+import numpy as np
+
+from estimator import Boot_Time_Estimator, COMMAND, SIZE, DATA, WAIT, DELAY, REPEAT, PACKED, WIDTH_CODES, WAIT_MULTIPLIER, FETCH_CYCLES, VERIFY_CYCLES, PACKED_CYCLES
+
+
+# Signals in the order they are written to the VCD, with their VCD identifiers
+SIGNALS = {
+    "disp_rst_n": "!",
+    "spi_cs": "\"",
+    "spi_scl": "#",
+    "spi_sda": "$",
+    "spi_dc": "%",
+    "done": "&"
+}
+
+# Look up table from the payload of a size instruction to the word size, 0 when the sequencer does not understand it
+WIDTH_TABLE = np.array([WIDTH_CODES.get(code, 0) for code in range(max(WIDTH_CODES) + 1)], dtype=np.int64)
+
+
+class Waveform:
+    # The expected outputs of the sequencer, stored as the clock cycles where each signal changes
+    def __init__(self, source, clock, signals, transfers, end_cycle):
+        self.source = source
+        self.clock = clock
+        # Signal name -> (cycles, values)
+        self.signals = signals
+        # Every SPI transfer as (start cycle, dc bit, bit count, word)
+        self.transfers = transfers
+        # The cycle where done goes high
+        self.end_cycle = end_cycle
+
+
+    # Write the waveform as a value change dump, readable by GTKWave and most simulators
+    def write_vcd(self, filename):
+        period_ps = round(1e12 / self.clock)
+
+        # Merge the changes of every signal into a single timeline
+        cycles = np.concatenate([self.signals[name][0] for name in SIGNALS])
+        values = np.concatenate([self.signals[name][1] for name in SIGNALS])
+        identifiers = np.concatenate([np.full(len(self.signals[name][0]), idx) for idx, name in enumerate(SIGNALS)])
+        order = np.lexsort((identifiers, cycles))
+        cycles = cycles[order]
+        values = values[order]
+        identifiers = identifiers[order]
+        names = list(SIGNALS.values())
+
+        with open(filename, 'w', buffering=1 << 16) as f:
+            f.write(f"$comment Expected outputs of the sequencer for {self.source} $end\n")
+            f.write("$timescale 1 ps $end\n")
+            f.write("$scope module sequencer $end\n")
+            for name, identifier in SIGNALS.items():
+                f.write(f"$var wire 1 {identifier} {name} $end\n")
+            f.write("$upscope $end\n")
+            f.write("$enddefinitions $end\n")
+
+            # Start a new time stamp every time the cycle changes
+            starts = np.flatnonzero(np.diff(cycles, prepend=-1))
+            ends = np.append(starts[1:], len(cycles))
+            for start, end in zip(starts, ends):
+                f.write(f"#{int(cycles[start]) * period_ps}\n")
+                f.write("".join([f"{values[idx]}{names[identifiers[idx]]}\n" for idx in range(start, end)]))
+
+
+    # Write every SPI transfer the testbench should expect, one per line
+    # Each line holds the cycle the transfer starts at, the DC bit, the number of bits after the DC bit and the word
+    def write_vectors(self, filename):
+        start_cycles, dc_bits, bit_counts, words = self.transfers
+
+        with open(filename, 'w', buffering=1 << 16) as f:
+            f.write(f"-- Expected SPI transfers of the sequencer for {self.source}\n")
+            f.write(f"-- Clock: {self.clock:.0f} Hz, done after {self.end_cycle} cycles\n")
+            f.write("-- cycle dc bits data\n")
+            f.write("".join([
+                f"{cycle} {dc} {bits} {word:08x}\n"
+                for cycle, dc, bits, word in zip(start_cycles.tolist(), dc_bits.tolist(), bit_counts.tolist(), words.tolist())
+            ]))
+
+
+class Reference_Model:
+    # The model uses the same settings and SPI traces as the boot time estimator
+    def __init__(self, estimator=None):
+        self.estimator = estimator or Boot_Time_Estimator()
+
+
+    # Turn the trace of a transfer into the cycles where each output changes, relative to start_transmission
+    def __template(self, bits):
+        trace = np.array(self.estimator.trace_transfer(bits), dtype=np.int64)
+        # The trace holds the outputs after each clock edge, the first one is seen a cycle after start_transmission
+        offsets = np.arange(1, len(trace) + 1)
+
+        template = {}
+        for column, name in enumerate(("spi_sda", "spi_scl", "spi_cs")):
+            # The SPI idles with SDA low, SCL low and CS high before every transfer
+            previous = np.concatenate(([(-1, 0, 1)[column]], trace[:-1, column]))
+            changes = trace[:, column] != previous
+            template[name] = (offsets[changes], trace[changes, column])
+
+        return template
+
+
+    # Run the program through the model, returning the expected waveform
+    def run(self, program):
+        estimator = self.estimator
+        opcodes = np.frombuffer(program.opcodes, dtype=np.uint8).astype(np.int64)
+        payloads = np.frombuffer(program.payloads, dtype=np.uint32).astype(np.int64)
+
+        # The sequencer stops at the first opcode it does not understand
+        unknown = np.flatnonzero(~np.isin(opcodes, (COMMAND, SIZE, DATA, WAIT, DELAY, REPEAT, *PACKED)))
+        if len(unknown):
+            opcodes = opcodes[:unknown[0]]
+            payloads = payloads[:unknown[0]]
+
+        is_command = opcodes == COMMAND
+        is_size = opcodes == SIZE
+        is_data = opcodes == DATA
+        is_wait = opcodes == WAIT
+        is_repeat = opcodes == REPEAT
+        is_packed = np.isin(opcodes, tuple(PACKED)) | is_repeat
+        is_transfer = is_command | is_data | is_packed
+
+        # Number of transfers of every entry, packed data and repeats send several bytes
+        counts = is_transfer.astype(np.int64)
+        for opcode, count in PACKED.items():
+            counts[opcodes == opcode] = count
+        counts[is_repeat] = payloads[is_repeat] >> 8
+
+        # A command, packed data and repeats go back to 8 bit words, and a size the sequencer understands changes the word size
+        widths = np.zeros(len(opcodes), dtype=np.int64)
+        widths[is_command | is_packed] = 8
+        understood = is_size & (payloads < len(WIDTH_TABLE))
+        widths[understood] = WIDTH_TABLE[payloads[understood]]
+        # Every other entry keeps the word size of the last entry that set one, starting at 8 bits
+        setters = np.where(widths > 0, np.arange(len(widths)), -1)
+        setters = np.maximum.accumulate(setters) if len(setters) else setters
+        widths = np.where(setters >= 0, widths[np.maximum(setters, 0)], 8)
+
+        # Clock cycles spent on every entry
+        transfer_cycles = np.zeros(33, dtype=np.int64)
+        for bits in WIDTH_CODES.values():
+            transfer_cycles[bits] = estimator.transfer_cycles(bits)
+        cycles = np.full(len(opcodes), FETCH_CYCLES + VERIFY_CYCLES, dtype=np.int64)
+        cycles += np.where(is_command | is_data, transfer_cycles[widths], 0)
+        cycles += np.where(is_packed, counts * (PACKED_CYCLES + transfer_cycles[8]), 0)
+        cycles += np.where(is_size, 1, 0)
+        cycles += np.where(is_wait, 3 + payloads * WAIT_MULTIPLIER, 0)
+        cycles += np.where(opcodes == DELAY, payloads + 1, 0)
+
+        # Cycle every entry starts at, and the cycle the transfers hit start_transmission
+        reset_cycles = estimator.reset_cycles()
+        starts = reset_cycles + np.concatenate(([0], np.cumsum(cycles)[:-1])) if len(cycles) else cycles
+        end_cycle = reset_cycles + int(cycles.sum()) + 1
+        # Every transfer points back to its entry, and counts the bytes sent before it by the same entry
+        entries = np.repeat(np.arange(len(opcodes)), counts)
+        first_transfers = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+        positions = np.arange(len(entries)) - first_transfers[entries]
+        # Each byte of packed data goes through packed_data before its transfer, and follows the byte before it
+        packed = is_packed[entries]
+        transfer_starts = starts[entries] + FETCH_CYCLES
+        transfer_starts += np.where(packed, PACKED_CYCLES + positions * (PACKED_CYCLES + transfer_cycles[8]), 0)
+
+        # The DC bit of commands is low when invert_dc is set, the DC bit of data is the opposite
+        command_dc = 0 if estimator.invert_dc else 1
+        dc_bits = np.where(is_command[entries], command_dc, 1 - command_dc)
+        bit_widths = widths[entries]
+        # Packed data is sent from the most significant byte, a repeat sends its lowest byte every time
+        shifts = np.where(is_repeat[entries], 0, 24 - 8 * positions)
+        words = np.where(packed, (payloads[entries] >> np.maximum(shifts, 0)) & 0xff, payloads[entries])
+        # The SPI shifts out the bits of data_int from bit_count down to 0, with the DC bit at bit_count
+        bit_counts = bit_widths if estimator.alt_spi_dc else bit_widths - 1
+        data_int = words & ~(1 << bit_counts)
+        if estimator.alt_spi_dc:
+            data_int |= dc_bits << bit_counts
+
+        signals = {name: ([np.array([0])], [np.array([initial])]) for name, initial in (("spi_sda", 0), ("spi_scl", 0), ("spi_cs", 1))}
+
+        # Place the template of every word size at the start of each transfer of that size
+        for bits in np.unique(bit_widths):
+            selected = bit_widths == bits
+            template = self.__template(int(bits))
+            for name, (offsets, values) in template.items():
+                times = (transfer_starts[selected][:, None] + offsets[None, :]).ravel()
+                if name == "spi_sda":
+                    # Look up the bit of each word that is on SDA, -1 holds SDA low
+                    shifts = np.maximum(values, 0)[None, :]
+                    bit_values = (data_int[selected][:, None] >> shifts) & 1
+                    values = np.where(values[None, :] >= 0, bit_values, 0).ravel()
+                else:
+                    values = np.broadcast_to(values[None, :], (selected.sum(), len(values))).ravel()
+                signals[name][0].append(times)
+                signals[name][1].append(values)
+
+        # Without the alternative DC, the DC pin follows set_dc a cycle after start_transmission
+        if estimator.alt_spi_dc:
+            dc = (np.array([0]), np.array([0]))
+        else:
+            dc = (np.concatenate(([0], transfer_starts + 1)), np.concatenate(([0], dc_bits)))
+
+        waveform_signals = {
+            "disp_rst_n": self.__reset_waveform(),
+            "spi_dc": self.__remove_repeats(*dc),
+            "done": (np.array([0, end_cycle]), np.array([0, 1]))
+        }
+        for name, (times, values) in signals.items():
+            times = np.concatenate(times)
+            values = np.concatenate(values)
+            # Keep the changes in the order they happen
+            order = np.argsort(times, kind="stable")
+            waveform_signals[name] = self.__remove_repeats(times[order], values[order])
+
+        transfers = (transfer_starts, dc_bits, bit_widths, words)
+        return Waveform(program.source, estimator.clock, waveform_signals, transfers, end_cycle)
+
+
+    # Drop the changes that do not change the value of the signal
+    def __remove_repeats(self, times, values):
+        keep = np.concatenate(([True], values[1:] != values[:-1]))
+        return times[keep], values[keep]
+
+
+    # The display reset generated by the resetter.vhd
+    def __reset_waveform(self):
+        estimator = self.estimator
+        if not estimator.resetter_en:
+            return np.array([0]), np.array([1])
+
+        # Low in the idle state, high for ~10 ms, low for ~100 ms and then high again
+        first = 2 ** estimator.delay_10ms + 1
+        second = 2 ** (estimator.delay_10ms + 2) + 1
+        return np.array([0, 2, 2 + first, 2 + first + second]), np.array([0, 1, 0, 1])
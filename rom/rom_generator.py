@@ -1,90 +1,441 @@
+import io
 import os
+import re
+import json
+import math
+import glob
+import time
+import cProfile
+import hashlib
 import argparse
+import tempfile
+import functools
+import contextlib
+import concurrent.futures
+from array import array
+
+from estimator import Boot_Time_Estimator, DEFAULT_CLOCK, COMMAND, SIZE, DATA, REPEAT, PACKED, MAX_REPEAT, WIDTH_CODES, OPCODE_NAMES, FETCH_CYCLES, VERIFY_CYCLES, packed_bytes, unpack_bytes
+from controllers import CONTROLLERS, WIDE_WORDS, DEFAULT_WIDE_WORDS, required_delay
+from artifact_cache import Artifact_Cache, DEFAULT_CACHE_FOLDER, DEFAULT_MAX_SIZE, same_content, hash_file, source_version
+
+
+class ROM_Program:
+    # The compiled program is kept as parallel arrays, one entry per ROM address
+    # opcodes holds the 8 bit instruction, payloads holds the 32 bit payload
+    # and lines holds the line in the source file the entry was compiled from
+    def __init__(self, source=""):
+        self.source = source
+        self.opcodes = array('B')
+        self.payloads = array('I')
+        self.lines = array('I')
+        # Comments are kept on the side, indexed by the entry they precede
+        self.comments = {}
+
+
+    # Add a single entry to the program
+    def append(self, opcode, payload, line):
+        self.opcodes.append(opcode)
+        self.payloads.append(payload)
+        self.lines.append(line)
+
+
+    # Attach a comment to the next entry of the program
+    def add_comment(self, comment):
+        self.comments.setdefault(len(self.opcodes), []).append(comment)
+
+
+    # Build a new program from the entries at the given indices, in order
+    def select(self, indices):
+        program = ROM_Program(self.source)
+        pending = []
+        position = 0
+
+        for idx in indices:
+            # Comments of removed entries move on to the next entry that is kept
+            while position <= idx:
+                pending.extend(self.comments.get(position, ()))
+                position += 1
+            if pending:
+                program.comments[len(program)] = pending
+                pending = []
+            program.append(self.opcodes[idx], self.payloads[idx], self.lines[idx])
+
+        # Keep any comments after the last entry that was kept
+        while position <= len(self):
+            pending.extend(self.comments.get(position, ()))
+            position += 1
+        if pending:
+            program.comments[len(program)] = pending
+
+        return program
+
+
+    def __len__(self):
+        return len(self.opcodes)
+
+
+class ROM_Macro:
+    # A macro of the psuedo-assembly code, its body is kept as text and parsed once for every set of arguments it is called with
+    # The macro is shared by every file with the same text, so the file it is defined in is given when it is called
+    def __init__(self, name, params):
+        self.name = name
+        self.params = params
+        # The (line number, line) pairs of the body
+        self.body = []
+        # The parsed bodies, keyed by the arguments
+        self.expansions = {}
+
+
+    # Fill the arguments in for the {parameters} of the body and parse it, returns None if the arguments do not match the parameters
+    # A last parameter written as *name takes the rest of the arguments
+    def expand(self, generator, args, source=""):
+        args = tuple(args)
+        if args in self.expansions:
+            return self.expansions[args]
+
+        values = {}
+        for idx, param in enumerate(self.params):
+            if param.startswith("*"):
+                values[param[1:]] = " ".join(args[idx:])
+                break
+            if idx >= len(args):
+                return None
+            values[param] = args[idx]
+        else:
+            if len(args) != len(self.params):
+                return None
+
+        lines = []
+        for line_number, line in self.body:
+            for param, value in values.items():
+                line = line.replace("{" + param + "}", value)
+            lines.append((line_number, line))
+
+        expansion = generator.parse_fragment(lines, source)
+        # A macro defined inside a macro would only be known inside that call
+        if expansion.macros:
+            print(f"ERROR: MACRO \"{self.name}\" DEFINES ANOTHER MACRO" + (f" IN \"{source}\"" if source else "") + "!")
+            exit()
+
+        self.expansions[args] = expansion
+        return expansion
+
+
+class ROM_Fragment:
+    # A parsed file of psuedo-assembly code, shared by every file that includes the same text
+    # statements holds the instructions, comments, includes and macro calls in order, and macros the macros defined in the file
+    def __init__(self):
+        self.statements = []
+        self.macros = {}
+        # The number of lines that were parsed
+        self.lines = 0
+
+
+# The parsed fragments keyed by the hash of their text, shared by every file compiled in the process
+# A fragment only holds what was parsed from the text, the file it came from is given when it is compiled
+fragment_cache = {}
+
+# The number of fragments kept in the cache
+FRAGMENT_CACHE_SIZE = 1024
+
+
+# The formats the ROM can be written in, and the extension of each
+# The memory files hold the ROM as words of the instruction above the payload, for data2mem and updatemem
+ROM_FORMATS = {
+    "vhdl": ".vhd",
+    "mem": ".mem",
+    "coe": ".coe",
+    "bmm": ".bmm",
+    "mmi": ".mmi"
+}
+
+# Bits of a memory word, the instruction in bits 39 to 32 and the payload in bits 31 to 0
+MEMORY_WORD_BITS = 40
+
+# The ROM is padded with delays of 0 cycles, which the sequencer steps over
+PAD_OPCODE = 0x31
+
+# The block RAMs the BMM splits the word over, as the instance, the most and the least significant bit
+# The instances are named after the ROM constants inside sequencer_inst/rom_comp, check them against the implemented design
+DEFAULT_BRAMS = (("sequencer_inst/rom_comp/instruction_rom", 39, 32), ("sequencer_inst/rom_comp/payload_rom", 31, 0))
+
+# The part written in the MMI, the Zynq of the Zybo Z7-10
+DEFAULT_PART = "xc7z010clg400-1"
+
+# The site of a block RAM in the MMI, such as RAMB18_X0Y0
+BRAM_SITE = re.compile(r"(RAMB18|RAMB36)_(X\d+Y\d+)")
 
 
 class ROM_Generator:
-    __instruction_psuedo = [
-        "cmd",
-        "size",
-        "data",
-        "wait"
-    ]
-
-    __instruction_hex = [
-        0x10,
-        0x20,
-        0x21,
-        0x30
-    ]
-
-    __word_sizes = [
-        8,
-        16,
-        18,
-        24,
-        32
-    ]
+    # Map the psuedo-assembly instructions to the opcodes the sequencer understands
+    instruction_opcodes = {
+        "cmd":  0x10,
+        "size": 0x20,
+        "data": 0x21,
+        "wait": 0x30,
+        "delay": 0x31
+    }
+
+    # Directives of the psuedo-assembly code that are not instructions
+    directives = {"include", "macro", "endmacro"}
+
+    # Opcodes that make the sequencer wait
+    wait_opcodes = {0x30, 0x31}
+
+    # Units a wait can be given in, in seconds
+    wait_units = {
+        "ms": 1e-3,
+        "us": 1e-6,
+        "s": 1
+    }
+
+    # Map the opcodes back to the psuedo-assembly instructions, including the ones only made by the compression
+    instruction_names = {opcode: name for name, opcode in instruction_opcodes.items()}
+    instruction_names.update({opcode: OPCODE_NAMES[opcode] for opcode in (*PACKED, REPEAT)})
+
+    # Map the word sizes to the width codes the sequencer takes in the payload of a size instruction
+    __width_codes = {bits: code for code, bits in WIDTH_CODES.items()}
+
+    # The sequencer addresses the ROM with 8 bits
+    rom_depth = 256
+
+    # The sequencer multiplies the wait by 100_000 in a 32 bit signed integer
+    max_wait = (2 ** 31 - 1) // 100_000
+
+    # A delay is counted in clock cycles in a 32 bit signed integer
+    max_delay = 2 ** 31 - 1
+
+    # Commands that select the register page the following commands write to (ST7701S)
+    page_select_commands = {0xff}
+
+    # Commands that reset every register of the display (software reset)
+    reset_commands = {0x01}
+
+    # Commands whose data is streamed rather than stored, these are never deduplicated
+    stream_commands = {0x2c, 0x3c}
 
     # Constructor
-    def __init__(self, filename, debug):
-        # Load the psuedo-assembly code from the file
-        assembly = self.__load_rom(filename)
-        # Optimize the psuedo-assembly code
-        assembly, comment_counter = self.optimize_content(assembly, debug)
-        # Parse the psuedo-assembly code
-        command, payload = self.parse_content(assembly)
+    def __init__(self, filename, debug, output="rom.vhd", debug_output="output/instructions_optimized.txt", quiet=False, optimize=False, estimate=False, clock=DEFAULT_CLOCK, vectors=False, controller=None, tighten=False, compress=False, cache=None, stats=False, widen=False, four_wire=False, formats=("vhdl",), pad=False, brams=DEFAULT_BRAMS, part=DEFAULT_PART, instance=None):
+        start = time.perf_counter()
+        # Store where the generated files should end up
+        self.output = output
+        self.debug_output = debug_output
+        self.quiet = quiet
+        self.boot_estimate = None
+        # The estimated boot time in ms, also known when the files came from the cache
+        self.boot_time = None
+        # Whether the files were served from the cache
+        self.cache_hit = False
+        # Whether the ROM file was replaced, it is left as is when the content did not change
+        self.rom_changed = False
+        # Every file the program was compiled from, watched for changes in watch mode
+        self.sources = [filename]
+        # Waits given in time are converted to clock cycles of the sequencer
+        self.clock = clock
+        # The display takes the data/command signal on a pin of its own, alt_spi_dc => '0' in the c_spi_settings
+        self.four_wire = four_wire
+        # The formats the ROM is written in, and the block RAMs, part and instance of the ROM the BMM and MMI describe
+        self.formats = formats
+        self.pad = pad
+        self.brams = brams
+        self.part = part
+        self.instance = instance
+        self.check_formats()
+        # The time spent in each phase of the generator, in seconds
+        self.phase_times = {}
+        # The timings and counts of the run, only gathered when asked for
+        self.stats = None
+        # The number of fragments parsed and taken from the fragment cache, and the lines parsed
+        self.fragment_counts = {"parsed": 0, "reused": 0, "lines": 0}
+        # Serve the generated files from the cache when nothing they depend on has changed
+        if cache is not None:
+            options = {
+                "debug": debug,
+                "optimize": optimize,
+                "estimate": estimate,
+                "clock": clock,
+                "vectors": vectors,
+                "controller": controller,
+                "tighten": tighten,
+                "compress": compress,
+                "widen": widen,
+                "four_wire": four_wire,
+                "formats": list(formats),
+                "pad": pad,
+                "brams": [list(bram) for bram in brams],
+                "part": part,
+                "instance": instance
+            }
+            with self.phase("cache"):
+                cache_key = cache.key("rom_generator", generator_version(), filename, hash_file(filename) or "", options)
+                cached_files = self.cached_files(debug, vectors)
+                hit = self.fetch_from_cache(cache, cache_key, cached_files)
+            if hit:
+                if stats:
+                    self.finish_stats(filename, start, self.program_stats)
+                    if not quiet:
+                        self.print_stats(self.stats)
+                return
+        # Compile the psuedo-assembly code straight into the program
+        with self.phase("compile"):
+            self.program = self.__load_rom(filename)
+        # Remove the redundant instructions from the program
+        if optimize:
+            with self.phase("optimize"):
+                self.program, savings = self.optimize_content(self.program)
+            if not quiet:
+                self.print_savings(savings)
+        # Send the data bytes in the widest words the controller takes
+        if widen:
+            with self.phase("widen"):
+                self.program, widening = self.widen_content(self.program, controller, compress)
+            if not quiet and widening:
+                self.print_widening(widening)
+        # Make sure the waits after each command are as long as the controller needs, and no longer
+        if controller is not None:
+            with self.phase("check_delays"):
+                self.program = self.check_delays(self.program, controller, tighten)
+        # Pack the 8 bit data into fewer entries so longer programs fit the ROM
+        if compress:
+            with self.phase("compress"):
+                self.program, compression = self.compress_content(self.program)
+            if not quiet:
+                self.print_compression(compression)
+        # Show the stats of a program that does not fit before the size check stops the run
+        if stats and len(self.program) > self.rom_depth and not quiet:
+            self.print_stats(self.finish_stats(filename, start, self.count_program(self.program)))
+        # Make sure the program fits the ROM
+        with self.phase("check_size"):
+            self.check_rom_size(self.program)
+        # Write the compiled psuedo-assembly code back out if requested
+        if debug:
+            with self.phase("write_optimized"):
+                self.write_optimized(self.program)
         # Generate the ROM file
-        self.generate_rom(command, payload, comment_counter)
+        with self.phase("generate_rom"):
+            self.generate_rom(self.program)
+        # Estimate how long the display takes to boot with this ROM
+        report = None
+        if estimate:
+            with self.phase("estimate"):
+                self.boot_estimate = self.estimator().estimate(self.program)
+                self.boot_time = self.boot_estimate.to_ms(self.boot_estimate.total_cycles())
+                # Keep the report, so it can be printed again when the files come from the cache
+                with contextlib.redirect_stdout(io.StringIO()) as report:
+                    self.boot_estimate.print_report()
+                report = report.getvalue()
+            if not quiet:
+                print(report, end="")
+        # Write the waveforms the sequencer is expected to output
+        if vectors:
+            with self.phase("vectors"):
+                self.generate_vectors(self.program, clock)
+        # The counts only depend on the program, so they are kept in the cache with the files
+        program_stats = self.count_program(self.program) if stats or cache is not None else None
+        # Keep the generated files for the next time
+        if cache is not None:
+            with self.phase("cache"):
+                cache.store(cache_key, cached_files, self.sources, {"boot_time": self.boot_time, "report": report, "program_stats": program_stats})
+        if stats:
+            self.finish_stats(filename, start, program_stats)
+            if not quiet:
+                self.print_stats(self.stats)
+
+
+    # The boot time estimator for the SPI settings of the display
+    def estimator(self, clock=None):
+        return Boot_Time_Estimator(clock or self.clock, alt_spi_dc=not self.four_wire)
+
+
+    # Time the code run inside the with statement as a phase of the generator, adding to its earlier time
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        yield
+        self.phase_times[name] = self.phase_times.get(name, 0) + time.perf_counter() - start
+
+
+    # The files the generator writes, named as they are stored in the cache
+    def cached_files(self, debug, vectors):
+        files = {"rom" + ROM_FORMATS[rom_format]: path for rom_format, path in self.format_paths().items()}
+        if debug:
+            files["optimized.txt"] = self.debug_output
+        if vectors:
+            name = os.path.splitext(self.output)[0]
+            files["waveform.vcd"] = name + ".vcd"
+            files["vectors.txt"] = name + "_vectors.txt"
+        return files
+
+
+    # Copy the generated files from the cache, returns False if they have to be generated
+    def fetch_from_cache(self, cache, cache_key, cached_files):
+        meta = cache.fetch(cache_key, cached_files)
+        if meta is None:
+            return False
+
+        self.cache_hit = True
+        self.sources = list(meta["sources"])
+        self.rom_changed = any(name.startswith("rom.") for name in meta["changed"])
+        self.boot_time = meta.get("boot_time")
+        self.program = None
+        # Entries stored before the counts were kept have none
+        self.program_stats = meta.get("program_stats")
+
+        if not self.quiet:
+            print("ROM file served from the cache!" if self.rom_changed else "ROM file is unchanged, served from the cache.")
+            if meta.get("report"):
+                print(meta["report"], end="")
+        return True
+
+
+    # Function that loads and compiles the psuedo-assembly code from the instructions.txt file
+    def __load_rom(self, filename):
+        self.compiled_source = filename
+        return self.compile_fragment(self.load_fragment(filename), filename)
 
 
-    # Function that loads the psuedo-assembly code from the instructions.txt file
-    def __load_rom(self, filename):
+    # Function that reads a file and parses it into a fragment, or takes the fragment from the cache if the same text was parsed before
+    def load_fragment(self, filename):
         # Check if the file exists
         try:
-            # Load the ROM psuedo-assembly code into a list
-            with open(filename) as f:
-                rom = f.readlines()
+            with open(filename, 'rb') as f:
+                content = f.read()
         except IOError:
             # Print the error in the console
             print(f"ERROR: FILE \"{filename}\" DOES NOT EXIST!")
             # Exit the program
             exit()
 
-        return rom
+        digest = hashlib.sha256(content).hexdigest()
+        fragment = fragment_cache.get(digest)
+        if fragment is not None:
+            self.fragment_counts["reused"] += 1
+            return fragment
 
+        fragment = self.parse_fragment(enumerate(content.decode().splitlines(), 1), filename)
+        self.fragment_counts["parsed"] += 1
+        self.fragment_counts["lines"] += fragment.lines
 
-    # Throw an error if the instruction is not valid
-    def __error(self, line):
-        print("ERROR: UNKNOWN INSTRUCTION \"" + str(line) + "\"!")
-        exit()
+        # Forget the oldest fragments first, so a long running watch does not keep every version of a file
+        if len(fragment_cache) >= FRAGMENT_CACHE_SIZE:
+            del fragment_cache[next(iter(fragment_cache))]
+        fragment_cache[digest] = fragment
+        return fragment
+
+
+    # Name the file of a line in an error, when it is not the file that is compiled
+    def __where(self, source, word="OF"):
+        return f" {word} \"{source}\"" if source and source != self.compiled_source else ""
 
 
-    # Function that checks the length of the instruction
-    def check_instruction_length(self, instruction_list, assembly, line):
-        # Get length of the instruction
-        payload_size = len(instruction_list)
-        # If theres only 1 item in the instruction_list, then theres too little data
-        if payload_size <= 1:
-            # Someone forgot to add data to the instruction
-            self.error(line)
-        # If theres more than 2 items in the instruction_list, then there might be a comment
+    # Throw an error if the instruction is not valid
+    def __error(self, line, line_number=None, source=None):
+        where = self.__where(source)
+        if line_number is None:
+            print("ERROR: UNKNOWN INSTRUCTION \"" + str(line) + "\"" + where + "!")
         else:
-            # Subtract 1 from the payload size
-            payload_size -= 1
-            # Check if any of the items in the instruction_list are a comment
-            for idx in range(len(instruction_list)):
-                # Get the item
-                item = instruction_list[idx]
-                # Check if its a comment
-                if item.startswith(";"):
-                    # Remove the comment
-                    instruction_list.remove(item)
-                    # Decrement the payload size
-                    payload_size -= 1
-                    # Break out of the loop
-                    break
-
-        return payload_size
+            print("ERROR: UNKNOWN INSTRUCTION \"" + str(line) + "\" ON LINE " + str(line_number) + where + "!")
+        exit()
 
 
     # Get the payload from the line
@@ -108,206 +459,767 @@ class ROM_Generator:
         return payload
 
 
-    # Function that optimizes the psuedo-assembly code
-    def optimize_content(self, assembly, debug):
-        cleaned_content = []
-        comment_counter = 0
-        actual_first_line = 0
+    # Get the seconds of a wait given in time, such as "120ms" or "50 us", or None if it has no unit
+    def fetch_wait_seconds(self, tokens):
+        text = "".join(tokens)
+
+        for unit, scale in self.wait_units.items():
+            if text.endswith(unit):
+                try:
+                    return float(text[:-len(unit)]) * scale
+                except ValueError:
+                    continue
+
+        return None
 
-        # Remove all comments from the psuedo-assembly code
-        for idx in range(len(assembly)):
-            # Get the line
-            line = assembly[idx]
 
-            # Check if the line starts with a comment
+    # Function that parses the psuedo-assembly code into a fragment, from (line number, line) pairs
+    # Parsing only depends on the text, the word size, the clock and the macros are applied when the fragment is compiled
+    def parse_fragment(self, lines, source=""):
+        fragment = ROM_Fragment()
+        # The macro whose body is being read
+        macro = None
+
+        # Go through each line of the psuedo-assembly code
+        for line_number, line in lines:
+            fragment.lines += 1
+            # Remove any newline characters
+            line = line.rstrip("\r\n")
+
+            # Remove any trailing comment and split the line into its tokens
+            tokens = line.split(";", 1)[0].split()
+
+            # The body of a macro is kept as text, the arguments are filled in before it is parsed
+            if macro is not None:
+                if tokens[:1] == ["endmacro"]:
+                    macro = None
+                elif tokens[:1] == ["macro"]:
+                    self.__error(line, line_number, source)
+                else:
+                    macro.body.append((line_number, line))
+                continue
+
+            # Keep the comments that take up an entire line
             if line.startswith(";"):
-                # If the first line is a comment, set the actual first line
-                if actual_first_line == 0:
-                    actual_first_line += 1
-
-                # Remove any newline characters
-                line = line.replace("\n", "")
-                # Keep this comment
-                cleaned_content.append(line)
-                comment_counter += 1
+                fragment.statements.append(("comment", line))
                 continue
+
             # If the line is empty, continue
-            elif line == "\n":
+            if not tokens:
                 continue
-            else:
-                # Check if the line has a comment
-                if ";" in line:
-                    # Remove the comment
-                    line = line.split(";")[0]
-            
-                # Add the line to the cleaned content
-                cleaned_content.append(line)
 
-        rom_content = []
-        current_word_size = 8
+            # Start a macro, the name is followed by its parameters
+            if tokens[0] == "macro":
+                name = tokens[1] if len(tokens) > 1 else None
+                # A macro can not hide an instruction or a directive, and only the last parameter can take the rest of the arguments
+                if name is None or name in self.instruction_opcodes or name in self.directives or any(param.startswith("*") for param in tokens[2:-1]):
+                    self.__error(line, line_number, source)
+                macro = ROM_Macro(name, tokens[2:])
+                fragment.macros[name] = macro
+                continue
 
-        # Go through each line of the psuedo-assembly code
-        for idx in range(len(cleaned_content)):
-            # Get the line
-            line = cleaned_content[idx]
-            # Check if the line starts with a word in the instructions list
-            temp = line.split()
+            # Include another file, relative to the folder of this one
+            if tokens[0] == "include":
+                if len(tokens) != 2:
+                    self.__error(line, line_number, source)
+                fragment.statements.append(("include", tokens[1].strip("\"'"), line, line_number))
+                continue
+
+            # Anything that is not an instruction calls a macro, which is looked up when the fragment is compiled
+            opcode = self.instruction_opcodes.get(tokens[0])
+            if opcode is None:
+                if tokens[0] == "endmacro":
+                    self.__error(line, line_number, source)
+                fragment.statements.append(("call", tokens[0], tokens[1:], line, line_number))
+                continue
+
+            # Make sure the instruction has a payload
+            if len(tokens) < 2:
+                self.__error(line, line_number, source)
+
+            # A wait given in time is compiled to a delay in clock cycles
+            if opcode == 0x30:
+                seconds = self.fetch_wait_seconds(tokens[1:])
+                if seconds is not None:
+                    fragment.statements.append(("wait", seconds, line, line_number))
+                    continue
+
+            # Convert every payload on the line
+            try:
+                payloads = [self.fetch_payload(token) for token in tokens[1:]]
+            except ValueError:
+                self.__error(line, line_number, source)
+
+            # Check if the size is valid
+            if opcode == 0x20 and payloads[0] not in self.__width_codes:
+                self.__error(line, line_number, source)
+            # Payloads are never negative
+            if any(payload < 0 for payload in payloads):
+                self.__error(line, line_number, source)
+
+            fragment.statements.append(("instruction", opcode, payloads, line, line_number))
+
+        # A macro must be closed in the file it was started in
+        if macro is not None:
+            print(f"ERROR: MACRO \"{macro.name}\" IS NOT CLOSED WITH endmacro" + self.__where(source, "IN") + "!")
+            exit()
+
+        return fragment
 
-            # Check if its a comment
-            if line.startswith(";"):
-                rom_content.append(line)
-            # Make sure it exists
-            elif temp[0] in self.__instruction_psuedo:
-                # Make sure its a valid length
-                instruction_length = self.check_instruction_length(temp, cleaned_content, line)
-
-                # If its a size instruction, change the word size
-                if temp[0] == "size":
-                    # Fetch the payload
-                    payload = self.fetch_payload(temp[1])
-                    # Check if the size is valid
-                    if payload in self.__word_sizes:
-                        # Set the word size
-                        current_word_size = payload
-                    else:
-                        # The size is not valid
-                        self.__error(line)
-                # but if its a command instruction, set the word size to 8
-                elif temp[0] == "cmd":
-                    current_word_size = 8
-
-                # Get the instruction hex
-                instruction = temp[0]
-                # Remove the instruction from the list
-                temp.pop(0)
-
-                # If the length is 0, have a payload of 0
-                if instruction_length == 0:
-                    # Add the instruction hex and payload to the rom content
-                    rom_content.append(instruction)
-                    rom_content.append(format(0, '08x'))
-
-                # If the length is greater than 1, and the instruction is a data instruction
-                elif instruction_length > 1 and instruction == "data":
-                    # The instruction length decides the number of words to send
-                    # Get the max value of the word size
-                    max_value = 2 ** current_word_size
-
-                    # Start at the last index of the instruction list and work backwards
-                    overflow = 0
-                    for i in range(instruction_length):
-                        # Get the payload
-                        payload = self.fetch_payload(temp[i]) + overflow
-                        overflow = 0
-                        
-                        # Check if its less than the max value
-                        if payload <= max_value:
-                            # Add the instruction hex and payload to the rom content
-                            rom_content.append(instruction)
-                            rom_content.append(format(payload, '08x'))
-                        else:
-                            # The payload is too large, we must split it up and append it infront of the current instruction
-                            overflow = max_value >> current_word_size
-                            # Add the instruction hex and payload to the rom content
-                            rom_content.append(instruction)
-                            rom_content.append(format(payload - max_value, '08x'))
-
-                # If the length is at or greater than 1, just add the payload at index 1
-                else:
-                    payload = self.fetch_payload(temp[0])
 
-                    # Add the instruction hex and payload to the rom content
-                    rom_content.append(instruction)
-                    rom_content.append(format(payload, '08x'))
+    # Function that compiles the psuedo-assembly code into a program
+    def compile_content(self, lines, source=""):
+        self.compiled_source = source
+        self.fragment_counts = {"parsed": 1, "reused": 0, "lines": 0}
+        fragment = self.parse_fragment(enumerate(lines, 1), source)
+        self.fragment_counts["lines"] = fragment.lines
+        return self.compile_fragment(fragment, source)
+
+
+    # Function that compiles a parsed fragment, and every fragment and macro it uses, into a program
+    def compile_fragment(self, fragment, source=""):
+        program = ROM_Program(source)
+        # The word size is carried from one fragment to the next, and the macros are known from where they are defined on
+        state = {"word_size": 8, "macros": {}, "files": [os.path.abspath(source)], "calls": []}
+
+        self.__compile_statements(program, fragment, source, state)
+
+        return program
+
+
+    # Add the statements of a fragment to the program
+    # Entries from included files and macros are put on the line of the compiled file that included or called them
+    def __compile_statements(self, program, fragment, source, state, at_line=None):
+        # The macros are known with the file they are defined in, which their includes are relative to
+        state["macros"].update({name: (macro, source) for name, macro in fragment.macros.items()})
+
+        for statement in fragment.statements:
+            kind = statement[0]
+
+            if kind == "comment":
+                program.add_comment(statement[1])
+                continue
+
+            line, line_number = statement[-2], statement[-1]
+            entry_line = line_number if at_line is None else at_line
+
+            if kind == "wait":
+                # Round up, the wait must never be shorter than asked for
+                cycles = max(0, math.ceil(round(statement[1] * self.clock, 6)))
+                if cycles > self.max_delay:
+                    self.__error(line, line_number, source)
+                self.__append(program, 0x31, cycles, line, entry_line)
+
+            elif kind == "include":
+                self.__include(program, os.path.join(os.path.dirname(source), statement[1]), line_number, source, state, entry_line)
+
+            elif kind == "call":
+                self.__call_macro(program, statement[1], statement[2], line, line_number, source, state, entry_line)
 
             else:
-                # The instruction is not valid
-                self.error(line)
+                self.__compile_instruction(program, statement[1], statement[2], line, line_number, source, state, entry_line)
 
-        # Do a sanity check to make sure the rom content is less or equal to 255
-        if len(rom_content) > (512 + comment_counter):
-            print("ERROR: ROM content is greater than 255 bytes!")
+
+    # Compile an included file in place of the include
+    def __include(self, program, path, line_number, source, state, entry_line):
+        path = os.path.normpath(path)
+        if os.path.abspath(path) in state["files"]:
+            print(f"ERROR: FILE \"{path}\" INCLUDES ITSELF ON LINE {line_number}" + self.__where(source) + "!")
             exit()
 
-        # Check
-        if debug:
-            # Check if the new folder exists
-            try:
-                os.mkdir("output")
-            except FileExistsError:
-                pass
+        fragment = self.load_fragment(path)
+        # Recompile when the included file changes
+        if path not in self.sources:
+            self.sources.append(path)
+
+        state["files"].append(os.path.abspath(path))
+        self.__compile_statements(program, fragment, path, state, entry_line)
+        state["files"].pop()
 
-            # Write the optimized psuedo-assembly code to the file
-            with open('output/instructions_optimized.txt', 'w') as f:
-                idx = 0
-                rom_file = ""
 
-                # Loop through each line of the rom content
+    # Compile a macro in place of the call, with the arguments filled in for its parameters
+    def __call_macro(self, program, name, args, line, line_number, source, state, entry_line):
+        macro, macro_source = state["macros"].get(name, (None, ""))
+        if macro is None:
+            self.__error(line, line_number, source)
+        if name in state["calls"]:
+            print(f"ERROR: MACRO \"{name}\" CALLS ITSELF ON LINE {line_number}" + self.__where(source) + "!")
+            exit()
+
+        expansion = macro.expand(self, args, macro_source)
+        if expansion is None:
+            count = len(macro.params) - 1 if macro.params[-1:] and macro.params[-1].startswith("*") else len(macro.params)
+            print(f"ERROR: MACRO \"{name}\" TAKES {'AT LEAST ' if count != len(macro.params) else ''}{count} ARGUMENT{'S' if count != 1 else ''}, "
+                  f"NOT {len(args)}, ON LINE {line_number}" + self.__where(source) + "!")
+            exit()
+
+        state["calls"].append(name)
+        self.__compile_statements(program, expansion, macro_source, state, entry_line)
+        state["calls"].pop()
+
+
+    # Add the entries of a single instruction to the program
+    # Entries are put on the entry line, errors name the line and file the instruction is written on
+    def __compile_instruction(self, program, opcode, payloads, line, line_number, source, state, entry_line):
+        # If its a size instruction, change the word size, the sequencer takes the width code of the size
+        if opcode == 0x20:
+            state["word_size"] = payloads[0]
+            self.__append(program, opcode, self.__width_codes[payloads[0]], line, entry_line)
+            return
+        # but if its a command instruction, set the word size to 8
+        elif opcode == 0x10:
+            state["word_size"] = 8
+
+        # If its a data instruction, the instruction length decides the number of words to send
+        if opcode == 0x21:
+            word_size = state["word_size"]
+            mask = (1 << word_size) - 1
+
+            position = 0
+            while position < len(payloads):
+                # Split a payload that is too large for the word size into words, the most significant word first
+                payload = payloads[position]
+                words = []
                 while True:
-                    # Copy the content into a variable
-                    content = rom_content[idx]
-                    # Check if the line is a comment
-                    if content.startswith(";"):
-                        # Add the comment to the ROM file
-                        rom_file += content + "\n"
-                        # Increment the index
-                        idx += 1
-                    else:
-                        formatted_line = rom_content[idx] + " "
-                        formatted_line += "0x" + rom_content[idx + 1] + "\n"
-                        rom_file += formatted_line
-                        # Increment the index
-                        idx += 2
-
-                    # Check if we are at the end of the rom content
-                    if idx >= len(rom_content):
+                    words.insert(0, payload & mask)
+                    payload >>= word_size
+                    if not payload:
                         break
 
-                f.write(rom_file)
+                # The lower words take the place of the zeros that follow the payload, so "data 0 0 319 0" sends 0x00 0x00 0x01 0x3f
+                placeholders = payloads[position + 1:position + len(words)]
+                if len(placeholders) != len(words) - 1 or any(placeholders):
+                    print(f"ERROR: {payloads[position]} DOES NOT FIT A {word_size} BIT WORD, IT NEEDS {len(words) - 1} ZERO{'S' if len(words) != 2 else ''} "
+                          f"AFTER IT FOR ITS LOWER WORDS ON LINE {line_number}" + self.__where(source) + "!")
+                    exit()
+
+                for word in words:
+                    self.__append(program, opcode, word, line, entry_line)
+                position += len(words)
+        # Otherwise just add the first payload
+        else:
+            self.__append(program, opcode, payloads[0], line, entry_line)
 
-        return rom_content, comment_counter
 
+    # Do a sanity check to make sure the program fits the address space of the ROM
+    def check_rom_size(self, program):
+        if len(program) > self.rom_depth:
+            print(f"ERROR: ROM content is {len(program)} entries, {len(program) - self.rom_depth} more than the {self.rom_depth} the ROM holds!")
+            exit()
 
-    # Function that parses the psuedo-assembly code and generates the ROM file
-    def parse_content(self, assembly):
-        command = []
-        payload = []
 
-        # Go through each line of the psuedo-assembly code
-        idx = 0
-        while True:
-            # Check if its a comment
-            if assembly[idx].startswith(";"):
-                idx += 1
+    # Count what the program holds: the entries of each opcode, the addresses of the ROM it uses,
+    # and the words and payload bits sent over the SPI for each word size
+    def count_program(self, program):
+        opcodes = {}
+        spi = {}
+        word_size = 8
+
+        for opcode, payload in zip(program.opcodes, program.payloads):
+            name = self.instruction_names[opcode]
+            opcodes[name] = opcodes.get(name, 0) + 1
+
+            words = 0
+            if opcode == SIZE:
+                word_size = WIDTH_CODES.get(payload, word_size)
+            elif opcode == COMMAND:
+                # Commands are always sent as 8 bits, and the sequencer goes back to 8 bit words after them
+                word_size = 8
+                words = 1
+            elif opcode == DATA:
+                words = 1
+            elif opcode in PACKED or opcode == REPEAT:
+                # Packed and repeated bytes are sent as 8 bit words
+                word_size = 8
+                words = packed_bytes(opcode, payload)
+
+            if words:
+                counts = spi.setdefault(str(word_size), {"words": 0, "bits": 0})
+                counts["words"] += words
+                counts["bits"] += words * word_size
+
+        return {
+            "opcodes": opcodes,
+            "entries": len(program),
+            "depth": self.rom_depth,
+            "headroom": self.rom_depth - len(program),
+            "spi": dict(sorted(spi.items(), key=lambda item: int(item[0]))),
+            "spi_bits": sum(counts["bits"] for counts in spi.values())
+        }
+
+
+    # Put the phase timings and the counts of the program together in the stats of the run
+    def finish_stats(self, filename, start, program_stats):
+        self.stats = {
+            "input": filename,
+            "cache_hit": self.cache_hit,
+            "phases": dict(self.phase_times),
+            "total_time": time.perf_counter() - start,
+            "fragments": dict(self.fragment_counts)
+        }
+        self.stats.update(program_stats or {})
+        return self.stats
+
+
+    # Print the stats of the run
+    def print_stats(self, stats):
+        print(f"Stats of {stats['input']}")
+        phases = ", ".join(f"{name.replace('_', ' ')} {elapsed * 1000:.2f} ms" for name, elapsed in stats["phases"].items())
+        print(f"  Phases:  {phases}, {stats['total_time'] * 1000:.2f} ms in total")
+        fragments = stats["fragments"]
+        if fragments["parsed"] or fragments["reused"]:
+            print(f"  Files:   {fragments['parsed']} parsed ({fragments['lines']} lines), {fragments['reused']} taken from the fragment cache")
+        # The counts are missing for files served from an old cache entry
+        if "entries" not in stats:
+            return
+        used = 100 * stats["entries"] / stats["depth"]
+        print(f"  ROM:     {stats['entries']}/{stats['depth']} entries used ({used:.1f}%), {stats['headroom']} entries of headroom")
+        print(f"  Opcodes: " + ", ".join(f"{name} {count}" for name, count in stats["opcodes"].items()))
+        words = "; ".join(f"{size} bit: {counts['words']} words, {counts['bits']} bits" for size, counts in stats["spi"].items())
+        print(f"  SPI:     {words}; {stats['spi_bits']} payload bits in total")
+
+
+    # Function that optimizes the compiled program, returns the new program and what was saved
+    def optimize_content(self, program):
+        savings = {
+            "entries": len(program),
+            "transfers": self.count_transfers(program),
+            "size": 0,
+            "page_select": 0,
+            "duplicate_write": 0,
+            "wait": 0
+        }
+
+        # Run the passes one after another, each working on the indices the last one kept
+        indices = self.__remove_size_changes(program, range(len(program)), savings)
+        indices = self.__remove_redundant_writes(program, indices, savings)
+        indices = self.__merge_waits(program, indices, savings)
+
+        optimized = program.select(indices)
+        # Merged waits carry the total wait in the last entry of the run
+        positions = {idx: position for position, idx in enumerate(indices)}
+        for idx, payload in savings.pop("merged_payloads").items():
+            optimized.payloads[positions[idx]] = payload
+
+        savings["optimized_entries"] = len(optimized)
+        savings["optimized_transfers"] = self.count_transfers(optimized)
+
+        return optimized, savings
+
+
+    # Count the entries that turn into a SPI transfer
+    def count_transfers(self, program):
+        return sum(1 for opcode in program.opcodes if opcode == 0x10 or opcode == 0x21)
+
+
+    # Remove size instructions that do not change the word size, or that are changed again before any data is sent
+    def __remove_size_changes(self, program, indices, savings):
+        opcodes = program.opcodes
+        payloads = program.payloads
+        indices = list(indices)
+        kept = []
+        # The width code in effect, 0 is 8 bit words
+        width_code = 0
+
+        for position, idx in enumerate(indices):
+            opcode = opcodes[idx]
+
+            # A command always goes back to 8 bit words
+            if opcode == 0x10:
+                width_code = 0
+            elif opcode == 0x20:
+                # Skip the size if it is already in effect
+                if payloads[idx] == width_code:
+                    savings["size"] += 1
+                    continue
+
+                # Find the next instruction that is not a wait
+                following = None
+                for next_idx in indices[position + 1:]:
+                    if opcodes[next_idx] not in self.wait_opcodes:
+                        following = opcodes[next_idx]
+                        break
+
+                # Skip the size if no data is sent before the word size changes again
+                if following != 0x21:
+                    savings["size"] += 1
+                    continue
+
+                width_code = payloads[idx]
+
+            kept.append(idx)
+
+        return kept
+
+
+    # Remove page selects that are already in effect, and register writes that do not change the register
+    def __remove_redundant_writes(self, program, indices, savings):
+        opcodes = program.opcodes
+        payloads = program.payloads
+
+        # Split the program into blocks, each starting at a command and ending before the next one
+        blocks = []
+        for idx in indices:
+            if opcodes[idx] == 0x10 or not blocks:
+                blocks.append([])
+            blocks[-1].append(idx)
+
+        kept = []
+        page = None
+        # The kept position and block of the last page select, if nothing has been kept since
+        last_page_select = None
+        registers = {}
+
+        for block in blocks:
+            # Anything in front of the first command is kept as is
+            if opcodes[block[0]] != 0x10:
+                kept.extend(block)
                 continue
 
-            # Get the instruction and payload
-            instruction = assembly[idx]
-            payload_data = assembly[idx + 1]
-            idx += 2
-            
-            # Get the instruction hex index
-            instruction_index = self.__instruction_psuedo.index(instruction)
-            # Get the actual hex code
-            instruction_hex_code = self.__instruction_hex[instruction_index]
-            # Convert it to a hex string thats 8 bits long
-            instruction_hex_code = format(instruction_hex_code, '02x')
-
-            # Add the instruction hex and payload to the rom content
-            command.append(instruction_hex_code)
-            payload.append(payload_data)
-
-            # Check if we are at the end of the psuedo-assembly code
-            if idx >= len(assembly):
-                break
+            command = payloads[block[0]]
+            # Everything sent after the command makes up the written value, the waits only give the display time and are always kept
+            waits = [idx for idx in block if opcodes[idx] in self.wait_opcodes]
+            value = tuple((opcodes[idx], payloads[idx]) for idx in block[1:] if opcodes[idx] not in self.wait_opcodes)
+            has_data = any(opcodes[idx] == 0x21 for idx in block)
+
+            if command in self.page_select_commands and has_data:
+                # The page is already selected
+                if value == page:
+                    savings["page_select"] += len(block) - len(waits)
+                    kept.extend(waits)
+                    continue
+
+                # The last page select was never used, it is replaced by this one
+                if last_page_select is not None and last_page_select[0] == len(kept):
+                    removed = last_page_select[1]
+                    del kept[-len(removed):]
+                    savings["page_select"] += len(removed)
+
+                page = value
+                kept.extend(block)
+                # Only a page select without waits can be dropped again later
+                last_page_select = (len(kept), block) if not waits else None
+                continue
+
+            # A reset puts every register, and the page, back to their defaults
+            if command in self.reset_commands:
+                registers.clear()
+                page = None
+            # Skip the write if the register already holds the value
+            elif has_data and command not in self.stream_commands:
+                key = (page, command)
+                if registers.get(key) == value:
+                    savings["duplicate_write"] += len(block) - len(waits)
+                    kept.extend(waits)
+                    continue
+                registers[key] = value
+
+            kept.extend(block)
+
+        return kept
+
+
+    # Merge waits that follow each other into a single wait, and remove the empty ones
+    def __merge_waits(self, program, indices, savings):
+        opcodes = program.opcodes
+        payloads = program.payloads
+        kept = []
+        merged_payloads = {}
+
+        for idx in indices:
+            opcode = opcodes[idx]
+            if opcode in self.wait_opcodes:
+                # Waiting for nothing does nothing
+                if payloads[idx] == 0:
+                    savings["wait"] += 1
+                    continue
+
+                # Fold the previous wait of the same kind into this one, as long as the sequencer can count that high
+                if kept and opcodes[kept[-1]] == opcode:
+                    total = merged_payloads.get(kept[-1], payloads[kept[-1]]) + payloads[idx]
+                    if total <= (self.max_wait if opcode == 0x30 else self.max_delay):
+                        merged_payloads.pop(kept[-1], None)
+                        kept[-1] = idx
+                        merged_payloads[idx] = total
+                        savings["wait"] += 1
+                        continue
+
+            kept.append(idx)
+
+        savings["merged_payloads"] = merged_payloads
+        return kept
+
+
+    # Print a summary of what the optimizer removed
+    def print_savings(self, savings):
+        removed = savings["entries"] - savings["optimized_entries"]
+        percentage = 100 * removed / savings["entries"] if savings["entries"] else 0
+        print(f"Optimized {savings['entries']} -> {savings['optimized_entries']} ROM entries ({removed} removed, {percentage:.1f}%)")
+        print(f"  SPI transfers:          {savings['transfers']} -> {savings['optimized_transfers']}")
+        print(f"  Redundant page selects: {savings['page_select']}")
+        print(f"  Duplicate writes:       {savings['duplicate_write']}")
+        print(f"  No-op size changes:     {savings['size']}")
+        print(f"  Merged waits:           {savings['wait']}")
+
+
+    # Add an entry to the program, making sure the payload fits the ROM
+    def __append(self, program, opcode, payload, line, line_number):
+        if not 0 <= payload <= 0xffffffff:
+            self.__error(line, line_number)
+
+        program.append(opcode, payload, line_number)
+
+
+    # Function that compares the time after each command with the minimum delay the controller needs
+    # With tighten, the waits are replaced by a single delay of exactly the minimum, otherwise the waits are only reported
+    def check_delays(self, program, controller, tighten):
+        opcodes = program.opcodes
+        payloads = program.payloads
+        entry_cycles = self.estimator().estimate(program).entry_cycles
+        commands = [idx for idx in range(len(entry_cycles)) if opcodes[idx] == 0x10]
+
+        # Waits to drop, and the delays to place after an entry
+        dropped = set()
+        delays = {}
+
+        for command, next_command in zip(commands, commands[1:]):
+            required = required_delay(controller, payloads[command], payloads[next_command])
+            if required == 0:
+                continue
+
+            between = range(command + 1, next_command)
+            waits = [idx for idx in between if opcodes[idx] in self.wait_opcodes]
+            # The time spent on everything but the waits, including fetching the next command
+            busy = sum(entry_cycles[idx] for idx in between if idx not in waits) + 3
+            actual = busy + sum(entry_cycles[idx] for idx in waits)
+            required_cycles = math.ceil(round(required * self.clock, 6))
+            line = program.lines[command]
+
+            if actual >= required_cycles and not waits:
+                continue
+
+            description = f"line {line}: cmd 0x{payloads[command]:02x} is followed by {actual * 1000 / self.clock:.3f} ms, the {controller.upper()} needs {required * 1000:.3f} ms"
+            if actual == required_cycles:
+                continue
+            elif not tighten:
+                print(f"WARNING: {description}")
+                continue
+
+            # Replace the waits with a single delay that covers what the rest does not
+            dropped.update(waits)
+            # A delay spends the fetch, wait_state and verify cycles on top of its count
+            remaining = required_cycles - busy - 5
+            if remaining >= 0:
+                delays[waits[-1] if waits else next_command - 1] = (remaining, line)
+            if not self.quiet:
+                print(f"Tightened {description}")
+
+        if not tighten or (not dropped and not delays):
+            return program
+
+        # Rebuild the program with the new delays in place of the old waits
+        tightened = ROM_Program(program.source)
+        for idx in range(len(program)):
+            if idx in program.comments:
+                tightened.comments.setdefault(len(tightened), []).extend(program.comments[idx])
+            if idx not in dropped:
+                tightened.append(opcodes[idx], payloads[idx], program.lines[idx])
+            if idx in delays:
+                tightened.append(0x31, delays[idx][0], delays[idx][1])
+        if len(program) in program.comments:
+            tightened.comments.setdefault(len(tightened), []).extend(program.comments[len(program)])
+
+        return tightened
+
+
+    # Function that compresses the program, and checks that it decodes back to the same program
+    def compress_content(self, program):
+        compressed, stats = compress_program(program)
+
+        # The sequencer must send exactly the same words as it would without the compression
+        decoded = decompress_program(compressed)
+        if decoded.opcodes != program.opcodes or decoded.payloads != program.payloads:
+            print("ERROR: THE COMPRESSED ROM DOES NOT DECODE TO THE SAME PROGRAM!")
+            exit()
+
+        return compressed, stats
+
+
+    # Print a summary of the compression
+    def print_compression(self, stats):
+        ratio = stats["entries"] / stats["compressed_entries"] if stats["compressed_entries"] else 1
+        print(f"Compressed {stats['entries']} -> {stats['compressed_entries']} ROM entries ({ratio:.2f}:1, {stats['compressed_entries']}/{self.rom_depth} addresses used)")
+        print(f"  Packed data:   {stats['packed']} entries holding {stats['packed_bytes']} bytes")
+        print(f"  Repeated data: {stats['repeat']} entries holding {stats['repeat_bytes']} bytes")
+
+
+    # Function that widens the data of the program, and checks that the display is sent the same bytes
+    # Returns the program as is and no stats if the data can not be widened
+    def widen_content(self, program, controller=None, compress=False):
+        # With the data/command signal sent in front of every word, the display takes every word as one byte
+        if not self.four_wire:
+            print("WARNING: the data words are only widened with --four-wire, as the 9 bit SPI sends a single data/command bit for each word")
+            return program, None
+
+        estimator = self.estimator()
+        widened, stats = widen_program(program, estimator, WIDE_WORDS.get(controller, DEFAULT_WIDE_WORDS), compress)
+
+        if spi_stream(widened) != spi_stream(program):
+            print("ERROR: THE WIDENED ROM DOES NOT SEND THE SAME BYTES AS THE PROGRAM!")
+            exit()
+
+        stats["cycles"] = estimator.estimate(program).total_cycles()
+        stats["widened_cycles"] = estimator.estimate(widened).total_cycles()
+        return widened, stats
+
+
+    # Print a summary of the widening
+    def print_widening(self, stats):
+        saved = stats["entries"] - stats["widened_entries"]
+        saved_ms = (stats["cycles"] - stats["widened_cycles"]) * 1000 / self.clock
+        print(f"Widened {stats['entries']} -> {stats['widened_entries']} ROM entries ({saved} saved, {saved_ms:.3f} ms faster bring-up)")
+        print(f"  Wide words:    {stats['words']} entries holding {stats['bytes']} bytes, in {stats['runs']} runs")
+        print(f"  Size switches: {stats['sizes']} added")
 
-        return command, payload
+
+    # Function that writes the compiled program back out as psuedo-assembly code
+    def write_optimized(self, program):
+        # Write the optimized psuedo-assembly code to the file, only touching it if the code changed
+        with Changed_File(self.debug_output) as f:
+            lines = []
+
+            # Loop through each entry of the program, keeping the comments in place
+            for idx in range(len(program) + 1):
+                lines.extend(program.comments.get(idx, ()))
+                if idx < len(program):
+                    payload = program.payloads[idx]
+                    # Write the size in bits, the way it is written in the psuedo-assembly code
+                    if program.opcodes[idx] == 0x20:
+                        payload = WIDTH_CODES.get(payload, payload)
+                    lines.append(f"{self.instruction_names[program.opcodes[idx]]} 0x{payload:08x}")
+
+            f.write("".join(line + "\n" for line in lines))
+
+
+    # The path each format is written to, the VHDL goes to the output and the rest next to it
+    def format_paths(self):
+        name = os.path.splitext(self.output)[0]
+        return {rom_format: self.output if rom_format == "vhdl" else name + ROM_FORMATS[rom_format] for rom_format in self.formats}
+
+
+    # Make sure the block RAMs hold every bit of the word once, and the MMI knows where each of them is placed
+    def check_formats(self):
+        bits = sorted(bit for _, msb, lsb in self.brams for bit in range(lsb, msb + 1))
+        if ("bmm" in self.formats or "mmi" in self.formats) and bits != list(range(MEMORY_WORD_BITS)):
+            print(f"ERROR: THE BLOCK RAMS MUST HOLD EVERY BIT OF THE {MEMORY_WORD_BITS} BIT WORD ONCE, FROM {MEMORY_WORD_BITS - 1} TO 0!")
+            exit()
+
+        for name, _, _ in self.brams:
+            if "mmi" in self.formats and not BRAM_SITE.fullmatch(name):
+                print(f"ERROR: THE MMI NEEDS THE SITE OF EACH BLOCK RAM, SUCH AS RAMB18_X0Y0, NOT \"{name}\"!")
+                exit()
+
+        # The inferred ROM of rom.vhd is not in block RAM, the MMI can only point at a ROM that is
+        if "mmi" in self.formats and not self.instance:
+            print("ERROR: THE MMI NEEDS THE INSTANCE OF THE BLOCK RAM ROM, GIVE IT WITH --instance!")
+            exit()
 
 
     # Function that generates the ROM file in a proper format
-    def generate_rom(self, command, payload, comment_counter):
-        # Start of the ROM file
-        rom_file = """--------------------------------------------------------------------------
+    def generate_rom(self, program):
+        # The memory files always fill the ROM, so a bitstream can be patched with a longer program later on
+        padded = pad_program(program, self.rom_depth)
+        words = None
+        changed = []
+
+        # Stream the ROM files straight to the disk, only replacing the old ones if the content changed
+        # A new time stamp on the ROM makes ISE and Vivado synthesize the design again
+        for rom_format, path in self.format_paths().items():
+            rom_file = Changed_File(path)
+            with rom_file as f:
+                if rom_format == "vhdl":
+                    emit_vhdl(padded if self.pad else program, f)
+                elif rom_format in ("mem", "coe"):
+                    words = words or memory_words(padded)
+                    (emit_mem if rom_format == "mem" else emit_coe)(words, f)
+                elif rom_format == "bmm":
+                    emit_bmm(self.brams, self.rom_depth, f)
+                else:
+                    emit_mmi(self.brams, self.rom_depth, self.part, self.instance, f)
+            if rom_file.changed:
+                changed.append(path)
+        self.rom_changed = bool(changed)
+
+        if not self.quiet:
+            print("ROM file generated successfully!" if changed else "ROM file is unchanged, left as is.")
+            if len(self.formats) > 1 or self.formats[0] != "vhdl":
+                print("Written to " + ", ".join(f"\"{path}\"" + ("" if path in changed else " (unchanged)") for path in self.format_paths().values()))
+
+
+    # Function that runs the program through the reference model, writing the expected waveforms next to the ROM
+    def generate_vectors(self, program, clock):
+        # NumPy is only needed for the reference model
+        try:
+            from reference_model import Reference_Model
+        except ImportError:
+            print("ERROR: The 'numpy' module is required to generate the waveforms!")
+            exit()
+
+        waveform = Reference_Model(self.estimator(clock)).run(program)
+        name = os.path.splitext(self.output)[0]
+        waveform.write_vcd(name + ".vcd")
+        waveform.write_vectors(name + "_vectors.txt")
+
+        if not self.quiet:
+            print(f"Waveforms written to \"{name}.vcd\" and \"{name}_vectors.txt\"")
+
+
+# Size of the buffer used when streaming the generated files to the disk
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+class Changed_File:
+    # Streams a file to a temporary file next to the path, which replaces the path when the content differs
+    # The file is replaced in a single step, so a tool reading it never sees a half written file
+    def __init__(self, path):
+        self.path = path
+        self.changed = False
+
+
+    def __enter__(self):
+        # Make sure the output folder exists
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        # The temporary file must be on the same file system for the replace to be atomic
+        handle, self.temporary = tempfile.mkstemp(dir=folder or ".", prefix="." + os.path.basename(self.path), suffix=".tmp")
+        self.file = os.fdopen(handle, 'w', buffering=WRITE_BUFFER_SIZE)
+        return self.file
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+
+        # Leave the old file in place if anything went wrong
+        if exc_type is not None:
+            os.remove(self.temporary)
+            return False
+
+        self.changed = not same_content(self.temporary, self.path)
+        if self.changed:
+            # Keep the permissions of a new file the same as one made by open
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(self.temporary, 0o666 & ~umask)
+            os.replace(self.temporary, self.path)
+        else:
+            os.remove(self.temporary)
+        return False
+
+
+# Start of the ROM file, the size of the ROM is appended to it
+VHDL_HEADER = """--------------------------------------------------------------------------
 --! @file rom.vhd
 --! @brief Contains the instruction data and payload data for the sequencer.vhd
 --! @author Cuprum https://github.com/Cuprum77
@@ -338,9 +1250,9 @@ architecture rtl of rom is
 --! Set the ROM size constant (auto-generated)
 --! @note This constant is used to determine the size of the ROM in the sequencer.vhd
 constant rom_size : integer := """
-        # Add the size of the ROM to the ROM file
-        rom_file += str(len(command) - 1)
-        rom_file += """;
+
+# Between the size of the ROM and the instruction data
+VHDL_INSTRUCTIONS = """;
 
 --! Create the ROM types for the instruction and payload data
 --! Note that the instruction data is 8 bits, and the payload data is 32 bits
@@ -350,65 +1262,15 @@ type rom_32b_t is array(0 to rom_size) of std_logic_vector(31 downto 0);
 --! The Instruction data
 constant instruction_rom : rom_8b_t := (
    """
-        # Add the instructions to the ROM file
-        idx = 0
-        while True:
-            # Copy the content into a variable
-            content = command[idx]
-            # Check if the line is a comment
-            if not content.startswith(";"):
-                formatted_line = "x\"" + command[idx]
-                # If its not the last line, add a comma
-                if idx + 1 < len(command):
-                    formatted_line += "\","
-                else:
-                    formatted_line += "\""
-                rom_file += " " + formatted_line
-                # If 4 lines have been added, add a newline
-                if idx % 8 == 7 and idx + 1 < len(command):
-                    rom_file += "\n   "
-                elif idx + 1 >= len(command):
-                    rom_file += "\n"
-                # Increment the index
-                idx += 1
-
-            # Check if we are at the end of the rom content
-            if idx >= len(command):
-                break
 
-        rom_file += """  );
+# Between the instruction data and the payload data
+VHDL_PAYLOADS = """  );
   --! The payload data
   constant payload_rom : rom_32b_t := (
    """
-        
-        # Add the data to the ROM file
-        idx = 0
-        while True:
-            # Copy the content into a variable
-            content = payload[idx]
-            # Check if the line is not a comment
-            if not content.startswith(";"):
-                formatted_line = "x\"" + payload[idx]
-                # If its not the last line, add a comma
-                if idx + 1 < len(payload):
-                    formatted_line += "\","
-                else:
-                    formatted_line += "\""
-                rom_file += " " + formatted_line
-                # If 4 lines have been added, add a newline
-                if idx % 4 == 3 and idx + 1 < len(command):
-                    rom_file += "\n   "
-                elif idx % 4 == 3 and idx + 1 >= len(command):
-                    rom_file += "\n"
-                # Increment the index
-                idx += 1
-
-            # Check if we are at the end of the rom content
-            if idx >= len(payload):
-                break
 
-        # End of the ROM file
-        rom_file += """  );
+# End of the ROM file
+VHDL_FOOTER = """  );
 begin
   --! Assign the size of the ROM to the size output
   size <= std_logic_vector(to_unsigned(rom_size, 8));
@@ -433,11 +1295,600 @@ begin
   end process rom_process;
 end architecture rtl;"""
 
-        # Write the ROM file
-        with open('rom.vhd', 'w') as f:
-            f.write(rom_file)
 
-        print("ROM file generated successfully!")
+# Function that writes the values as rows of VHDL literals, a row at a time
+def emit_vhdl_rows(f, values, per_row, literal):
+    count = len(values)
+
+    for start in range(0, count, per_row):
+        end = start + per_row
+        # Format the entire row in one go
+        f.write(" " + ", ".join([literal % value for value in values[start:end]]))
+        # If its not the last row, add a comma and start the next row
+        if end < count:
+            f.write(",\n   ")
+
+
+# Function that streams the program to the file as a VHDL ROM
+def emit_vhdl(program, f):
+    count = len(program)
+
+    f.write(VHDL_HEADER)
+    # Add the size of the ROM to the ROM file
+    f.write(str(count - 1))
+    f.write(VHDL_INSTRUCTIONS)
+
+    # Add the instructions to the ROM file, 8 to a row
+    emit_vhdl_rows(f, program.opcodes, 8, "x\"%02x\"")
+    f.write("\n")
+    f.write(VHDL_PAYLOADS)
+
+    # Add the data to the ROM file, 4 to a row
+    emit_vhdl_rows(f, program.payloads, 4, "x\"%08x\"")
+    # The last row only ends with a newline if it is full
+    if count % 4 == 0:
+        f.write("\n")
+    f.write(VHDL_FOOTER)
+
+
+# Function that pads the program to the depth with delays of 0 cycles
+def pad_program(program, depth):
+    padded = program.select(range(len(program)))
+    for _ in range(len(program), depth):
+        padded.append(PAD_OPCODE, 0, 0)
+    return padded
+
+
+# Function that joins the instruction and payload of every entry into a memory word
+def memory_words(program):
+    return [(opcode << 32) | payload for opcode, payload in zip(program.opcodes, program.payloads)]
+
+
+# Function that writes the words as a $readmemh file, which data2mem and updatemem read as well
+def emit_mem(words, f):
+    f.write(f"// {len(words)} words of {MEMORY_WORD_BITS} bits, the instruction in bits 39 to 32 and the payload in bits 31 to 0\n")
+    f.write("@00000000\n")
+    f.write("".join(f"{word:010x}\n" for word in words))
+
+
+# Function that writes the words as a coefficient file for the Block Memory Generator
+def emit_coe(words, f):
+    f.write(f"; {len(words)} words of {MEMORY_WORD_BITS} bits, the instruction in bits 39 to 32 and the payload in bits 31 to 0\n")
+    f.write("memory_initialization_radix=16;\n")
+    f.write("memory_initialization_vector=\n")
+    f.write(",\n".join(f"{word:010x}" for word in words))
+    f.write(";\n")
+
+
+# Function that writes the layout of the ROM in the block RAMs for data2mem
+def emit_bmm(brams, depth, f):
+    f.write(f"// The ROM of the sequencer, {depth} words of {MEMORY_WORD_BITS} bits\n")
+    f.write(f"ADDRESS_SPACE rom RAMB16 [0x00000000:0x{depth * MEMORY_WORD_BITS // 8 - 1:08X}]\n")
+    f.write("  BUS_BLOCK\n")
+    for name, msb, lsb in sorted(brams, key=lambda bram: -bram[1]):
+        f.write(f"    {name} [{msb}:{lsb}];\n")
+    f.write("  END_BUS_BLOCK;\n")
+    f.write("END_ADDRESS_SPACE;\n")
+
+
+# Function that writes the layout of the ROM in the block RAMs for updatemem
+def emit_mmi(brams, depth, part, instance, f):
+    f.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+    f.write("<MemInfo Version=\"1\" Minor=\"0\">\n")
+    f.write(f"  <Processor Endianness=\"Little\" InstPath=\"{instance}\">\n")
+    f.write(f"    <AddressSpace Name=\"rom\" Begin=\"0\" End=\"{depth * MEMORY_WORD_BITS // 8 - 1}\">\n")
+    f.write("      <BusBlock>\n")
+    for site, msb, lsb in sorted(brams, key=lambda bram: -bram[1]):
+        mem_type, placement = BRAM_SITE.fullmatch(site).groups()
+        f.write(f"        <BitLane MemType=\"{mem_type}\" Placement=\"{placement}\">\n")
+        f.write(f"          <DataWidth MSB=\"{msb}\" LSB=\"{lsb}\"/>\n")
+        f.write(f"          <AddressRange Begin=\"0\" End=\"{depth - 1}\"/>\n")
+        f.write("          <Parity ON=\"false\" NumBits=\"0\"/>\n")
+        f.write("        </BitLane>\n")
+    f.write("      </BusBlock>\n")
+    f.write("    </AddressSpace>\n")
+    f.write("  </Processor>\n")
+    f.write("  <Config>\n")
+    f.write(f"    <Option Name=\"Part\" Val=\"{part}\"/>\n")
+    f.write("  </Config>\n")
+    f.write("  <DRC>\n")
+    f.write("    <Rule Name=\"RDADDRCHANGE\" Val=\"false\"/>\n")
+    f.write("  </DRC>\n")
+    f.write("</MemInfo>\n")
+
+
+# Function that packs runs of 8 bit data into packed data and repeat entries, returns the new program and the stats
+# Only data sent as 8 bit words is packed, as the sequencer sends every packed byte as an 8 bit word
+def compress_program(program):
+    opcodes = program.opcodes
+    payloads = program.payloads
+    count = len(program)
+    stats = {
+        "entries": count,
+        "packed": 0,
+        "packed_bytes": 0,
+        "repeat": 0,
+        "repeat_bytes": 0
+    }
+
+    # Find the data entries that can be packed, following the word size the way the sequencer does
+    packable = [False] * count
+    word_size = 8
+    for idx in range(count):
+        opcode = opcodes[idx]
+        if opcode == COMMAND:
+            word_size = 8
+        elif opcode == SIZE and payloads[idx] in WIDTH_CODES:
+            word_size = WIDTH_CODES[payloads[idx]]
+        elif opcode == DATA:
+            packable[idx] = word_size == 8 and payloads[idx] <= 0xff
+
+    # Count how many times each byte is repeated from there on, a run never crosses a comment
+    repeats = [0] * (count + 1)
+    for idx in reversed(range(count)):
+        if packable[idx]:
+            same = packable[idx + 1] if idx + 1 < count else False
+            same = same and payloads[idx + 1] == payloads[idx] and idx + 1 not in program.comments
+            repeats[idx] = repeats[idx + 1] + 1 if same else 1
+
+    kept = []
+    encoded = {}
+    idx = 0
+    while idx < count:
+        kept.append(idx)
+        if not packable[idx]:
+            idx += 1
+            continue
+
+        # A repeat only pays off over packed data when the byte is sent more than 4 times
+        if repeats[idx] > 4:
+            run = min(repeats[idx], MAX_REPEAT)
+            encoded[idx] = (REPEAT, run << 8 | payloads[idx])
+            stats["repeat"] += 1
+            stats["repeat_bytes"] += run
+            idx += run
+            continue
+
+        # Pack up to 4 bytes, stopping in front of a comment or a byte that is better off repeated
+        run = 1
+        while run < 4 and idx + run < count and packable[idx + run] and idx + run not in program.comments and repeats[idx + run] <= 4:
+            run += 1
+        if run > 1:
+            payload = 0
+            for position in range(run):
+                payload |= payloads[idx + position] << (24 - 8 * position)
+            # The packed data opcodes follow the data opcode, 0x22 holds 2 bytes up to 0x24 holding 4
+            encoded[idx] = (DATA + run - 1, payload)
+            stats["packed"] += 1
+            stats["packed_bytes"] += run
+        idx += run
+
+    compressed = program.select(kept)
+    for position, idx in enumerate(kept):
+        if idx in encoded:
+            compressed.opcodes[position], compressed.payloads[position] = encoded[idx]
+    stats["compressed_entries"] = len(compressed)
+
+    return compressed, stats
+
+
+# Function that expands the packed data and repeat entries back into a data entry per byte
+def decompress_program(program):
+    decoded = ROM_Program(program.source)
+
+    for idx in range(len(program) + 1):
+        if idx in program.comments:
+            decoded.comments[len(decoded)] = list(program.comments[idx])
+        if idx == len(program):
+            break
+
+        opcode = program.opcodes[idx]
+        if opcode in PACKED or opcode == REPEAT:
+            for byte in unpack_bytes(opcode, program.payloads[idx]):
+                decoded.append(DATA, byte, program.lines[idx])
+        else:
+            decoded.append(opcode, program.payloads[idx], program.lines[idx])
+
+    return decoded
+
+
+# Function that sends runs of 8 bit data as 16, 24 and 32 bit words, returns the new program and the stats
+# Each run of data bytes is split into the words that take the fewest ROM entries, then the fewest clock cycles,
+# counting the size instructions that switch between the word sizes
+# With compress, a run is only widened when it takes no more entries than the compression would pack it into
+def widen_program(program, estimator, word_sizes=DEFAULT_WIDE_WORDS, compress=False):
+    opcodes = program.opcodes
+    payloads = program.payloads
+    count = len(program)
+    stats = {
+        "entries": count,
+        "runs": 0,
+        "words": 0,
+        "bytes": 0,
+        "sizes": 0
+    }
+    width_codes = {bits: code for code, bits in WIDTH_CODES.items()}
+
+    # The cycles of a data entry of each word size, and of a size entry
+    sizes = (8, *sorted(word_sizes))
+    data_cycles = {bits: FETCH_CYCLES + estimator.transfer_cycles(bits) + VERIFY_CYCLES for bits in sizes}
+    size_cycles = FETCH_CYCLES + 1 + VERIFY_CYCLES
+
+    # Find the data bytes sent as 8 bit words, following the word size the way the sequencer does
+    widenable = [False] * count
+    word_size = 8
+    for idx in range(count):
+        opcode = opcodes[idx]
+        if opcode == COMMAND or opcode in PACKED or opcode == REPEAT:
+            word_size = 8
+        elif opcode == SIZE and payloads[idx] in WIDTH_CODES:
+            word_size = WIDTH_CODES[payloads[idx]]
+        elif opcode == DATA:
+            widenable[idx] = word_size == 8 and payloads[idx] <= 0xff
+
+    plans = {}
+    rewrites = {}
+    idx = 0
+    while idx < count:
+        if not widenable[idx]:
+            idx += 1
+            continue
+
+        # A run of bytes never crosses a comment
+        end = idx + 1
+        while end < count and widenable[end] and end not in program.comments:
+            end += 1
+        length = end - idx
+
+        # The word size must go back to 8 bits when more 8 bit data follows, a command or a size sets it anyway
+        following = next((opcodes[next_idx] for next_idx in range(end, count) if opcodes[next_idx] not in ROM_Generator.wait_opcodes), None)
+        restore = following == DATA
+        # A size right in front of the run is changed to the first word size, instead of adding another
+        prior_size = idx > 0 and opcodes[idx - 1] == SIZE and idx not in program.comments
+
+        # The cheapest way to reach each byte of the run with each word size in effect, as (entries, cycles, previous)
+        best = {(0, 8): (0, 0, None)}
+        for position in range(length):
+            for current in sizes:
+                if (position, current) not in best:
+                    continue
+                entries, cycles, _ = best[(position, current)]
+                for bits in sizes:
+                    reached = position + bits // 8
+                    if reached > length:
+                        continue
+                    switch = bits != current and not (position == 0 and prior_size)
+                    cost = (entries + 1 + switch, cycles + data_cycles[bits] + switch * size_cycles, (position, current))
+                    if (reached, bits) not in best or cost[:2] < best[(reached, bits)][:2]:
+                        best[(reached, bits)] = cost
+
+        finals = []
+        for bits in sizes:
+            if (length, bits) in best:
+                entries, cycles, _ = best[(length, bits)]
+                switch = restore and bits != 8
+                finals.append((entries + switch, cycles + switch * size_cycles, bits))
+        entries, cycles, last = min(finals)
+
+        # Only replace the run when it saves entries or time over sending every byte on its own
+        worthwhile = (entries, cycles) < (length, length * data_cycles[8])
+        if worthwhile and compress:
+            run = ROM_Program(program.source)
+            for byte in payloads[idx:end]:
+                run.append(DATA, byte, 0)
+            worthwhile = entries <= len(compress_program(run)[0])
+        if worthwhile:
+            # Walk back from the end of the run to find the words
+            words = []
+            node = (length, last)
+            while best[node][2] is not None:
+                previous = best[node][2]
+                words.append((previous[0], node[0], node[1], previous[1]))
+                node = previous
+
+            replacement = []
+            for start, stop, bits, current in reversed(words):
+                line = program.lines[idx + start]
+                if start == 0 and prior_size:
+                    rewrites[idx - 1] = width_codes[bits]
+                elif bits != current:
+                    replacement.append((SIZE, width_codes[bits], line))
+                    stats["sizes"] += 1
+                payload = 0
+                for byte in payloads[idx + start:idx + stop]:
+                    payload = payload << 8 | byte
+                replacement.append((DATA, payload, line))
+                if bits != 8:
+                    stats["words"] += 1
+                    stats["bytes"] += stop - start
+            if restore and last != 8:
+                replacement.append((SIZE, width_codes[8], program.lines[end - 1]))
+                stats["sizes"] += 1
+
+            plans[idx] = (end, replacement)
+            stats["runs"] += 1
+
+        idx = end
+
+    # Rebuild the program with the runs replaced, keeping the comments in place
+    widened = ROM_Program(program.source)
+    idx = 0
+    while idx <= count:
+        if idx in program.comments:
+            widened.comments.setdefault(len(widened), []).extend(program.comments[idx])
+        if idx == count:
+            break
+        if idx in plans:
+            end, replacement = plans[idx]
+            for opcode, payload, line in replacement:
+                widened.append(opcode, payload, line)
+            idx = end
+        else:
+            widened.append(opcodes[idx], rewrites.get(idx, payloads[idx]), program.lines[idx])
+            idx += 1
+    stats["widened_entries"] = len(widened)
+
+    return widened, stats
+
+
+# Function that lists what the display is sent with a data/command pin: every command, every data byte and every wait
+# Words that are a whole number of bytes are split into their bytes, the display reads them a byte at a time
+def spi_stream(program):
+    stream = []
+    word_size = 8
+
+    for opcode, payload in zip(program.opcodes, program.payloads):
+        if opcode == COMMAND:
+            word_size = 8
+            stream.append((COMMAND, payload & 0xff))
+        elif opcode == SIZE:
+            word_size = WIDTH_CODES.get(payload, word_size)
+        elif opcode == DATA:
+            if word_size % 8:
+                stream.append((DATA, word_size, payload & ((1 << word_size) - 1)))
+            else:
+                stream.extend((DATA, (payload >> shift) & 0xff) for shift in range(word_size - 8, -8, -8))
+        elif opcode in PACKED or opcode == REPEAT:
+            word_size = 8
+            stream.extend((DATA, byte) for byte in unpack_bytes(opcode, payload))
+        else:
+            stream.append((opcode, payload))
+
+    return stream
+
+
+# Function that expands the batch arguments into a list of (input, output name) pairs
+def collect_batch_inputs(patterns, extension=".txt"):
+    jobs = []
+
+    for pattern in patterns:
+        # A directory is searched recursively for instruction files
+        if os.path.isdir(pattern):
+            root = pattern
+            matches = glob.glob(os.path.join(pattern, "**", "*" + extension), recursive=True)
+        # Anything else is treated as a glob pattern
+        else:
+            matches = glob.glob(pattern, recursive=True)
+            # Keep the folder structure below the common folder of all the matches
+            root = os.path.commonpath([os.path.dirname(os.path.abspath(m)) for m in matches]) if matches else ""
+
+        if not matches:
+            print(f"WARNING: \"{pattern}\" DID NOT MATCH ANY FILES!")
+
+        for match in sorted(matches):
+            # Skip anything that is not a file
+            if not os.path.isfile(match):
+                continue
+            # Name the ROM after the input file, relative to the root of the batch
+            relative = os.path.relpath(os.path.abspath(match), os.path.abspath(root))
+            jobs.append((match, os.path.splitext(relative)[0]))
+
+    return jobs
+
+
+# The version of the generator, any change to its code gives new cache keys
+@functools.lru_cache(maxsize=None)
+def generator_version():
+    folder = os.path.dirname(os.path.abspath(__file__))
+    return source_version(*(os.path.join(folder, name) for name in ("rom_generator.py", "estimator.py", "controllers.py", "reference_model.py")))
+
+
+# Function that gives the ROM and debug output of a file in the batch
+def batch_outputs(output_folder, name):
+    return os.path.join(output_folder, name + ".vhd"), os.path.join(output_folder, name + "_optimized.txt")
+
+
+# Function that compiles a single file, this is run inside the worker processes
+# With a profile path, the compile is profiled and the profile is written to that path
+def compile_file(filename, output, debug_output, debug, options, profile=None):
+    start = time.perf_counter()
+    boot_time = None
+    cached = False
+    stats = None
+    try:
+        with profiled(profile):
+            generator = ROM_Generator(filename, debug, output, debug_output, quiet=True, **options)
+        success = True
+        # Report the estimated boot time if it was asked for
+        boot_time = generator.boot_time
+        cached = generator.cache_hit
+        stats = generator.stats
+    # The generator exits on errors, catch it so one bad file does not stop the batch
+    except SystemExit:
+        success = False
+
+    return filename, output, success, time.perf_counter() - start, boot_time, cached, stats
+
+
+# Profile the code run inside the with statement with cProfile, and write the profile to the path
+# The profile is also written when the generator exits on an error, it is read with python3 -m pstats
+@contextlib.contextmanager
+def profiled(path):
+    if not path:
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        profiler.dump_stats(path)
+
+
+# Function that compiles every file in the batch on a process pool
+# With profile set, the profile of each file is written next to its ROM
+def compile_batch(patterns, output_folder, debug, jobs=None, options=None, profile=False):
+    batch = collect_batch_inputs(patterns)
+    if not batch:
+        print("ERROR: NO INPUT FILES FOUND!")
+        exit()
+
+    results = []
+    start = time.perf_counter()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for filename, name in batch:
+            output, debug_output = batch_outputs(output_folder, name)
+            profile_output = os.path.splitext(output)[0] + ".prof" if profile else None
+            futures.append(executor.submit(compile_file, filename, output, debug_output, debug, options or {}, profile_output))
+
+        # Collect the results in the order the files were given
+        for future in futures:
+            results.append(future.result())
+
+    wall_time = time.perf_counter() - start
+
+    # Print the summary of the batch
+    width = max(len(result[0]) for result in results)
+    estimated = any(result[4] is not None for result in results)
+    cache = (options or {}).get("cache")
+    # The ROM usage of each file, when the stats were asked for
+    counted = any(result[6] and "entries" in result[6] for result in results)
+    print(f"{'Input'.ljust(width)}  {'Time (ms)':>10}" + (f"  {'Boot (ms)':>10}" if estimated else "") + (f"  {'ROM':>7}" if counted else "")
+          + ("  Cache" if cache else "") + "  Output")
+    for filename, output, success, elapsed, boot_time, cached, stats in results:
+        status = output if success else "FAILED"
+        boot = (f"  {boot_time:>10.2f}" if boot_time is not None else f"  {'-':>10}") if estimated else ""
+        used = (f"  {stats['entries']:>3}/{stats['depth']:<3}" if stats and "entries" in stats else f"  {'-':>7}") if counted else ""
+        hit = (f"  {'hit' if cached else 'miss':<5}") if cache else ""
+        print(f"{filename.ljust(width)}  {elapsed * 1000:>10.2f}{boot}{used}{hit}  {status}")
+
+    failed = sum(1 for result in results if not result[2])
+    cpu_time = sum(result[3] for result in results)
+    print(f"\nCompiled {len(results) - failed}/{len(results)} files in {wall_time * 1000:.2f} ms wall time "
+          f"({cpu_time * 1000:.2f} ms total compile time, {cpu_time / wall_time:.2f}x speedup)")
+    # The file with the least headroom decides if the batch still fits the ROM
+    if counted:
+        tightest = min((result for result in results if result[6] and "entries" in result[6]), key=lambda result: result[6]["headroom"])
+        print(f"Least ROM headroom: {tightest[6]['headroom']} entries, in {tightest[0]}")
+    # The workers have their own copy of the cache, so the hits are counted from the results
+    if cache:
+        cache.hits += sum(1 for result in results if result[5])
+        cache.misses += sum(1 for result in results if not result[5])
+        print(cache.report())
+
+    return results
+
+
+# Function that writes the stats of one or more runs to a json file
+def write_stats_json(path, stats, wall_time=None):
+    report = {"files": stats}
+    if wall_time is not None:
+        report["wall_time"] = wall_time
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+
+
+# Function that hashes the content of the files, a missing file hashes as empty
+def hash_sources(sources):
+    digest = hashlib.sha256()
+
+    for source in sources:
+        digest.update(source.encode() + b"\0")
+        try:
+            with open(source, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"\1")
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+# Function that gets the modification time and size of the files, cheap enough to check on every poll
+def stat_sources(sources):
+    stats = []
+
+    for source in sources:
+        try:
+            stat = os.stat(source)
+            stats.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stats.append(None)
+
+    return stats
+
+
+# Function that polls the input files and recompiles the ones whose content changed, until interrupted
+# Each job is an (input, output, debug output) tuple
+def watch_files(jobs, debug, interval, options=None):
+    # The files each input was compiled from, and their stats and hash at the last compile
+    sources = {filename: [filename] for filename, _, _ in jobs}
+    stats = {}
+    hashes = {}
+
+    print(f"Watching {len(jobs)} file{'s' if len(jobs) != 1 else ''}, press Ctrl+C to stop")
+    try:
+        while True:
+            for filename, output, debug_output in jobs:
+                # Only hash the files when the time stamp or size moved, and only compile when the content changed
+                current = stat_sources(sources[filename])
+                if stats.get(filename) == current:
+                    continue
+                stats[filename] = current
+                digest = hash_sources(sources[filename])
+                if hashes.get(filename) == digest:
+                    continue
+
+                start = time.perf_counter()
+                try:
+                    generator = ROM_Generator(filename, debug, output, debug_output, quiet=True, **(options or {}))
+                    sources[filename] = generator.sources
+                    status = "updated" if generator.rom_changed else "unchanged"
+                    if generator.cache_hit:
+                        status += ", from the cache"
+                # The generator exits on errors, keep watching so the file can be fixed
+                except SystemExit:
+                    status = "FAILED"
+                elapsed = time.perf_counter() - start
+
+                # Remember the files as they were compiled, including any file that was found while compiling
+                stats[filename] = stat_sources(sources[filename])
+                hashes[filename] = hash_sources(sources[filename])
+                print(f"[{time.strftime('%H:%M:%S')}] {filename} -> {output} ({elapsed * 1000:.2f} ms, {status})")
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+
+
+# Parse a block RAM such as RAMB18_X0Y0:31:0
+def parse_bram(text):
+    try:
+        name, msb, lsb = text.rsplit(":", 2)
+        msb, lsb = int(msb), int(lsb)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"\"{text}\" is not a block RAM such as RAMB18_X0Y0:31:0")
+    if not name or not 0 <= lsb <= msb < MEMORY_WORD_BITS:
+        raise argparse.ArgumentTypeError(f"\"{text}\" must hold bits within 39 to 0, the most significant first")
+    return name, msb, lsb
 
 
 def main():
@@ -446,12 +1897,40 @@ def main():
         description="Generate a ROM file from psuedo-assembly code."
     )
 
-    parser.add_argument(
+    # Either a single file or a batch of files must be given
+    inputs = parser.add_mutually_exclusive_group(required=True)
+
+    inputs.add_argument(
         "-i",
         "--input",
         type=str,
-        help="The input file containing the psuedo-assembly code.",
-        required=True
+        help="The input file containing the psuedo-assembly code."
+    )
+
+    inputs.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        nargs="+",
+        help="Directories or glob patterns of input files to compile in parallel."
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The output file, or the output folder when compiling a batch.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="The number of worker processes used in batch mode, defaults to the number of cores.",
+        required=False,
+        default=None
     )
 
     parser.add_argument(
@@ -463,10 +1942,242 @@ def main():
         default=False
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        "-O",
+        "--optimize",
+        action="store_true",
+        help="Remove redundant page selects, register writes, size changes and waits from the code.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "-e",
+        "--estimate",
+        action="store_true",
+        help="Estimate how long the sequencer takes to reset and initialize the display.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--clock",
+        type=float,
+        help=f"The clock of the sequencer in MHz, used by the estimate. Defaults to {DEFAULT_CLOCK / 1e6} MHz.",
+        required=False,
+        default=DEFAULT_CLOCK / 1e6
+    )
+
+    parser.add_argument(
+        "-w",
+        "--waveforms",
+        action="store_true",
+        help="Write the expected SPI waveforms as a VCD and a vector file for the testbench next to the ROM.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "-c",
+        "--controller",
+        type=str,
+        choices=sorted(CONTROLLERS),
+        help="The display controller, used to check the waits after commands against the minimum delays in its datasheet.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "-t",
+        "--tighten",
+        action="store_true",
+        help="Replace waits that are longer or shorter than the controller needs with a delay of exactly the minimum.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "-z",
+        "--compress",
+        action="store_true",
+        help="Pack the 8 bit data into packed data and repeat entries, so longer code fits the ROM.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "-W",
+        "--widen",
+        action="store_true",
+        help="Send runs of 8 bit data as 16, 24 or 32 bit words, adding the size instructions between them. Needs --four-wire.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--four-wire",
+        action="store_true",
+        help="The display takes the data/command signal on a pin of its own (alt_spi_dc => '0'), instead of a bit in front of every word.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "-f",
+        "--format",
+        type=str,
+        nargs="+",
+        choices=sorted(ROM_FORMATS),
+        help="The formats to write the ROM in, next to the output: the VHDL, a $readmemh .mem, a .coe for the Block Memory Generator, "
+             "and the .bmm or .mmi layout data2mem or updatemem patch a bitstream with. Defaults to vhdl.",
+        required=False,
+        default=["vhdl"]
+    )
 
+    parser.add_argument(
+        "--pad",
+        action="store_true",
+        help="Pad the VHDL to the depth of the ROM with delays of 0 cycles, so a bitstream built from it can be patched with a longer program.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--bram",
+        type=parse_bram,
+        action="append",
+        help="A block RAM that holds bits MSB to LSB of the 40 bit word, given once for each. The instance for the .bmm, the site such as RAMB18_X0Y0 for the .mmi. "
+             f"Defaults to {', '.join(f'{name}:{msb}:{lsb}' for name, msb, lsb in DEFAULT_BRAMS)}.",
+        metavar="NAME:MSB:LSB",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--part",
+        type=str,
+        help=f"The part written in the .mmi. Defaults to {DEFAULT_PART}, the Zybo Z7-10.",
+        required=False,
+        default=DEFAULT_PART
+    )
+
+    parser.add_argument(
+        "--instance",
+        type=str,
+        help="The instance path of the block RAM ROM written in the .mmi, such as sequencer_inst/rom_bmg, which is given to updatemem with -proc. "
+             "Needed for the .mmi, the ROM of rom.vhd is not in block RAM.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running, and recompile the input files whenever their content changes.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--interval",
+        type=float,
+        help="The number of seconds between each check of the input files in watch mode.",
+        required=False,
+        default=0.5
+    )
+
+    parser.add_argument(
+        "--cache",
+        type=str,
+        nargs="?",
+        const=DEFAULT_CACHE_FOLDER,
+        help=f"Serve the generated files from a cache when nothing they depend on changed. Defaults to {DEFAULT_CACHE_FOLDER}.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        help=f"The size of the cache in MB, the least recently used files are removed past it. Defaults to {DEFAULT_MAX_SIZE >> 20} MB.",
+        required=False,
+        default=DEFAULT_MAX_SIZE >> 20
+    )
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print the time spent in each phase, the entries of each opcode, the ROM addresses used and the SPI payload bits of each word size.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--stats-json",
+        type=str,
+        help="Write the stats of every compiled file to this json file.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="rom_generator.prof",
+        help="Profile the generator with cProfile and write the profile to this file, rom_generator.prof if none is given. "
+             "In batch mode the profile of each file is written next to its ROM.",
+        required=False,
+        default=None
+    )
+
+    args = parser.parse_args()
+    cache = Artifact_Cache(args.cache, int(args.cache_size * (1 << 20))) if args.cache else None
+
+    # Options passed on to every ROM generator
+    options = {
+        "optimize": args.optimize,
+        "estimate": args.estimate,
+        "clock": args.clock * 1e6,
+        "vectors": args.waveforms,
+        "controller": args.controller,
+        "tighten": args.tighten,
+        "compress": args.compress,
+        "widen": args.widen,
+        "four_wire": args.four_wire,
+        "formats": args.format,
+        "pad": args.pad,
+        "brams": args.bram or DEFAULT_BRAMS,
+        "part": args.part,
+        "instance": args.instance,
+        "cache": cache,
+        "stats": args.stats or args.stats_json is not None
+    }
+
+    # Keep recompiling the files as they change
+    if args.watch:
+        if args.batch:
+            output_folder = args.output or "output"
+            jobs = [(filename, *batch_outputs(output_folder, name)) for filename, name in collect_batch_inputs(args.batch)]
+        else:
+            jobs = [(args.input, args.output or "rom.vhd", "output/instructions_optimized.txt")]
+        watch_files(jobs, args.debug, args.interval, options)
+    # Compile every file in the batch
+    elif args.batch:
+        start = time.perf_counter()
+        results = compile_batch(args.batch, args.output or "output", args.debug, args.jobs, options, args.profile is not None)
+        if args.stats_json:
+            write_stats_json(args.stats_json, [result[6] for result in results if result[6]], time.perf_counter() - start)
     # Create the ROM generator
-    ROM_Generator(args.input, args.debug)
+    else:
+        with profiled(args.profile):
+            generator = ROM_Generator(args.input, args.debug, args.output or "rom.vhd", **options)
+        if cache:
+            print(cache.report())
+        if args.profile:
+            print(f"Profile written to {args.profile}")
+        if args.stats_json:
+            write_stats_json(args.stats_json, [generator.stats])
 
 
 if __name__ == "__main__":
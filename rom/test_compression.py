@@ -0,0 +1,113 @@
+import os
+import glob
+import tempfile
+import unittest
+from unittest import mock
+
+from estimator import COMMAND, SIZE, DATA, REPEAT, MAX_REPEAT
+from rom_generator import ROM_Generator, ROM_Program, compress_program, decompress_program
+
+
+EXAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example")
+
+
+# Build a program from (opcode, payload) entries, a string in the entries is a comment in front of the next entry
+def build_program(entries):
+    program = ROM_Program("test")
+    for entry in entries:
+        if isinstance(entry, str):
+            program.add_comment(entry)
+        else:
+            program.append(*entry, len(program) + 1)
+    return program
+
+
+# The entries of data bytes, a data entry for every byte
+def data(*payloads):
+    return [(DATA, payload) for payload in payloads]
+
+
+class TestCompression(unittest.TestCase):
+    # Compress and decompress the program, check that the same entries and comments come back, and return the compressed program
+    def round_trip(self, program):
+        compressed, stats = compress_program(program)
+        decompressed = decompress_program(compressed)
+
+        self.assertEqual(list(decompressed.opcodes), list(program.opcodes))
+        self.assertEqual(list(decompressed.payloads), list(program.payloads))
+        self.assertEqual(decompressed.comments, program.comments)
+        self.assertEqual(stats["compressed_entries"], len(compressed))
+        return compressed
+
+
+    def test_examples(self):
+        files = sorted(glob.glob(os.path.join(EXAMPLE_FOLDER, "*.txt")))
+        self.assertTrue(files)
+
+        with tempfile.TemporaryDirectory() as folder:
+            for filename in files:
+                with self.subTest(filename=os.path.basename(filename)):
+                    generator = ROM_Generator(filename, False, os.path.join(folder, "rom.vhd"), quiet=True)
+                    compressed = self.round_trip(generator.program)
+                    self.assertLessEqual(len(compressed), len(generator.program))
+
+
+    def test_repeat_threshold(self):
+        # 4 bytes are packed into a single data4, a repeat only pays off from 5 bytes
+        compressed = self.round_trip(build_program([(COMMAND, 0x2c)] + data(*[0xaa] * 4)))
+        self.assertEqual(list(compressed.opcodes), [COMMAND, 0x24])
+        self.assertEqual(compressed.payloads[1], 0xaaaaaaaa)
+
+        compressed = self.round_trip(build_program([(COMMAND, 0x2c)] + data(*[0xaa] * 5)))
+        self.assertEqual(list(compressed.opcodes), [COMMAND, REPEAT])
+        self.assertEqual(compressed.payloads[1], 5 << 8 | 0xaa)
+
+
+    def test_max_repeat(self):
+        # A run longer than a repeat holds is split over several of them, shown with a smaller limit
+        with mock.patch("rom_generator.MAX_REPEAT", 6):
+            for length in (5, 6, 7, 11, 12, 13):
+                with self.subTest(length=length):
+                    compressed = self.round_trip(build_program([(COMMAND, 0x2c)] + data(*[0x55] * length)))
+                    repeats = [payload >> 8 for opcode, payload in zip(compressed.opcodes, compressed.payloads) if opcode == REPEAT]
+                    self.assertTrue(all(run <= 6 for run in repeats))
+                    # Every full repeat is taken before the rest of the run
+                    self.assertEqual(repeats[:length // 6], [6] * (length // 6))
+
+        # The real limit is far beyond any ROM, a long run is a single repeat
+        compressed = self.round_trip(build_program(data(*[0x00] * 1000)))
+        self.assertEqual(list(compressed.opcodes), [REPEAT])
+        self.assertLess(1000, MAX_REPEAT)
+
+
+    def test_runs_broken_by_comments(self):
+        program = build_program(data(1, 2) + ["; gamma"] + data(3, 4) + data(*[7] * 3) + ["; more"] + data(*[7] * 3))
+        compressed = self.round_trip(program)
+        # Neither the packed data nor the repeat cross a comment
+        self.assertNotIn(REPEAT, compressed.opcodes)
+        self.assertEqual(list(compressed.opcodes), [0x22, 0x24, DATA, 0x23])
+
+
+    def test_runs_broken_by_size_changes(self):
+        program = build_program(data(1, 2, 3) + [(SIZE, 1)] + data(0x1234, 0x1234) + [(SIZE, 0)] + data(4, 5))
+        compressed = self.round_trip(program)
+        self.assertEqual(list(compressed.opcodes), [0x23, SIZE, DATA, DATA, SIZE, 0x22])
+
+
+    def test_wide_data_is_left_alone(self):
+        # Data sent as 16, 24 or 32 bit words is never packed, neither is a payload that does not fit a byte
+        for code in (1, 2, 3, 4):
+            with self.subTest(code=code):
+                compressed = self.round_trip(build_program([(SIZE, code)] + data(*[0x12] * 6)))
+                self.assertEqual(list(compressed.opcodes), [SIZE] + [DATA] * 6)
+
+        compressed = self.round_trip(build_program(data(0x100, 0x100, 0x100, 0x100, 0x100)))
+        self.assertEqual(list(compressed.opcodes), [DATA] * 5)
+
+        # A command sets the word size back to 8 bits
+        compressed = self.round_trip(build_program([(SIZE, 4)] + data(1, 2) + [(COMMAND, 0x2c)] + data(1, 2)))
+        self.assertEqual(list(compressed.opcodes), [SIZE, DATA, DATA, COMMAND, 0x22])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+import rom_generator
+from estimator import COMMAND, DATA
+from rom_generator import ROM_Generator
+
+
+class TestIncludes(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        # Every test starts without the fragments parsed by the others
+        rom_generator.fragment_cache.clear()
+
+
+    # Write the files, given by their path relative to the temporary folder
+    def write(self, files):
+        for name, text in files.items():
+            path = os.path.join(self.folder.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(text)
+
+
+    def compile(self, name):
+        generator = ROM_Generator(os.path.join(self.folder.name, name), False, os.path.join(self.folder.name, "rom.vhd"), quiet=True)
+        return generator.program, [os.path.relpath(source, self.folder.name) for source in generator.sources]
+
+
+    def entries(self, program):
+        return list(zip(program.opcodes, program.payloads))
+
+
+    def test_include(self):
+        self.write({
+            "top.txt": "cmd 0x01\ninclude \"common/gamma.txt\"\ncmd 0x29\n",
+            "common/gamma.txt": "cmd 0xe0\ndata 0x01 0x02\n"
+        })
+        program, sources = self.compile("top.txt")
+        self.assertEqual(self.entries(program), [(COMMAND, 0x01), (COMMAND, 0xe0), (DATA, 0x01), (DATA, 0x02), (COMMAND, 0x29)])
+        self.assertEqual(sources, ["top.txt", os.path.join("common", "gamma.txt")])
+
+
+    def test_macro(self):
+        self.write({
+            "top.txt": "macro bank page\ncmd 0xff\ndata 0x77 {page}\nendmacro\n"
+                       "macro write reg *values\ncmd {reg}\ndata {values}\nendmacro\n"
+                       "bank 0x10\nwrite 0xb0 0x00 0x17\nbank 0x10\n"
+        })
+        program, _ = self.compile("top.txt")
+        self.assertEqual(self.entries(program), [(COMMAND, 0xff), (DATA, 0x77), (DATA, 0x10),
+                                                 (COMMAND, 0xb0), (DATA, 0x00), (DATA, 0x17),
+                                                 (COMMAND, 0xff), (DATA, 0x77), (DATA, 0x10)])
+
+
+    def test_macro_calls_itself(self):
+        self.write({"top.txt": "macro loop\nloop\nendmacro\nloop\n"})
+        with self.assertRaises(SystemExit):
+            self.compile("top.txt")
+
+
+    def test_include_in_shared_macro(self):
+        # Both folders define the same macro with the same text, its include is relative to the folder of the file compiled
+        for folder, opcode in (("a", 0x11), ("b", 0x29)):
+            self.write({
+                f"{folder}/defs.txt": "macro m\ninclude x.txt\nendmacro\n",
+                f"{folder}/x.txt": f"cmd {opcode:#04x}\n",
+                f"{folder}/top.txt": "include defs.txt\nm\n"
+            })
+
+        for folder, opcode in (("a", 0x11), ("b", 0x29)):
+            with self.subTest(folder=folder):
+                program, sources = self.compile(f"{folder}/top.txt")
+                self.assertEqual(self.entries(program), [(COMMAND, opcode)])
+                self.assertEqual(sources, [os.path.join(folder, name) for name in ("top.txt", "defs.txt", "x.txt")])
+
+
+if __name__ == "__main__":
+    unittest.main()
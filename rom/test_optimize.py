@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from estimator import COMMAND, DATA, DELAY
+from rom_generator import ROM_Generator
+
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "example", "st7701s_instructions.txt")
+
+
+class TestOptimize(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.TemporaryDirectory() as folder:
+            cls.generator = ROM_Generator(EXAMPLE, False, os.path.join(folder, "rom.vhd"), quiet=True)
+
+
+    # Compile and optimize the lines, returns the kept entries and what was saved
+    def optimize(self, lines):
+        program, savings = self.generator.optimize_content(self.generator.compile_content(lines))
+        return list(zip(program.opcodes, program.payloads)), savings
+
+
+    def test_duplicate_write_with_other_waits(self):
+        # The second write is the same value, only the wait after it differs, which is kept
+        entries, savings = self.optimize(["cmd 0x3a", "data 0x55", "delay 10", "cmd 0x3a", "data 0x55", "delay 20"])
+        self.assertEqual(entries, [(COMMAND, 0x3a), (DATA, 0x55), (DELAY, 30)])
+        self.assertEqual(savings["duplicate_write"], 2)
+
+
+    def test_page_select_with_wait(self):
+        # Selecting the page again is dropped, even when a wait follows the first select and not the second
+        entries, savings = self.optimize(["cmd 0xff", "data 0x77 0x01 0x00 0x00 0x10", "delay 5", "cmd 0xc0", "data 0x3b",
+                                          "cmd 0xff", "data 0x77 0x01 0x00 0x00 0x10", "cmd 0xc1", "data 0x0d",
+                                          "cmd 0xff", "data 0x77 0x01 0x00 0x00 0x10", "delay 7", "cmd 0xc2", "data 0x37"])
+        self.assertEqual(savings["page_select"], 12)
+        self.assertEqual([entry for entry in entries if entry[0] == COMMAND], [(COMMAND, 0xff), (COMMAND, 0xc0), (COMMAND, 0xc1), (COMMAND, 0xc2)])
+        self.assertEqual([entry for entry in entries if entry[0] == DELAY], [(DELAY, 5), (DELAY, 7)])
+
+
+    def test_changed_write_is_kept(self):
+        entries, savings = self.optimize(["cmd 0x3a", "data 0x55", "cmd 0x3a", "data 0x66"])
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(savings["duplicate_write"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
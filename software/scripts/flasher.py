@@ -0,0 +1,660 @@
+# Library behind programmer.py, which resets the driver boards into their bootloader and copies the firmware to them
+# The settings below are the defaults, Load_Config replaces them with the ones from a config file
+# Modules that are only needed on some paths, such as pyserial and numpy, are imported when they are first used
+
+
+# the file name, its location and the target device name
+file_name = "Firmware.uf2"
+file_path = "../build/" + file_name
+# a copy of the last uf2 file that was flashed, to show how much of the image changed
+flashed_file_path = "../build/Flashed.uf2"
+device_target = "RPI-RP2"
+# the vendor id of the device
+vendor_id = "2E8A"
+product_id = "000A"
+# baudrate
+baudrate = 9600
+timeout = 1
+# reset message
+reset_start = 0x01
+reset_message = 0x06
+# how long to wait for the device to be mounted after the reset, in seconds
+mount_timeout = 30
+# how often to look for the device on systems that do not signal mount events, in seconds
+scan_interval = 0.1
+# the mount table of the kernel, which signals every mount and unmount on linux
+mountinfo_path = "/proc/self/mountinfo"
+# usb devices in sysfs are named after the port they are plugged in to, such as 1-1.2
+usb_port_pattern = r"\d+-\d+(\.\d+)*"
+# size of the chunks the uf2 file is copied in
+copy_chunk_size = 64 * 1024
+# the firmware reports its version as the string of its hid interface, following this prefix
+version_prefix = "Firmware "
+# how often the daemon looks for newly plugged boards, in seconds
+daemon_interval = 0.5
+# the phases of a flash in the order they happen, each is timed and written to the metrics
+phase_names = ["discover", "serial_open", "reset_write", "mount", "copy", "reenumerate"]
+# the percentiles of every phase in the summary of the metrics
+summary_percentiles = [50, 90, 99]
+
+# the settings a config file can change, as the names above
+config_names = [
+    "file_name", "file_path", "flashed_file_path", "device_target", "vendor_id", "product_id", "baudrate", "timeout",
+    "reset_start", "reset_message", "mount_timeout", "scan_interval", "copy_chunk_size", "version_prefix", "daemon_interval"
+]
+
+
+import shutil
+import os
+import re
+import sys
+import json
+import math
+import errno
+import select
+import platform
+import importlib
+import threading
+import time
+import functools
+import concurrent.futures
+
+
+# Fix the path so that the script can be run from any directory, the paths are relative to the scripts folder
+file_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), file_path))
+flashed_file_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), flashed_file_path))
+
+
+# Import a module when it is first needed, and name the package to install if it is missing
+def Require(module, package):
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"The '{package}' module is not installed, install it with: {sys.executable} -m pip install {package}") from None
+
+
+# Replace the settings with the ones in a json config file, paths in the file are relative to it
+def Load_Config(path):
+    with open(path) as f:
+        settings = json.load(f)
+
+    module = globals()
+    for name, value in settings.items():
+        if name not in config_names:
+            raise ValueError(f"unknown setting '{name}'")
+        # whole numbers are fine for settings in seconds, anything else must match the type of the default
+        default = module[name]
+        if type(value) is not type(default) and not (isinstance(default, float) and type(value) is int):
+            raise ValueError(f"'{name}' must be a {type(default).__name__}")
+        if name in ("file_path", "flashed_file_path"):
+            value = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(path)), value))
+        module[name] = value
+
+
+# Read the mount table of the kernel and return every mount as a (mount point, source) pair
+def Read_Mountinfo(mountinfo):
+    mounts = []
+
+    # the file is read from the start every time, as the kernel rebuilds it on every read
+    mountinfo.seek(0)
+    for line in mountinfo.read().splitlines():
+        # the mount point is the fifth field and the source follows the separator after the optional fields,
+        # with spaces and other special characters escaped as octal
+        fields = [re.sub(r"\\([0-7]{3})", lambda match: chr(int(match.group(1), 8)), field) for field in line.split(" ")]
+        mounts.append((fields[4], fields[fields.index("-") + 2]))
+
+    return mounts
+
+
+# Find the usb device behind a block device such as /dev/sdb1, and return its usb port and serial number
+def Block_Device_Usb(source):
+    location = None
+    serial_number = None
+
+    # only block devices are backed by a usb device
+    if not source.startswith("/dev/"):
+        return location, serial_number
+
+    # walk up from the block device in sysfs until the usb device it belongs to
+    path = os.path.realpath(os.path.join("/sys/class/block", os.path.basename(source)))
+    while path != os.path.dirname(path):
+        if re.fullmatch(usb_port_pattern, os.path.basename(path)):
+            location = os.path.basename(path)
+            try:
+                with open(os.path.join(path, "serial")) as f:
+                    serial_number = f.read().strip()
+            except OSError:
+                pass
+            break
+        path = os.path.dirname(path)
+
+    return location, serial_number
+
+
+# Scan for a particular device and return its mount point if found, None if not
+def Scan_For_MassStorage(device_name):
+    if os.name == "nt":  # Windows
+        # get a list of all mounted volumes using the win32api module
+        win32api = Require("win32api", "pywin32")
+        volumes = win32api.GetLogicalDriveStrings()
+        volumes = volumes.split('\x00')[:-1]
+
+        # loop over the mounted volumes and look for a volume with the correct label
+        for volume in volumes:
+            try:
+                label = win32api.GetVolumeInformation(volume)[0]
+            except:
+                # skip this volume if there is an error accessing the label
+                continue
+
+            if label == device_name:
+                return volume
+
+    elif os.path.exists(mountinfo_path):  # Linux
+        with open(mountinfo_path) as mountinfo:
+            for mount_point, _ in Read_Mountinfo(mountinfo):
+                if device_name in mount_point:
+                    return mount_point
+
+    else:  # Other systems without the mount table of linux
+        # get all the connected devices
+        psutil = Require("psutil", "psutil")
+        for partition in psutil.disk_partitions():
+            # check if the device name is in the partition device name
+            if device_name in partition.mountpoint:
+                return partition.mountpoint
+
+    return None
+
+
+# Scan for every mounted device with a particular name, and return the mount point, usb port and serial number of each
+def Scan_For_Fleet(device_name):
+    mounts = []
+
+    if os.name != "nt" and os.path.exists(mountinfo_path):  # Linux
+        with open(mountinfo_path) as mountinfo:
+            for mount_point, source in Read_Mountinfo(mountinfo):
+                if device_name in mount_point:
+                    location, serial_number = Block_Device_Usb(source)
+                    mounts.append({"mount_point": mount_point, "location": location, "serial_number": serial_number})
+    else:
+        # without sysfs the device can not be traced back to its usb port, which is only enough for a single board
+        mount_point = Scan_For_MassStorage(device_name)
+        if mount_point:
+            mounts.append({"mount_point": mount_point, "location": None, "serial_number": None})
+
+    return mounts
+
+
+# Find the serial port of every connected device
+def Find_Devices():
+    list_ports = Require("serial.tools.list_ports", "pyserial")
+    return sorted(list_ports.grep(f"VID:PID={vendor_id}:{product_id}"), key=lambda port: port.device)
+
+
+# Read the version the firmware on the board behind a serial port reports, None if it can not be read
+def Device_Version(port):
+    # the interface strings of the usb device are only found through sysfs on linux
+    if not port.location or not os.path.isdir("/sys/bus/usb/devices"):
+        return None
+
+    device = os.path.join("/sys/bus/usb/devices", port.location.split(":")[0])
+    for interface in sorted(os.listdir(os.path.dirname(device))):
+        if not interface.startswith(os.path.basename(device) + ":"):
+            continue
+        try:
+            with open(os.path.join(os.path.dirname(device), interface, "interface")) as f:
+                text = f.read().strip()
+        except OSError:
+            continue
+        if text.startswith(version_prefix):
+            return text[len(version_prefix):]
+
+    return None
+
+
+# Check if the board already runs the version of the image
+# A dirty build is not identified by its commit, so it is never taken as the same
+def Same_Version(image_version, device_version):
+    return image_version is not None and image_version == device_version and not image_version.endswith("-dirty")
+
+
+# Send the reset message over a serial port, raises an OSError if the port can not be opened
+# The time it took to open the port and to send the message is added to the phases, if given
+def Reset_Port(port, phases=None):
+    # the serial exception is an OSError, so a port that is in use or gone raises the same error
+    serial = Require("serial", "pyserial")
+    start = time.perf_counter()
+    with serial.Serial(port, baudrate=baudrate, timeout=timeout) as ser:
+        opened = time.perf_counter()
+        # send the reset message as a byte
+        ser.write(bytes([reset_start, reset_message]))
+
+    if phases is not None:
+        phases["serial_open"] = opened - start
+        phases["reset_write"] = time.perf_counter() - opened
+
+
+# Wait for the board to show up as a serial port again after it was flashed
+# Returns the time it took, None if it did not come back within the timeout
+def Wait_For_Port(key, timeout=None):
+    timeout = mount_timeout if timeout is None else timeout
+    start = time.perf_counter()
+
+    # serial ports do not signal their arrival like mounts do, so they are checked often
+    while True:
+        if any(Board_Key(port) == key for port in Find_Devices()):
+            return time.perf_counter() - start
+        if time.perf_counter() - start >= timeout:
+            return None
+        time.sleep(scan_interval)
+
+
+# Wait until find_mount returns a mount point and return it, None if nothing was mounted within the timeout
+# On linux the wait blocks on mount events, unless events is False because the mounts are not real
+def Wait_For_Mount(find_mount, timeout=None, events=True):
+    timeout = mount_timeout if timeout is None else timeout
+    deadline = time.perf_counter() + timeout
+
+    if events and os.name != "nt" and os.path.exists(mountinfo_path):  # Linux
+        # the kernel marks the mount table with an exceptional condition whenever a mount changes,
+        # so the wait blocks until something is mounted instead of scanning the partitions over and over
+        with open(mountinfo_path) as mountinfo:
+            poller = select.poll()
+            poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+            while True:
+                mount_point = find_mount()
+                if mount_point:
+                    return mount_point
+
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                poller.poll(remaining * 1000)
+
+    # Windows and other systems do not signal mounts the same way, so check for the device often
+    while True:
+        mount_point = find_mount()
+        if mount_point:
+            return mount_point
+
+        if time.perf_counter() >= deadline:
+            return None
+        time.sleep(scan_interval)
+
+
+# Copy the uf2 file to the mounted device in chunks, and make sure it reached the device before returning
+# Returns the path of the copy, the number of bytes copied and the time it took in seconds
+def Copy_File(mount_point):
+    # create the destination file path by joining the mount point and the file name
+    destination_file_path = os.path.join(mount_point, file_name)
+    start = time.perf_counter()
+    copied = 0
+
+    with open(file_path, "rb") as source, open(destination_file_path, "wb") as destination:
+        size = os.fstat(source.fileno()).st_size
+        for chunk in iter(lambda: source.read(copy_chunk_size), b""):
+            destination.write(chunk)
+            copied += len(chunk)
+        destination.flush()
+        try:
+            os.fsync(destination.fileno())
+        except OSError as error:
+            # the board reboots as soon as it has the last block, which can take the drive away before the sync returns
+            if copied != size or error.errno not in (errno.EIO, errno.ENODEV, errno.ENOENT):
+                raise
+
+    return destination_file_path, copied, time.perf_counter() - start
+
+
+# Describe why the uf2 file could not be copied to the mounted device
+def Describe_Copy_Error(error, mount_point):
+    if isinstance(error, FileNotFoundError) and error.filename == file_path:
+        return f"The uf2 file '{file_path}' disappeared, please build the project again"
+    if isinstance(error, (FileNotFoundError, NotADirectoryError)):
+        return f"The device at '{mount_point}' was unmounted before the copy finished"
+    if isinstance(error, PermissionError):
+        return f"Not allowed to write to '{mount_point}', check that the device is mounted writable"
+    if error.errno == errno.ENOSPC:
+        return f"The device at '{mount_point}' ran out of space, the uf2 file is too large"
+    if error.errno in (errno.EIO, errno.ENODEV):
+        return f"The device at '{mount_point}' was disconnected before the copy finished"
+    return f"Could not copy the uf2 file to '{mount_point}': {error.strerror or error}"
+
+
+# Keep a copy of the uf2 file that was flashed, the next image is compared with it
+def Remember_Flashed():
+    try:
+        shutil.copyfile(file_path, flashed_file_path)
+    except OSError:
+        # the comparison is only informative, so a failed copy is not worth stopping for
+        pass
+
+
+# Check if a mount belongs to the device behind a serial port
+# The firmware and the bootloader both use the flash id as serial number, without it the usb port has to match
+def Mount_Matches(port, mount):
+    if port.serial_number and mount["serial_number"]:
+        return port.serial_number == mount["serial_number"]
+
+    # the serial port is an interface of the usb device, such as 1-1.2:1.0 of the device at 1-1.2
+    return port.location is not None and port.location.split(":")[0] == mount["location"]
+
+
+# Find the mount of the board behind a serial port among the mounts of the fleet
+def Fleet_Mount(port, scan_fleet):
+    return next((mount["mount_point"] for mount in scan_fleet(device_target) if Mount_Matches(port, mount)), None)
+
+
+# The result of a board, with the time every phase took in seconds
+def New_Result(board, mount_point=None):
+    return {
+        "board": board,
+        "mount_point": mount_point,
+        "phases": {},
+        "mount_time": 0.0,
+        "copy_time": 0.0,
+        "total_time": 0.0,
+        "copied": 0,
+        "skipped": None,
+        "error": None
+    }
+
+
+# Close the result of a board with the time since the start, and the error if it failed
+def Finish_Result(result, start, error=None):
+    result["error"] = error
+    result["total_time"] = time.perf_counter() - start
+    return result
+
+
+# Reset a board, wait for find_mount to return its mount and copy the uf2 file to it
+# Boards that are already mounted are given as a mount point instead of a port, and are copied to right away
+# Boards that already run the version of the image are skipped, unless it is None
+# With reenumerate, the time until the board is back as a serial port is measured as well
+def Flash_Board(port, mount_point, find_mount, timeout, events, image_version=None, reenumerate=False):
+    result = New_Result(port.device if port else mount_point, mount_point)
+    phases = result["phases"]
+    start = time.perf_counter()
+
+    if port and Same_Version(image_version, Device_Version(port)):
+        result["skipped"] = image_version
+        return Finish_Result(result, start)
+
+    if port:
+        try:
+            Reset_Port(port.device, phases)
+        except OSError as error:
+            return Finish_Result(result, start, f"could not open {port.device}, {error.strerror or error}")
+
+        waiting = time.perf_counter()
+        result["mount_point"] = Wait_For_Mount(find_mount, timeout, events)
+        phases["mount"] = time.perf_counter() - waiting
+        if not result["mount_point"]:
+            return Finish_Result(result, start, f"not mounted within {timeout:g} seconds")
+    result["mount_time"] = time.perf_counter() - start
+
+    try:
+        _, result["copied"], result["copy_time"] = Copy_File(result["mount_point"])
+    except OSError as error:
+        return Finish_Result(result, start, Describe_Copy_Error(error, result["mount_point"]))
+    phases["copy"] = result["copy_time"]
+
+    # the board reboots into the new firmware, and is back once its serial port is
+    if port and reenumerate:
+        back = Wait_For_Port(Board_Key(port), timeout)
+        if back is not None:
+            phases["reenumerate"] = back
+
+    return Finish_Result(result, start)
+
+
+# Flash the first board that is found, the way the programmer always has, by the label of its drive
+# A board that is already in the bootloader is copied to right away
+def Flash_Single(timeout=None, image_version=None, reenumerate=False, report=print):
+    timeout = mount_timeout if timeout is None else timeout
+    start = time.perf_counter()
+
+    mount_point = Scan_For_MassStorage(device_target)
+    if mount_point:
+        return Flash_Board(None, mount_point, None, timeout, True)
+
+    ports = Find_Devices()
+    discovered = time.perf_counter() - start
+    if not ports:
+        return Finish_Result(New_Result(None), start, "no devices found")
+    report(f"Found device at {ports[0].device}")
+
+    result = Flash_Board(ports[0], None, lambda: Scan_For_MassStorage(device_target), timeout, True, image_version, reenumerate)
+    result["phases"]["discover"] = discovered
+    result["total_time"] += discovered
+    return result
+
+
+# Flash every board at the same time, the ports are reset and every mount is copied to in parallel
+# scan_fleet defaults to Scan_For_Fleet, anything else is taken as stand-in mounts that are checked every scan_interval
+def Flash_Fleet(ports, mounted=(), timeout=None, scan_fleet=None, image_version=None, reenumerate=False):
+    timeout = mount_timeout if timeout is None else timeout
+    events = scan_fleet is None
+    scan_fleet = scan_fleet or Scan_For_Fleet
+    jobs = [(port, None) for port in ports] + [(None, mount_point) for mount_point in mounted]
+    if not jobs:
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+        futures = [
+            executor.submit(
+                Flash_Board, port, mount_point, functools.partial(Fleet_Mount, port, scan_fleet) if port else None,
+                timeout, events, image_version, reenumerate
+            )
+            for port, mount_point in jobs
+        ]
+        return [future.result() for future in futures]
+
+
+# Describe the result of a board in a few words
+def Result_Status(result):
+    if result["error"]:
+        return f"error: {result['error']}"
+    if result["skipped"]:
+        return f"skipped, already runs {result['skipped']}"
+    return result["mount_point"]
+
+
+# Print the result of every board of the fleet as a table
+def Print_Fleet_Results(results, wall_time):
+    width = max([len("Board")] + [len(result["board"]) for result in results])
+    print(f"{'Board'.ljust(width)}  {'Mount (ms)':>10}  {'Copy (ms)':>10}  {'Total (ms)':>10}  Result")
+    for result in results:
+        print(f"{result['board'].ljust(width)}  {result['mount_time'] * 1000:>10.0f}  {result['copy_time'] * 1000:>10.0f}  {result['total_time'] * 1000:>10.0f}  {Result_Status(result)}")
+
+    failed = sum(1 for result in results if result["error"])
+    skipped = sum(1 for result in results if result["skipped"])
+    print(f"\nFlashed {len(results) - failed - skipped}/{len(results)} boards in {wall_time * 1000:.0f} ms, {skipped} already up to date")
+
+
+# Import the uf2 validator, which needs numpy, once an image is checked
+def Uf2():
+    Require("numpy", "numpy")
+    return importlib.import_module("uf2")
+
+
+# Validate the uf2 file, and return its blocks, the problems found and the version of the program
+def Check_Image(path=None):
+    uf2 = Uf2()
+    blocks, trailing = uf2.Map_Blocks(path or file_path)
+    problems = uf2.Validate_Blocks(blocks, trailing)
+    return blocks, problems, uf2.Program_Version(blocks) if not problems else None
+
+
+# Compare the image with the last one that was flashed, returns the number of blocks that changed or None without one
+def Changed_Blocks(blocks):
+    if not os.path.exists(flashed_file_path):
+        return None
+
+    uf2 = Uf2()
+    diff = uf2.Diff_Blocks(blocks, uf2.Map_Blocks(flashed_file_path)[0])
+    return diff["changed"] + diff["added"]
+
+
+# The name a board is remembered by, the flash id survives the reset into the bootloader while the port name may not
+def Board_Key(port):
+    return port.serial_number or port.location or port.device
+
+
+# Keep running and flash every board that is plugged in, until stop is set
+# The serial ports, the mount table and the validated image are kept between scans, so a new board is flashed right away
+# Every board is flashed once for each build of the uf2 file, and boards that already run the version are skipped
+def Run_Daemon(stop=None, force=False, report=print, metrics_path=None, timeout=None):
+    stop = stop or threading.Event()
+    timeout = mount_timeout if timeout is None else timeout
+    # the build of the image, its version, and if it can be flashed
+    image_state = None
+    image_version = None
+    image_valid = False
+    # the ports that were handled and are still plugged in, the boards flashed with each build, and the flashes in progress
+    known_ports = set()
+    flashed = {}
+    pending = {}
+    handled_mounts = set()
+
+    # on linux the mount table wakes the daemon up as soon as a board in the bootloader is mounted
+    mountinfo = open(mountinfo_path) if os.name != "nt" and os.path.exists(mountinfo_path) else None
+    poller = None
+    if mountinfo:
+        poller = select.poll()
+        poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+
+    executor = concurrent.futures.ThreadPoolExecutor()
+    try:
+        while not stop.is_set():
+            # a new build of the uf2 file is validated once, and flashed to every board again
+            try:
+                stat = os.stat(file_path)
+                state = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                state = None
+            if state != image_state:
+                image_state = state
+                image_valid = False
+                if state is None:
+                    report(f"Waiting for the uf2 file '{file_path}'")
+                else:
+                    try:
+                        _, problems, image_version = Check_Image()
+                    except (OSError, ValueError) as error:
+                        # the file was replaced or removed while it was read, which happens during a rebuild
+                        problems, image_version = [f"could not be read ({error})"], None
+                        image_state = None
+                    image_valid = not problems
+                    report(f"The uf2 file is {'valid' if image_valid else 'not valid: ' + ', '.join(problems)}"
+                           + (f", version {image_version}" if image_version else ""))
+
+            # collect the boards that are done
+            for future in [future for future in pending if future.done()]:
+                key = pending.pop(future)
+                result = future.result()
+                # the mount of a flashed board lingers while it reboots, and must not be taken for a new board
+                if result["mount_point"]:
+                    handled_mounts.add(result["mount_point"])
+                if not result["error"]:
+                    flashed[key] = image_state
+                    if not result["skipped"]:
+                        Remember_Flashed()
+                report(f"{result['board']}: {Result_Status(result)} ({result['total_time'] * 1000:.0f} ms)")
+                if metrics_path:
+                    Write_Metrics(metrics_path, [result], image_version)
+
+            ports = {port.device: port for port in Find_Devices()}
+            new_ports = [port for device, port in ports.items() if device not in known_ports]
+            known_ports &= set(ports)
+
+            # a port is only known once it is handled, a board plugged in while the image is missing or broken
+            # is flashed as soon as the image can be
+            if image_valid:
+                busy = set(pending.values())
+                for port in new_ports:
+                    known_ports.add(port.device)
+                    key = Board_Key(port)
+                    if key in busy or flashed.get(key) == image_state:
+                        continue
+                    report(f"{port.device}: flashing")
+                    future = executor.submit(
+                        Flash_Board, port, None, functools.partial(Fleet_Mount, port, Scan_For_Fleet), timeout, True,
+                        None if force else image_version, metrics_path is not None
+                    )
+                    pending[future] = key
+
+                # boards plugged in while in the bootloader have no port, they are only copied to while nothing else is
+                # flashing, as those boards are mounted as well
+                mounts = {mount["mount_point"] for mount in Scan_For_Fleet(device_target)}
+                handled_mounts &= mounts
+                if not pending:
+                    for mount_point in sorted(mounts - handled_mounts):
+                        handled_mounts.add(mount_point)
+                        report(f"{mount_point}: flashing")
+                        future = executor.submit(Flash_Board, None, mount_point, None, timeout, True)
+                        pending[future] = mount_point
+
+            # sleep until the next scan, or until something is mounted
+            if poller:
+                poller.poll(daemon_interval * 1000)
+            stop.wait(0 if poller else daemon_interval)
+    finally:
+        executor.shutdown(wait=True)
+        if mountinfo:
+            mountinfo.close()
+
+
+# Build the metrics of a flash, as one line of the metrics file with the phases in ms
+def Metrics_Record(result, image_version):
+    return {
+        "time": round(time.time(), 3),
+        "host": platform.platform(),
+        "python": platform.python_version(),
+        "firmware": image_version,
+        "board": result["board"],
+        "status": "error" if result["error"] else "skipped" if result["skipped"] else "flashed",
+        "error": result["error"],
+        "phases": {name: round(result["phases"][name] * 1000, 3) for name in phase_names if name in result["phases"]},
+        "total": round(result["total_time"] * 1000, 3)
+    }
+
+
+# Append the metrics of every flash to a json lines file
+def Write_Metrics(path, results, image_version):
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps(Metrics_Record(result, image_version)) + "\n")
+
+
+# The value that the percentage of the sorted values are at or below, by the nearest rank
+def Percentile(values, percent):
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+# Print the percentiles of every phase in a metrics file, for each firmware version and host
+# Only the boards that were flashed count towards the percentiles, the failures and skips are counted
+def Print_Metrics_Summary(path):
+    groups = {}
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            group = groups.setdefault((record["firmware"] or "unknown", record["host"]), {"status": {}, "phases": {}})
+            group["status"][record["status"]] = group["status"].get(record["status"], 0) + 1
+            if record["status"] != "flashed":
+                continue
+            for name, value in list(record["phases"].items()) + [("total", record["total"])]:
+                group["phases"].setdefault(name, []).append(value)
+
+    for (firmware, host), group in sorted(groups.items()):
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(group["status"].items()))
+        print(f"Firmware {firmware} on {host}: {counts}")
+        print(f"  {'Phase':<12}  {'Count':>6}" + "".join(f"  {f'p{percent} (ms)':>10}" for percent in summary_percentiles) + f"  {'Max (ms)':>10}")
+        for name in phase_names + ["total"]:
+            values = sorted(group["phases"].get(name, []))
+            if not values:
+                continue
+            print(f"  {name:<12}  {len(values):>6}" + "".join(f"  {Percentile(values, percent):>10.1f}" for percent in summary_percentiles) + f"  {values[-1]:>10.1f}")
@@ -1,180 +1,187 @@
-# the file name, its location and the target device name
-file_name = "Firmware.uf2"
-file_path = "../build/" + file_name
-device_target = "RPI-RP2"
-# the vendor id of the device
-vendor_id = "2E8A"
-product_id = "000A"
-# baudrate
-baudrate = 9600
-timeout = 1
-# reset message
-reset_start = 0x01
-reset_message = 0x06
+# Reset the driver board into its bootloader and copy the firmware to it
+# The work is done by flasher.py, which is only imported once the arguments are parsed, so --help starts right away
 
 
 # Thanks https://github.com/diminDDL for assisting in development and testing on Linux
 
 
-import shutil
 import os
 import sys
-import subprocess
 import time
-
-
-# Fix the path so that the script can be run from any directory
-file_path = os.path.abspath(file_path)
-
-# check if the 'pyserial' module is installed and install it if not
-try:
-    import serial
-    import serial.tools.list_ports
-except ImportError:
-    print("The 'pyserial' module is not installed. Installing now...")
-    subprocess.call([sys.executable, "-m", "pip", "install", "pyserial"])
-    import serial
-    import serial.tools.list_ports
-
-# check if the 'psutil' module is installed and install it if not
-try:
-    import psutil
-except ImportError:
-    print("The 'psutil' module is not installed. Installing now...")
-    subprocess.call([sys.executable, "-m", "pip", "install", "psutil"])
-    import psutil
-
-# if the operating system is windows, check if the 'pywin32' module is installed and install it if not
-if os.name == "nt":
-    # check if the 'pywin32' module is installed and install it if not
-    try:
-        import win32api
-    except ImportError:
-        print("The 'pywin32' module is not installed. Installing now...")
-        subprocess.call([sys.executable, "-m", "pip", "install", "pywin32"])
-        import win32api
-
-
-# Scan for a particular device and return true if found
-def Scan_For_MassStorage(device_name):
-    if os.name == "nt":  # Windows
-        # get a list of all mounted volumes using the win32api module
-        volumes = win32api.GetLogicalDriveStrings()
-        volumes = volumes.split('\x00')[:-1]
-
-        # loop over the mounted volumes and look for a volume with the correct label
-        for volume in volumes:
-            try:
-                label = win32api.GetVolumeInformation(volume)[0]
-            except:
-                # skip this volume if there is an error accessing the label
-                continue
-
-            if label == device_name:
-                return True
-            
-    else:  # Linux
-        # get all the connected devices
-        for partition in psutil.disk_partitions():
-            # check if the device name is in the partition device name
-            if device_name in partition.mountpoint:
-                return True
-            
-        return False
-
-
-# Reset the device by sending a specific message over the serial port
-def Reset_Device():
-    # get all the connected devices
-    ports = list(serial.tools.list_ports.grep(f"VID:PID={vendor_id}:{product_id}"))
-    # if there are no connected devices, exit
-    if not ports:
-        print("No devices found")
-        exit()
-    else:
-        # connect to the first device in the list
-        port = ports[0].device
-        print(f"Found device at {port}")
-        # connect to the port
+import argparse
+
+
+# the config file that is read when no other is given, if it exists
+default_config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "programmer.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="programmer",
+        description="Reset the driver board into its bootloader and copy the firmware to it."
+    )
+
+    parser.add_argument(
+        "--fleet",
+        action="store_true",
+        help="Flash every connected board at the same time, and print the result of each.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, and flash every board as soon as it is plugged in. Stop with Ctrl+C.",
+        required=False,
+        default=False
+    )
+
+    parser.add_argument(
+        "--config",
+        type=str,
+        help="A json file with the settings of flasher.py to change, such as the file_path or the mount_timeout. "
+             "Defaults to programmer.json next to this script, if it exists.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        help="How long to wait for a board to be mounted after the reset, in seconds. Defaults to the mount_timeout setting.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--metrics",
+        type=str,
+        help="Append the time of every phase of each flash to this json lines file, "
+             "including the time until the board is back as a serial port.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--summary",
+        type=str,
+        help="Print the percentiles of every phase in a metrics file, for each firmware version and host, and exit.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Flash the boards even if they already run the version of the uf2 file.",
+        required=False,
+        default=False
+    )
+
+    args = parser.parse_args()
+
+    import flasher
+
+    if args.summary:
         try:
-            ser = serial.Serial(port, baudrate=baudrate, timeout=timeout)
-        except:
-            print(f"Could not connect to the device at {port}, please disconnect any program that is using the device and try again")
-            exit()
-
-        # send the reset message as a byte
-        ser.write(bytes([reset_start, reset_message]))
-        # close the connection
-        ser.close()
-
-
-# Wait for the device to be mounted
-def Wait_For_MassStorage_Device():
-    print("Waiting for the device to be mounted...")
-    while(True):
-        # check if the device is mounted
-        if Scan_For_MassStorage(device_target):
-            break
-        else:
-            time.sleep(0.5)
-
-
-# Transfer the uf2 file to the mounted device
-def Transfer_File():
-    # i am too lazy to write a proper check if this works or not so we just wrap it in a try except block
-    try:
-        # check the operating system and create the destination file path accordingly
-        if os.name == "nt":  # Windows
-            # get a list of all mounted volumes using the win32api module
-            volumes = win32api.GetLogicalDriveStrings()
-            volumes = volumes.split('\x00')[:-1]
-
-            # loop over the mounted volumes and look for a volume with the correct label
-            destination_found = False
-            for volume in volumes:
-                try:
-                    label = win32api.GetVolumeInformation(volume)[0]
-                except:
-                    # skip this volume if there is an error accessing the label
-                    continue
-
-                if label == device_target:
-                    # create the destination file path by joining the volume and the file name
-                    destination_file_path = os.path.join(volume, file_name)
-                    destination_found = True
-                    shutil.copy2(file_path, destination_file_path)
-                    output = f"The uf2 has been copied to '{destination_file_path}'"
-                    print(output)
-
-            if not destination_found:
-                output = f"Could not find a volume with the label '{device_target}'"
-                print(output)
-                exit()
-
-        else:  # Linux
-            # create the destination file path by joining the mount point and the file name
-            destination_file_path = os.path.join("/media/", os.getlogin(), device_target, file_name)
-            shutil.copy2(file_path, destination_file_path)
-            output = f"The uf2 has been copied to '{destination_file_path}'"
-            print(output)
-    except:
-        print("Something went wrong, please try again")
+            flasher.Print_Metrics_Summary(args.summary)
+        except (OSError, ValueError, KeyError) as error:
+            print(f"Could not read the metrics file '{args.summary}': {error}")
+            sys.exit(1)
+        return
+
+    config_path = args.config or (default_config_path if os.path.exists(default_config_path) else None)
+    if config_path:
+        try:
+            flasher.Load_Config(config_path)
+        except (OSError, ValueError) as error:
+            print(f"Could not read the config file '{config_path}': {error}")
+            sys.exit(1)
+    timeout = flasher.mount_timeout if args.timeout is None else args.timeout
+
+    if args.daemon:
+        print(f"Watching for boards, flashing '{flasher.file_path}'. Press Ctrl+C to stop.")
+        try:
+            flasher.Run_Daemon(force=args.force, metrics_path=args.metrics, timeout=timeout)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Check if the uf2 file exists
+    if not os.path.exists(flasher.file_path):
+        print(f"The uf2 file '{flasher.file_path}' does not exist, please build the project first")
         exit()
 
-
-# Check if the uf2 file exists
-if not os.path.exists(file_path):
-    print(f"The uf2 file '{file_path}' does not exist, please build the project first")
-    exit()
-
-# Check if the mount point exists
-if Scan_For_MassStorage(device_target):
-    # Transfer the uf2 file to the mounted device
-    Transfer_File()
-else:
-    # Reset the device
-    Reset_Device()
-    # Wait for the device to be mounted
-    Wait_For_MassStorage_Device()
-    # Transfer the uf2 file to the mounted device
-    Transfer_File()
+    # Validate the uf2 file before anything is reset, a broken image would only be found after the board is mounted
+    flasher.Uf2()
+    start = time.perf_counter()
+    blocks, problems, image_version = flasher.Check_Image()
+    if problems:
+        print(f"The uf2 file '{flasher.file_path}' is not valid:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print(f"The uf2 file is valid, {blocks.size} blocks checked in {(time.perf_counter() - start) * 1000:.1f} ms"
+          + (f", version {image_version}" if image_version else ""))
+
+    # Show how much of the image changed since the last flash
+    changed = flasher.Changed_Blocks(blocks)
+    if changed is not None:
+        print(f"Compared with the last flashed image, {changed} of {blocks.size} blocks changed")
+
+    # The version of the uf2 file decides if a board needs to be flashed at all
+    skip_version = None if args.force else image_version
+
+    if args.fleet:
+        # Boards that are already in the bootloader have no serial port, and are copied to right away
+        start = time.perf_counter()
+        ports = flasher.Find_Devices()
+        mounted = [mount["mount_point"] for mount in flasher.Scan_For_Fleet(flasher.device_target)]
+        discovered = time.perf_counter() - start
+        if not ports and not mounted:
+            print("No devices found")
+            exit()
+        print(f"Flashing {len(ports) + len(mounted)} boards...")
+
+        results = flasher.Flash_Fleet(ports, mounted, timeout, image_version=skip_version, reenumerate=args.metrics is not None)
+        for result in results:
+            result["phases"]["discover"] = discovered
+        flasher.Print_Fleet_Results(results, time.perf_counter() - start)
+        if args.metrics:
+            flasher.Write_Metrics(args.metrics, results, image_version)
+        if any(not result["error"] and not result["skipped"] for result in results):
+            flasher.Remember_Flashed()
+        if any(result["error"] for result in results):
+            sys.exit(1)
+        return
+
+    result = flasher.Flash_Single(timeout, skip_version, args.metrics is not None)
+    if args.metrics:
+        flasher.Write_Metrics(args.metrics, [result], image_version)
+
+    if result["error"]:
+        print(f"Could not flash the device: {result['error']}")
+        sys.exit(1)
+    if result["skipped"]:
+        print(f"The device at {result['board']} already runs {result['skipped']}, use --force to flash it anyway")
+        return
+
+    copied = result["copied"]
+    print(f"The uf2 has been copied to '{os.path.join(result['mount_point'], flasher.file_name)}' "
+          f"({copied / 1e6:.2f} MB in {result['copy_time'] * 1000:.0f} ms, {copied / 1e6 / max(result['copy_time'], 1e-9):.2f} MB/s)")
+    flasher.Remember_Flashed()
+
+    # Report how long each phase took, from finding the device to its return as a serial port
+    phases = result["phases"]
+    print("Timeline: " + ", ".join(f"{name.replace('_', ' ')} {phases[name] * 1000:.0f} ms" for name in flasher.phase_names if name in phases)
+          + f", {result['total_time'] * 1000:.0f} ms in total")
+
+
+if __name__ == "__main__":
+    # a module that is needed is missing, the error names the package to install
+    try:
+        main()
+    except ImportError as error:
+        print(error)
+        sys.exit(1)
@@ -0,0 +1,153 @@
+# Drive the fleet flow of flasher.py without any hardware
+# Every board is a pty that stands in for its serial port, and a temporary folder that stands in for its drive
+
+
+import os
+import pty
+import time
+import types
+import select
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import flasher
+
+
+# A board that answers the reset message by mounting its drive, like the bootloader of the RP2040 does
+class Fake_Board:
+    def __init__(self, folder, name, mounts, responds=True):
+        self.master, self.slave = pty.openpty()
+        self.port = types.SimpleNamespace(device=os.ttyname(self.slave), serial_number=name, location=None)
+        self.mount_point = os.path.join(folder, name, flasher.device_target)
+        self.mounts = mounts
+        self.responds = responds
+        self.received = b""
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+
+    def Run(self):
+        while not self.stop.is_set():
+            if not select.select([self.master], [], [], 0.01)[0]:
+                continue
+            self.received += os.read(self.master, 64)
+            if self.responds and self.received.endswith(bytes([flasher.reset_start, flasher.reset_message])):
+                os.makedirs(self.mount_point)
+                self.mounts.append({"mount_point": self.mount_point, "location": None, "serial_number": self.port.serial_number})
+                self.responds = False
+
+    def Close(self):
+        self.stop.set()
+        self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class Test_Fleet(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.addCleanup(self.folder.cleanup)
+        self.mounts = []
+        self.boards = []
+
+        # the image that is copied to every board
+        self.image = os.urandom(3 * flasher.copy_chunk_size + 100)
+        image_path = os.path.join(self.folder.name, flasher.file_name)
+        with open(image_path, "wb") as f:
+            f.write(self.image)
+        for name, value in (("file_path", image_path), ("scan_interval", 0.01)):
+            patcher = mock.patch.object(flasher, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        for board in self.boards:
+            board.Close()
+
+    def Board(self, name, responds=True):
+        board = Fake_Board(self.folder.name, name, self.mounts, responds)
+        self.boards.append(board)
+        return board
+
+    def Flash(self, ports, mounted=(), timeout=2):
+        return flasher.Flash_Fleet(ports, mounted, timeout, scan_fleet=lambda device_name: list(self.mounts))
+
+    def Copied(self, mount_point):
+        with open(os.path.join(mount_point, flasher.file_name), "rb") as f:
+            return f.read()
+
+    def test_success(self):
+        boards = [self.Board(f"board{idx}") for idx in range(3)]
+        # a board that is already in the bootloader is copied to right away
+        mounted = os.path.join(self.folder.name, "mounted")
+        os.makedirs(mounted)
+
+        results = self.Flash([board.port for board in boards], [mounted])
+
+        self.assertEqual([result["error"] for result in results], [None] * 4)
+        for board, result in zip(boards, results):
+            self.assertEqual(board.received, bytes([flasher.reset_start, flasher.reset_message]))
+            self.assertEqual(result["mount_point"], board.mount_point)
+            self.assertEqual(result["copied"], len(self.image))
+            self.assertIn("mount", result["phases"])
+        for mount_point in [board.mount_point for board in boards] + [mounted]:
+            self.assertEqual(self.Copied(mount_point), self.image)
+
+    def test_timeout(self):
+        board = self.Board("silent", responds=False)
+
+        start = time.perf_counter()
+        results = self.Flash([board.port], timeout=0.2)
+
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(results[0]["error"], "not mounted within 0.2 seconds")
+        self.assertIsNone(results[0]["mount_point"])
+        # the reset was still sent
+        self.assertEqual(board.received, bytes([flasher.reset_start, flasher.reset_message]))
+
+    def test_failures_stay_with_their_board(self):
+        good = self.Board("good")
+        gone = types.SimpleNamespace(device=os.path.join(self.folder.name, "ttyGone"), serial_number="gone", location=None)
+        unmounted = os.path.join(self.folder.name, "unmounted")
+
+        results = self.Flash([good.port, gone], [unmounted])
+
+        self.assertIsNone(results[0]["error"])
+        self.assertEqual(self.Copied(good.mount_point), self.image)
+        self.assertTrue(results[1]["error"].startswith(f"could not open {gone.device}"))
+        self.assertEqual(results[2]["error"], f"The device at '{unmounted}' was unmounted before the copy finished")
+
+    def test_daemon_survives_a_rebuild(self):
+        # the uf2 file is replaced while it is read, the daemon checks it again on the next scan
+        checks = []
+        def check_image(path=None):
+            checks.append(path)
+            if len(checks) == 1:
+                raise ValueError("mmap length is greater than file size")
+            return None, [], None
+
+        reports = []
+        stop = threading.Event()
+        def report(message):
+            reports.append(message)
+            if message == "The uf2 file is valid":
+                stop.set()
+
+        patches = (("Check_Image", check_image), ("Find_Devices", lambda: []), ("Scan_For_Fleet", lambda device_name: []), ("daemon_interval", 0.01))
+        for name, value in patches:
+            patcher = mock.patch.object(flasher, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        daemon = threading.Thread(target=flasher.Run_Daemon, kwargs={"stop": stop, "report": report}, daemon=True)
+        daemon.start()
+        daemon.join(2)
+
+        self.assertFalse(daemon.is_alive())
+        self.assertEqual(reports, ["The uf2 file is not valid: could not be read (mmap length is greater than file size)", "The uf2 file is valid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+# Check the uf2 validator, the diff and the version parsing with crafted blocks
+
+
+import os
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+import uf2
+
+
+flash_start = uf2.target_ranges[0][0]
+sram_start = uf2.target_ranges[1][0]
+
+
+# An image that holds the binary info of the pico sdk with the version, right after the second stage bootloader
+def Program(version=b"1.2.3"):
+    image = bytearray(1024)
+    # the header points to a single pointer, to an entry that points to the version string
+    pointers = flash_start + 0x200
+    entry = flash_start + 0x210
+    string = flash_start + 0x220
+    struct.pack_into("<5I", image, 0x100, uf2.binary_info_marker_start, pointers, pointers + 4, 0, uf2.binary_info_marker_end)
+    struct.pack_into("<I", image, 0x200, entry)
+    struct.pack_into("<HHII", image, 0x210, uf2.binary_info_type_id_and_string, 0, uf2.binary_info_id_program_version, string)
+    image[0x220:0x220 + len(version)] = version
+    return bytes(image)
+
+
+# Split an image into the blocks of a uf2 file, starting at the address
+def Blocks(image, address=flash_start):
+    count = -(-len(image) // uf2.payload_size)
+    blocks = np.zeros(count, dtype=uf2.block_dtype)
+    blocks["magic_start0"] = uf2.magic_start0
+    blocks["magic_start1"] = uf2.magic_start1
+    blocks["magic_end"] = uf2.magic_end
+    blocks["flags"] = uf2.flag_family_id_present
+    blocks["family_id"] = uf2.rp2040_family_id
+    blocks["payload_size"] = uf2.payload_size
+    blocks["block_no"] = np.arange(count)
+    blocks["num_blocks"] = count
+    blocks["target_addr"] = address + np.arange(count) * uf2.payload_size
+    for idx in range(count):
+        payload = image[idx * uf2.payload_size:(idx + 1) * uf2.payload_size]
+        blocks["data"][idx, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+    return blocks
+
+
+# Number the blocks through the file again, after blocks were joined
+def Renumber(blocks):
+    blocks["block_no"] = np.arange(blocks.size)
+    blocks["num_blocks"] = blocks.size
+    return blocks
+
+
+class Test_Validate(unittest.TestCase):
+    def test_valid(self):
+        blocks = Blocks(Program())
+        self.assertEqual(uf2.Validate_Blocks(blocks), [])
+        self.assertEqual(uf2.Program_Version(blocks), "1.2.3")
+
+    def test_bad_magic(self):
+        blocks = Blocks(Program())
+        blocks["magic_end"][2] = 0
+        self.assertEqual(uf2.Validate_Blocks(blocks), ["wrong magic number in 1 block, first at block 2"])
+
+    def test_wrong_family(self):
+        blocks = Blocks(Program())
+        blocks["family_id"] = 0x12345678
+        self.assertEqual(uf2.Validate_Blocks(blocks), [f"family other than 0x{uf2.rp2040_family_id:08x} in 4 blocks, first at block 0"])
+
+    def test_out_of_sequence(self):
+        blocks = Blocks(Program())
+        blocks["block_no"][[1, 2]] = [2, 1]
+        self.assertEqual(uf2.Validate_Blocks(blocks), ["block number out of sequence in 2 blocks, first at block 1"])
+
+    def test_truncated_tail(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "image.uf2")
+            with open(path, "wb") as f:
+                f.write(Blocks(Program()).tobytes() + bytes(100))
+
+            blocks, trailing = uf2.Map_Blocks(path)
+            self.assertEqual((blocks.size, trailing), (4, 100))
+            self.assertEqual(uf2.Validate_Blocks(blocks, trailing), ["the file ends with 100 bytes of a truncated block"])
+            del blocks
+
+    def test_no_blocks(self):
+        self.assertEqual(uf2.Validate_Blocks(Blocks(b"")), ["the file holds no blocks"])
+
+
+class Test_Version(unittest.TestCase):
+    def test_flash_and_sram(self):
+        # the blocks for the sram do not stretch the image over the addresses between the flash and the sram
+        blocks = Renumber(np.concatenate([Blocks(Program()), Blocks(bytes(512), sram_start)]))
+        self.assertEqual(uf2.Validate_Blocks(blocks), [])
+
+        image, base = uf2.Image_Bytes(blocks)
+        self.assertEqual((len(image), base), (1024, flash_start))
+        self.assertEqual(uf2.Program_Version(blocks), "1.2.3")
+
+    def test_sram_only(self):
+        self.assertEqual(uf2.Image_Bytes(Blocks(bytes(512), sram_start))[1], sram_start)
+
+    def test_marker_at_the_end(self):
+        # the header is cut off by the end of the image
+        image = bytearray(uf2.payload_size)
+        struct.pack_into("<I", image, uf2.payload_size - 8, uf2.binary_info_marker_start)
+        self.assertIsNone(uf2.Program_Version(Blocks(bytes(image))))
+
+    def test_no_binary_info(self):
+        self.assertIsNone(uf2.Program_Version(Blocks(bytes(1024))))
+
+
+class Test_Diff(unittest.TestCase):
+    def test_diff(self):
+        previous = Blocks(Program(b"1.0.0"))
+        image = bytearray(Program(b"1.0.1"))
+        image += bytes(uf2.payload_size)
+        blocks = Blocks(bytes(image))
+
+        self.assertEqual(uf2.Diff_Blocks(blocks, previous), {"changed": 1, "added": 1, "removed": 0, "same": 3})
+        self.assertEqual(uf2.Diff_Blocks(previous, blocks), {"changed": 1, "added": 0, "removed": 1, "same": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,245 @@
+# Inspect and validate uf2 files before they are copied to the RP2040
+# The file is memory mapped and every block is checked at once through a NumPy view, so even large images take milliseconds
+
+
+import os
+import sys
+import mmap
+import time
+import struct
+import argparse
+
+import numpy as np
+
+
+# the magic numbers at the start and the end of every block
+magic_start0 = 0x0A324655
+magic_start1 = 0x9E5D5157
+magic_end = 0x0AB16F30
+# the block is not meant for the main flash and is skipped by the bootloader
+flag_not_main_flash = 0x00000001
+# the family id field holds the family of the target, instead of the size of the file
+flag_family_id_present = 0x00002000
+# the family id of the RP2040
+rp2040_family_id = 0xE48BFF56
+# every block is 512 bytes, holding 256 bytes of the image
+block_size = 512
+payload_size = 256
+# the regions of the RP2040 an image can be written to, the flash and the sram
+target_ranges = [(0x10000000, 0x11000000), (0x20000000, 0x20042000)]
+# the binary info of the pico sdk, which holds the version of the image
+binary_info_marker_start = 0x7188EBF2
+binary_info_marker_end = 0xE71AA390
+binary_info_type_id_and_string = 6
+binary_info_id_program_version = 0x11A9BC3A
+
+# the layout of a block, read straight from the mapped file
+block_dtype = np.dtype([
+    ("magic_start0", "<u4"),
+    ("magic_start1", "<u4"),
+    ("flags", "<u4"),
+    ("target_addr", "<u4"),
+    ("payload_size", "<u4"),
+    ("block_no", "<u4"),
+    ("num_blocks", "<u4"),
+    ("family_id", "<u4"),
+    ("data", "u1", (476,)),
+    ("magic_end", "<u4")
+])
+
+
+# Memory map a uf2 file and view it as an array of blocks
+# Returns the blocks and the number of bytes after the last whole block, which is 0 for a complete file
+def Map_Blocks(path):
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        # an empty file can not be mapped
+        if size < block_size:
+            return np.zeros(0, dtype=block_dtype), size
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    # the array keeps the mapping open for as long as it is used
+    return np.frombuffer(mapped, dtype=block_dtype, count=size // block_size), size % block_size
+
+
+# Describe the blocks that fail a check, with the first one that does
+def Describe(mask, message):
+    indices = np.flatnonzero(mask)
+    if indices.size == 0:
+        return None
+    return f"{message} in {indices.size} block{'s' if indices.size != 1 else ''}, first at block {indices[0]}"
+
+
+# Check every block of the image, and return a list of the problems found, which is empty for a valid image
+def Validate_Blocks(blocks, trailing=0, family_id=rp2040_family_id):
+    problems = []
+
+    if blocks.size == 0:
+        return ["the file holds no blocks"]
+    if trailing:
+        problems.append(f"the file ends with {trailing} bytes of a truncated block")
+
+    problems.append(Describe(
+        (blocks["magic_start0"] != magic_start0) | (blocks["magic_start1"] != magic_start1) | (blocks["magic_end"] != magic_end),
+        "wrong magic number"
+    ))
+    # the blocks are numbered through the whole file, a missing or reordered block breaks the sequence
+    problems.append(Describe(blocks["num_blocks"] != blocks.size, f"block count other than {blocks.size}"))
+    problems.append(Describe(blocks["block_no"] != np.arange(blocks.size), "block number out of sequence"))
+
+    # the blocks that are not for the main flash are skipped by the bootloader, and are not checked any further
+    main = blocks[(blocks["flags"] & flag_not_main_flash) == 0]
+    if main.size == 0:
+        return [problem for problem in problems + ["the file holds no blocks for the main flash"] if problem]
+
+    problems.append(Describe(
+        ((main["flags"] & flag_family_id_present) == 0) | (main["family_id"] != family_id),
+        f"family other than 0x{family_id:08x}"
+    ))
+    problems.append(Describe(main["payload_size"] != payload_size, f"payload size other than {payload_size}"))
+
+    # every block must land within a region of the chip, on a payload boundary, and only once
+    addresses = main["target_addr"].astype(np.int64)
+    inside = np.zeros(main.size, dtype=bool)
+    for start, end in target_ranges:
+        inside |= (addresses >= start) & (addresses + main["payload_size"] <= end)
+    problems.append(Describe(~inside, "target address outside the flash and sram"))
+    problems.append(Describe(addresses % payload_size != 0, f"target address not a multiple of {payload_size}"))
+    _, first = np.unique(addresses, return_index=True)
+    duplicate = np.ones(main.size, dtype=bool)
+    duplicate[first] = False
+    problems.append(Describe(duplicate, "target address written by an earlier block"))
+
+    return [problem for problem in problems if problem]
+
+
+# Compare the image with a previously flashed one, block by block on their target addresses
+# Returns the number of blocks that changed, were added, were removed and were left the same
+def Diff_Blocks(blocks, previous):
+    addresses = blocks["target_addr"]
+    previous_addresses = previous["target_addr"]
+    _, new_index, old_index = np.intersect1d(addresses, previous_addresses, return_indices=True)
+
+    changed = np.any(blocks["data"][new_index, :payload_size] != previous["data"][old_index, :payload_size], axis=1)
+
+    return {
+        "changed": int(np.count_nonzero(changed)),
+        "added": int(addresses.size - new_index.size),
+        "removed": int(previous_addresses.size - old_index.size),
+        "same": int(changed.size - np.count_nonzero(changed))
+    }
+
+
+# Put the payload of every block back at its address, returns the image and the address it starts at
+# Only the blocks in the flash are put together, or in the sram for an image that is not written to the flash,
+# so an image that writes to both does not span the addresses between them
+def Image_Bytes(blocks):
+    main = blocks[(blocks["flags"] & flag_not_main_flash) == 0]
+    addresses = main["target_addr"].astype(np.int64)
+    for start, end in target_ranges:
+        inside = (addresses >= start) & (addresses + payload_size <= end)
+        if inside.any():
+            break
+    else:
+        return b"", 0
+    main, addresses = main[inside], addresses[inside]
+
+    base = int(addresses.min())
+    image = np.zeros(int(addresses.max()) - base + payload_size, dtype=np.uint8)
+    offsets = (addresses - base)[:, None] + np.arange(payload_size)
+    image[offsets] = main["data"][:, :payload_size]
+
+    return image.tobytes(), base
+
+
+# Read the version of the program from the binary info of the image, None if it has none
+def Program_Version(blocks):
+    image, base = Image_Bytes(blocks)
+
+    def Read(address, size):
+        offset = address - base
+        return image[offset:offset + size] if offset >= 0 else b""
+
+    # the header of the binary info is near the start of the image, right after the second stage bootloader
+    header = image.find(struct.pack("<I", binary_info_marker_start), 0, 1024)
+    if header < 0 or header + 20 > len(image):
+        return None
+    start, end, _, marker = struct.unpack_from("<4I", image, header + 4)
+    if marker != binary_info_marker_end:
+        return None
+
+    # the header points to a list of pointers, each to an entry with a type, a tag and the value
+    for pointer in range(start, end, 4):
+        entry = Read(pointer, 4)
+        fields = Read(struct.unpack("<I", entry)[0], 12) if len(entry) == 4 else b""
+        if len(fields) != 12:
+            continue
+        entry_type, _, entry_id, value = struct.unpack("<HHII", fields)
+        if entry_type == binary_info_type_id_and_string and entry_id == binary_info_id_program_version:
+            return Read(value, 64).split(b"\0")[0].decode("ascii", "replace")
+
+    return None
+
+
+# Validate the uf2 file, and return the problems found and the version of the program
+def Validate_File(path, family_id=rp2040_family_id):
+    blocks, trailing = Map_Blocks(path)
+    problems = Validate_Blocks(blocks, trailing, family_id)
+    version = Program_Version(blocks) if not problems else None
+    return problems, version
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="uf2",
+        description="Validate a uf2 file for the RP2040, and compare it with a previously flashed one."
+    )
+
+    parser.add_argument("file", type=str, help="The uf2 file to validate.")
+
+    parser.add_argument(
+        "-d",
+        "--diff",
+        type=str,
+        help="A previously flashed uf2 file to compare the blocks with.",
+        required=False,
+        default=None
+    )
+
+    parser.add_argument(
+        "--family",
+        type=lambda text: int(text, 0),
+        help=f"The family id the blocks must have. Defaults to 0x{rp2040_family_id:08x}, the RP2040.",
+        required=False,
+        default=rp2040_family_id
+    )
+
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    try:
+        blocks, trailing = Map_Blocks(args.file)
+    except OSError as error:
+        print(f"Could not open '{args.file}': {error.strerror}")
+        sys.exit(1)
+    problems = Validate_Blocks(blocks, trailing, args.family)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.file}: {blocks.size} blocks, {blocks.size * payload_size / 1024:.1f} KiB of image, validated in {elapsed * 1000:.2f} ms")
+    for problem in problems:
+        print(f"  {problem}")
+    if problems:
+        sys.exit(1)
+
+    version = Program_Version(blocks)
+    if version:
+        print(f"  version {version}")
+
+    if args.diff:
+        previous, _ = Map_Blocks(args.diff)
+        diff = Diff_Blocks(blocks, previous)
+        print(f"  compared with {args.diff}: {diff['changed']} changed, {diff['added']} added, {diff['removed']} removed, {diff['same']} the same")
+
+
+if __name__ == "__main__":
+    main()
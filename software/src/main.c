@@ -16,7 +16,7 @@
 // Declare the binary info
 bi_decl(bi_program_description("Touchscreen HID"));
 bi_decl(bi_1pin_with_name(LED_PIN, "On-board LED"));
-bi_decl(bi_program_version_string(GIT_COMMIT_HASH));
+bi_decl(bi_program_version_string(FIRMWARE_VERSION));
 bi_decl(bi_program_build_date_string(GIT_COMMIT_DATE));
 bi_decl(bi_program_url("https://github.com/Cuprum77/LCD_Driver"));
 bi_decl(bi_4pins_with_names(TOUCH_I2C_SDA, "I2C SDA", TOUCH_I2C_SCL, "I2C SCL", TOUCH_I2C_RST, "I2C RST", TOUCH_I2C_INT, "I2C INT"));
@@ -27,6 +27,7 @@
 #include "tusb.h"
 #include "usb_descriptors.h"
 #include "usb_touch.h"
+#include "version.h"
 
 /* A combination of interfaces must have a unique product id, since PC will save device driver after the first plug.
  * Same VID/PID with different interface e.g MSC (first), then CDC (later) will possibly cause system error on PC.
@@ -106,7 +107,8 @@ uint8_t const desc_configuration[] =
   TUD_CONFIG_DESCRIPTOR(1, ITF_NUM_TOTAL, 0, CONFIG_TOTAL_LEN, TUSB_DESC_CONFIG_ATT_REMOTE_WAKEUP, 100),
 
   // Interface number, string index, protocol, report descriptor len, EP In address, size & polling interval
-  TUD_HID_DESCRIPTOR(ITF_NUM_HID, 0, HID_ITF_PROTOCOL_NONE, sizeof(desc_hid_report), EPNUM_HID, CFG_TUD_HID_EP_BUFSIZE, 5)
+  // The interface string holds the firmware version, so the programmer can skip boards that already run it
+  TUD_HID_DESCRIPTOR(ITF_NUM_HID, 4, HID_ITF_PROTOCOL_NONE, sizeof(desc_hid_report), EPNUM_HID, CFG_TUD_HID_EP_BUFSIZE, 5)
 };
 
 #if TUD_OPT_HIGH_SPEED
@@ -182,6 +184,7 @@ char const* string_desc_arr [] =
   "Lockmart Special",  // 1: Manufacturer
   "Touchscreen Interface", // 2: Product
   serial, // 3: Serials, uses the flash ID
+  "Firmware " FIRMWARE_VERSION, // 4: HID interface, the firmware version
 };
 
 static uint16_t _desc_str[32];
@@ -48,6 +48,7 @@ architecture rtl of sequencer is
     wait_init_state,
     wait_calculate_state,
     wait_state,
+    packed_data_state,
     start_transmission_state,
     end_transmission_state,
     give_spi_time_1_state,
@@ -117,6 +118,11 @@ architecture rtl of sequencer is
   -- setup the internal signals that handle the wait counter
   signal wait_count : integer := 0;
 
+  -- setup the internal signals that handle the packed and repeated data
+  signal packed_data   : std_logic_vector(31 downto 0) := (others => '0');
+  signal packed_count  : integer range 0 to 2**24 := 0;
+  signal repeat_data   : std_logic := '0';
+
   -- setup the internal signals that handle the resetter
   signal rst_rst        : std_logic := '0';
   signal rst_done_temp  : std_logic := '0';
@@ -188,6 +194,10 @@ begin
          -- Reset the error signal
         sequencer_error <= '0';
         done <= '0';
+        -- Drop any packed or repeated data that was being sent
+        packed_data <= (others => '0');
+        packed_count <= 0;
+        repeat_data <= '0';
       else
         case sequencer_state is
           -- Set up the state machine, this is also the reset state
@@ -230,6 +240,22 @@ begin
               -- Wait data
               when x"30" =>
                 sequencer_state <= wait_init_state;
+              -- Wait data, already counted in clock cycles
+              when x"31" =>
+                wait_count <= to_integer(unsigned(rom_data));
+                sequencer_state <= wait_state;
+              -- Packed data, 2 to 4 bytes sent from the most significant byte
+              when x"22" | x"23" | x"24" =>
+                packed_data <= rom_data;
+                packed_count <= to_integer(unsigned(rom_instruction(2 downto 0)));
+                repeat_data <= '0';
+                sequencer_state <= packed_data_state;
+              -- Repeated data, the lowest byte is sent as many times as the upper 24 bits say
+              when x"28" =>
+                packed_data <= rom_data(7 downto 0) & x"000000";
+                packed_count <= to_integer(unsigned(rom_data(31 downto 8)));
+                repeat_data <= '1';
+                sequencer_state <= packed_data_state;
               -- If the instruction is not recognized, set the error signal
               when others =>
                 sequencer_state <= error_state;
@@ -277,6 +303,18 @@ begin
               wait_count <= wait_count - 1;
             end if;
 
+          -- Send the next byte of the packed or repeated data
+          when packed_data_state =>
+            spi_width <= "000"; -- 8 bit width
+            spi_set_dc <= not command_dc_bit; -- Set the DC signal
+            spi_data <= x"000000" & packed_data(31 downto 24); -- Set the data
+            -- Shift the next byte in place, unless the same byte is repeated
+            if repeat_data = '0' then
+              packed_data <= packed_data(23 downto 0) & x"00";
+            end if;
+            packed_count <= packed_count - 1;
+            sequencer_state <= start_transmission_state;
+
           -- Start the SPI transmission
           when start_transmission_state =>
             spi_send <= '1';
@@ -298,7 +336,12 @@ begin
           -- Wait for the SPI to finish
           when wait_for_spi_state =>
             if spi_done = '1' then
-              sequencer_state <= verify_pointer_state;
+              -- Keep sending until the packed or repeated data is done
+              if packed_count > 0 then
+                sequencer_state <= packed_data_state;
+              else
+                sequencer_state <= verify_pointer_state;
+              end if;
             end if;
 
           -- Load the instruction from the ROM